@@ -0,0 +1,345 @@
+"""
+Retroactive achievement backfill for Galactic Quest.
+
+Streams time_logs in (user_id, logged_at) order and groups them per user.
+Chunks of users are replayed through the achievement rules on a process
+pool while the next chunk is being read. The resulting aggregates, awards
+and XP are then written with bulk operations.
+
+Progress is checkpointed in job_checkpoints after every chunk, so an
+interrupted run resumes after the last completed user. Aggregates are
+written with the same version check as the live side effect jobs, so a user
+logging time during the backfill is replayed again instead of being
+overwritten. Time queued before the backfill saw a user's history is
+skipped by the live jobs, since it is already in the replay.
+
+Usage: python achievement_backfill.py [--workers 4] [--chunk-size 200] [--restart]
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from achievements import ACHIEVEMENT_RULES, ENTRY_SKILL_FIELDS, apply_event, evaluate, log_entry
+from ranks import get_rank_by_xp
+from init_data import DEFAULT_ACHIEVEMENTS
+from skill_leaderboards import predefined_categories_of
+
+CHECKPOINT_ID = "achievement-backfill"
+DEFAULT_CHUNK_SIZE = 200
+DEFAULT_WORKERS = os.cpu_count() or 4
+MAX_RETRIES = 3
+
+def rules_fingerprint() -> str:
+    """Identifies the achievement definitions a checkpoint was made against."""
+    compiled = {rule.achievement_id for rule in ACHIEVEMENT_RULES}
+    return hashlib.sha1(repr(sorted(
+        (a["_id"], repr(sorted(a["criteria"].items())), a["xp_reward"])
+        for a in DEFAULT_ACHIEVEMENTS if a["_id"] in compiled
+    )).encode()).hexdigest()
+
+def replay_users(batch: List[Tuple[str, List[Tuple[datetime, Dict]], Dict, List[str]]]) -> List[Tuple[str, Dict, List[Tuple[str, datetime]]]]:
+    """Replay users' histories through the rules; runs in a worker process.
+
+    Each item is (user_id, [(logged_at, entry)], user, earned). Returns the
+    rebuilt aggregates and the new awards with the time they were earned.
+    """
+    results = []
+    for user_id, events, user, earned in batch:
+        stats: Dict = {}
+        earned = set(earned)
+        awards = []
+        for logged_at, entry in events:
+            changed = apply_event(stats, logged_at, [entry])
+            for rule in evaluate(stats, user, changed, earned):
+                earned.add(rule.achievement_id)
+                awards.append((rule.achievement_id, logged_at))
+        stats["earned"] = sorted(earned)
+        results.append((user_id, stats, awards))
+    return results
+
+LOG_PROJECTION = {"user_id": 1, "skill_id": 1, "minutes": 1, "xp_earned": 1, "logged_at": 1}
+
+class AchievementBackfill:
+    def __init__(self, db: AsyncIOMotorDatabase, pool: ProcessPoolExecutor, workers: int):
+        self.db = db
+        self.pool = pool
+        self.workers = workers
+        self.awarded = 0
+
+    async def _load_chunk(self, users: Dict[str, List[Dict]]):
+        """Fetch skills, user totals and current aggregates for a chunk of users.
+
+        The aggregates are read first, then any logs added since the cursor passed
+        each user; whatever a live job folded in before that read is in the replay.
+        """
+        user_ids = list(users)
+        skills, user_docs, stats_docs = await asyncio.gather(
+            self.db.skills.find({"user_id": {"$in": user_ids}}, ENTRY_SKILL_FIELDS).to_list(None),
+            self.db.users.find({"_id": {"$in": user_ids}}, {"total_xp": 1, "longest_streak": 1}).to_list(None),
+            self.db.achievement_stats.find({"_id": {"$in": user_ids}}, {"earned": 1, "version": 1}).to_list(None)
+        )
+        recent = self.db.time_logs.find(
+            {"$or": [{"user_id": user_id, "logged_at": {"$gt": logs[-1]["logged_at"]}} for user_id, logs in users.items()]},
+            LOG_PROJECTION
+        ).sort("logged_at", 1)
+        async for log in recent:
+            users[log["user_id"]].append(log)
+        return (
+            {skill["_id"]: skill for skill in skills},
+            {user["_id"]: user for user in user_docs},
+            {stats["_id"]: stats for stats in stats_docs},
+            datetime.utcnow()
+        )
+
+    async def process(self, users: Dict[str, List[Dict]]) -> List[str]:
+        """Replay and write one chunk; returns the users whose aggregates a live job changed meanwhile."""
+        skills, user_docs, stats_docs, backfilled_at = await self._load_chunk(users)
+        seeds = await predefined_categories_of(self.db, [skill.get("category_id", "") for skill in skills.values()])
+
+        batch = []
+        for user_id, logs in users.items():
+            if user_id not in user_docs:
+                continue
+            events = [
+                (log["logged_at"], {
+                    **log_entry(skills[log["skill_id"]], log["minutes"], log["xp_earned"]),
+                    "category_seed": seeds.get(skills[log["skill_id"]].get("category_id", ""))
+                })
+                for log in logs if log["skill_id"] in skills
+            ]
+            earned = (stats_docs.get(user_id) or {}).get("earned", [])
+            batch.append((user_id, events, user_docs[user_id], earned))
+
+        slices = [batch[i::self.workers] for i in range(self.workers) if batch[i::self.workers]]
+        loop = asyncio.get_running_loop()
+        replayed = [
+            result
+            for results in await asyncio.gather(*(loop.run_in_executor(self.pool, replay_users, s) for s in slices))
+            for result in results
+        ]
+
+        lost = await self._write_stats(replayed, stats_docs, backfilled_at)
+        await self._write_awards([result for result in replayed if result[0] not in lost], user_docs)
+        return sorted(lost)
+
+    async def _write_stats(self, replayed, stats_docs: Dict[str, Dict], backfilled_at: datetime) -> set:
+        """Replace each user's aggregates unless a live job wrote them since they were read."""
+        token = str(uuid.uuid4())
+        operations = []
+        for user_id, stats, _ in replayed:
+            existing = stats_docs.get(user_id)
+            version = existing.get("version") if existing else None
+            doc = {
+                **stats,
+                "_id": user_id,
+                "version": (version or 0) + 1,
+                "backfilled_at": backfilled_at,
+                "backfill_token": token
+            }
+            if existing is None:
+                operations.append(InsertOne(doc))
+            else:
+                operations.append(ReplaceOne({"_id": user_id, "version": version}, doc))
+        if not operations:
+            return set()
+
+        try:
+            result = await self.db.achievement_stats.bulk_write(operations, ordered=False)
+            written = result.inserted_count + result.matched_count
+        except BulkWriteError as e:
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+            written = e.details["nInserted"] + e.details["nMatched"]
+        if written == len(operations):
+            return set()
+
+        # Live jobs keep the token when they write on top of ours, so a missing token means we lost
+        user_ids = [user_id for user_id, _, _ in replayed]
+        ours = {
+            doc["_id"]
+            async for doc in self.db.achievement_stats.find(
+                {"_id": {"$in": user_ids}, "backfill_token": token}, {"_id": 1}
+            )
+        }
+        return set(user_ids) - ours
+
+    async def _write_awards(self, replayed, user_docs: Dict[str, Dict]):
+        """Insert awards through the unique index and credit XP for the ones that were new."""
+        awards = [
+            {"_id": str(uuid.uuid4()), "user_id": user_id, "achievement_id": achievement_id, "earned_at": earned_at}
+            for user_id, _, user_awards in replayed
+            for achievement_id, earned_at in user_awards
+        ]
+        if not awards:
+            return
+
+        duplicates = set()
+        try:
+            await self.db.user_achievements.insert_many(awards, ordered=False)
+        except BulkWriteError as e:
+            duplicates = {error["index"] for error in e.details["writeErrors"] if error["code"] == 11000}
+            if len(duplicates) < len(e.details["writeErrors"]):
+                raise
+
+        rewards = {achievement["_id"]: achievement["xp_reward"] for achievement in DEFAULT_ACHIEVEMENTS}
+        xp_by_user: Dict[str, int] = {}
+        for index, award in enumerate(awards):
+            if index not in duplicates:
+                xp_by_user[award["user_id"]] = xp_by_user.get(award["user_id"], 0) + rewards[award["achievement_id"]]
+                self.awarded += 1
+
+        operations = []
+        for user_id, xp in xp_by_user.items():
+            operations.append(UpdateOne({"_id": user_id}, {"$inc": {"total_xp": xp}}))
+            # Only set the rank if nothing else moved the total in between
+            expected_xp = user_docs[user_id].get("total_xp", 0) + xp
+            operations.append(UpdateOne(
+                {"_id": user_id, "total_xp": expected_xp},
+                {"$set": {"current_rank": get_rank_by_xp(expected_xp), "updated_at": datetime.utcnow()}}
+            ))
+        if operations:
+            await self.db.users.bulk_write(operations, ordered=True)
+
+async def backfill_achievements(
+    db: AsyncIOMotorDatabase,
+    workers: int = DEFAULT_WORKERS,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    restart: bool = False
+) -> dict:
+    """Replay all users' time logs through the achievement rules, resuming from the last checkpoint."""
+    fingerprint = rules_fingerprint()
+    checkpoint = await db.job_checkpoints.find_one({"_id": CHECKPOINT_ID})
+
+    if restart or checkpoint is None or checkpoint.get("rules") != fingerprint:
+        checkpoint = {
+            "_id": CHECKPOINT_ID,
+            "rules": fingerprint,
+            "last_user_id": None,
+            "users": 0,
+            "logs": 0,
+            "completed": False,
+            "started_at": datetime.utcnow()
+        }
+        await db.job_checkpoints.replace_one({"_id": CHECKPOINT_ID}, checkpoint, upsert=True)
+    elif checkpoint.get("completed"):
+        logging.info("Achievement backfill already completed for the current rules")
+        return checkpoint
+
+    # Walks the (user_id, logged_at desc) index backwards: users descending, each user's logs ascending
+    query = {"user_id": {"$lt": checkpoint["last_user_id"]}} if checkpoint["last_user_id"] is not None else {}
+    cursor = db.time_logs.find(query, LOG_PROJECTION).sort([("user_id", -1), ("logged_at", 1)]).batch_size(10000)
+
+    started = time.perf_counter()
+    users_done = 0
+    logs_done = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        backfill = AchievementBackfill(db, pool, workers)
+
+        async def commit(chunk: Dict[str, List[Dict]]):
+            nonlocal users_done, logs_done
+            chunk_logs = sum(len(logs) for logs in chunk.values())
+            pending = chunk
+            for _ in range(MAX_RETRIES):
+                lost = await backfill.process(pending)
+                if not lost:
+                    break
+                logging.info(f"Replaying {len(lost)} users whose aggregates changed during the backfill")
+                pending = {user_id: chunk[user_id] for user_id in lost}
+            else:
+                logging.warning(f"Gave up on users {lost} after {MAX_RETRIES} attempts; rerun with --restart later")
+
+            users_done += len(chunk)
+            logs_done += chunk_logs
+            checkpoint["last_user_id"] = min(chunk)
+            checkpoint["users"] += len(chunk)
+            checkpoint["logs"] += chunk_logs
+            await db.job_checkpoints.update_one(
+                {"_id": CHECKPOINT_ID},
+                {"$set": {
+                    "last_user_id": checkpoint["last_user_id"],
+                    "users": checkpoint["users"],
+                    "logs": checkpoint["logs"],
+                    "checkpointed_at": datetime.utcnow()
+                }}
+            )
+            elapsed = time.perf_counter() - started
+            logging.info(
+                f"Backfilled {checkpoint['users']} users, {checkpoint['logs']} logs ({backfill.awarded} awards), "
+                f"{users_done / elapsed if elapsed else 0:.0f} users/sec, {logs_done / elapsed if elapsed else 0:.0f} logs/sec"
+            )
+
+        chunk: Dict[str, List[Dict]] = {}
+        current_user: Optional[str] = None
+        in_flight: Optional[asyncio.Task] = None
+
+        async def hand_off():
+            # Replay this chunk while the cursor reads the next one
+            nonlocal in_flight, chunk
+            if in_flight is not None:
+                await in_flight
+            in_flight = asyncio.create_task(commit(chunk))
+            chunk = {}
+
+        async for log in cursor:
+            if log["user_id"] != current_user:
+                # A user's logs are contiguous, so a chunk only ever holds complete users
+                if len(chunk) >= chunk_size:
+                    await hand_off()
+                current_user = log["user_id"]
+            chunk.setdefault(current_user, []).append(log)
+
+        if chunk:
+            await hand_off()
+        if in_flight is not None:
+            await in_flight
+
+    elapsed = time.perf_counter() - started
+    checkpoint["completed"] = True
+    checkpoint["users_per_second"] = users_done / elapsed if elapsed else 0.0
+    checkpoint["logs_per_second"] = logs_done / elapsed if elapsed else 0.0
+    await db.job_checkpoints.update_one(
+        {"_id": CHECKPOINT_ID},
+        {"$set": {
+            "completed": True,
+            "completed_at": datetime.utcnow(),
+            "users_per_second": checkpoint["users_per_second"],
+            "logs_per_second": checkpoint["logs_per_second"]
+        }}
+    )
+    logging.info(
+        f"Achievement backfill finished: {users_done} users, {logs_done} logs in {elapsed:.1f}s "
+        f"({checkpoint['users_per_second']:.0f} users/sec, {checkpoint['logs_per_second']:.0f} logs/sec)"
+    )
+    return checkpoint
+
+async def main(workers: int, chunk_size: int, restart: bool):
+    from database import connect_to_mongo, close_mongo_connection, get_database
+    await connect_to_mongo()
+    try:
+        await backfill_achievements(await get_database(), workers=workers, chunk_size=chunk_size, restart=restart)
+    finally:
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Award achievements retroactively from users' time logs")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="users per chunk")
+    parser.add_argument("--restart", action="store_true", help="ignore any existing checkpoint")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.workers, args.chunk_size, args.restart))
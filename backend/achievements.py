@@ -0,0 +1,220 @@
+"""
+Achievement rule engine.
+
+Each achievement's criteria are compiled once into a Rule: the aggregate
+inputs it reads and a predicate over them. Per-user aggregates live in one
+achievement_stats document and are advanced in place by apply_event for
+every logged batch of time, so evaluating a rule never needs the time log
+history. After an event only rules whose inputs changed are evaluated.
+
+Aggregates kept per user:
+    hours               hours of the day (UTC) with any activity
+    categories          minutes, XP and day streak per category
+    difficulty_minutes  minutes per difficulty level
+    skill_type_minutes  minutes on skills whose name names a tracked type
+    day                 minutes per skill on the latest active day
+    week                difficulties, minutes per category and weekend days
+                        in the latest active ISO week
+    last_active_day     with longest_break, the longest gap between active days
+
+Rank and the overall day streak come from the user document.
+"""
+from datetime import datetime
+from typing import Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set
+import logging
+from init_data import DEFAULT_ACHIEVEMENTS
+from ranks import RANK_LADDER, rank_index
+from streaks import StreakState, advance, day_number
+
+PREDEFINED_CATEGORY_PREFIX = "predefined-"
+
+class Rule(NamedTuple):
+    achievement_id: str
+    xp_reward: int
+    inputs: FrozenSet[str]
+    check: Callable[[Dict, Dict], bool]
+
+def category_key(category_id: str, seed: Optional[str] = None) -> str:
+    """Predefined categories are matched by name in criteria, e.g. "predefined-social" -> "social".
+
+    seed is the predefined category a user's copy was seeded from, if any.
+    """
+    category_id = seed or category_id
+    if category_id.startswith(PREDEFINED_CATEGORY_PREFIX):
+        return category_id[len(PREDEFINED_CATEGORY_PREFIX):]
+    return category_id
+
+def week_key(when: datetime) -> str:
+    iso_year, iso_week, _ = when.isocalendar()
+    return f"{iso_year}-W{iso_week:02d}"
+
+def _category(stats: Dict, key: str) -> Dict:
+    return stats.get("categories", {}).get(key, {})
+
+def _rank_index_of(tier: str) -> int:
+    for index, rank in enumerate(RANK_LADDER):
+        if rank["tier"].lower() == tier.lower():
+            return index
+    raise ValueError(f"unknown rank {tier!r}")
+
+def compile_rule(achievement: Dict) -> Optional[Rule]:
+    """Build the evaluator for an achievement, or None if its criteria cannot be tracked."""
+    c = achievement["criteria"]
+
+    def rule(inputs: Iterable[str], check: Callable[[Dict, Dict], bool]) -> Rule:
+        return Rule(achievement["_id"], achievement["xp_reward"], frozenset(inputs), check)
+
+    if "start_hour" in c:
+        return rule({"hours"}, lambda s, u: any(c["start_hour"] <= h < c["end_hour"] for h in s.get("hours", [])))
+    if "before_hour" in c:
+        return rule({"hours"}, lambda s, u: any(h < c["before_hour"] for h in s.get("hours", [])))
+    if "exact_hour" in c:
+        return rule({"hours"}, lambda s, u: c["exact_hour"] in s.get("hours", []))
+    if c.get("same_day") and "min_minutes" in c:
+        return rule({"day"}, lambda s, u: max(s.get("day", {}).get("skill_minutes", {}).values(), default=0) >= c["min_minutes"])
+    if "activities_per_day" in c:
+        return rule({"day"}, lambda s, u: len(s.get("day", {}).get("skill_minutes", {})) >= c["activities_per_day"])
+    if c.get("new_category"):
+        # The first category is where the user started; trying another one is the achievement
+        return rule({"categories"}, lambda s, u: len(s.get("categories", {})) >= 2)
+    if "weekend_days" in c:
+        return rule({"week"}, lambda s, u: len(s.get("week", {}).get("weekend_days", [])) >= c["weekend_days"])
+    if "difficulty_levels" in c:
+        return rule({"week"}, lambda s, u: len(s.get("week", {}).get("difficulties", [])) >= c["difficulty_levels"])
+    if "consecutive_days" in c:
+        return rule({"streak"}, lambda s, u: u.get("longest_streak", 0) >= c["consecutive_days"])
+    if "difficulty" in c and "min_hours" in c:
+        return rule({"difficulty"}, lambda s, u: s.get("difficulty_minutes", {}).get(c["difficulty"], 0) >= c["min_hours"] * 60)
+    if "category" in c and c.get("period") == "week":
+        return rule({"week"}, lambda s, u: s.get("week", {}).get("category_minutes", {}).get(c["category"], 0) >= c["min_hours"] * 60)
+    if isinstance(c.get("categories"), list) and "min_hours" in c:
+        return rule({"categories"}, lambda s, u: all(_category(s, key).get("minutes", 0) >= c["min_hours"] * 60 for key in c["categories"]))
+    if "category" in c and "min_xp" in c:
+        return rule({"categories"}, lambda s, u: _category(s, c["category"]).get("xp", 0) >= c["min_xp"])
+    if "category" in c and "streak_days" in c:
+        return rule({"categories"}, lambda s, u: _category(s, c["category"]).get("longest_streak", 0) >= c["streak_days"])
+    if "break_days" in c:
+        return rule({"break"}, lambda s, u: s.get("longest_break", 0) >= c["break_days"])
+    if "skill_type" in c and "min_hours" in c:
+        return rule({"skill_types"}, lambda s, u: s.get("skill_type_minutes", {}).get(c["skill_type"], 0) >= c["min_hours"] * 60)
+    if "min_rank" in c:
+        min_index = _rank_index_of(c["min_rank"])
+        return rule({"rank"}, lambda s, u: rank_index(u.get("total_xp", 0)) >= min_index)
+    return None
+
+def compile_rules(achievements: Iterable[Dict]) -> List[Rule]:
+    rules = []
+    for achievement in achievements:
+        rule = compile_rule(achievement)
+        if rule is None:
+            # e.g. holidays or per-category levels, which the app has no data for
+            logging.info(f"Achievement {achievement['_id']} has no trackable criteria and cannot be earned yet")
+        else:
+            rules.append(rule)
+    return rules
+
+ACHIEVEMENT_RULES = compile_rules(DEFAULT_ACHIEVEMENTS)
+ALL_INPUTS = frozenset().union(*(rule.inputs for rule in ACHIEVEMENT_RULES))
+RULES_BY_INPUT: Dict[str, List[Rule]] = {}
+for _rule in ACHIEVEMENT_RULES:
+    for _input in _rule.inputs:
+        RULES_BY_INPUT.setdefault(_input, []).append(_rule)
+SKILL_TYPES = tuple(sorted({
+    achievement["criteria"]["skill_type"] for achievement in DEFAULT_ACHIEVEMENTS
+    if "skill_type" in achievement["criteria"]
+}))
+
+# Skill fields an entry needs; callers include them in their skill projections
+ENTRY_SKILL_FIELDS = {"name": 1, "category_id": 1, "difficulty": 1}
+
+def log_entry(skill: Dict, minutes: int, xp_earned: int) -> Dict:
+    """The part of a logged batch the aggregates need for one skill."""
+    return {
+        "skill_id": skill["_id"],
+        "name": skill.get("name", ""),
+        "category_id": skill.get("category_id", ""),
+        "difficulty": skill["difficulty"],
+        "minutes": minutes,
+        "xp_earned": xp_earned
+    }
+
+def apply_event(stats: Dict, logged_at: datetime, entries: List[Dict]) -> Set[str]:
+    """Fold one batch of logged time into the aggregates and return the inputs that changed.
+
+    Entries carry skill_id, name, category_id, difficulty, minutes and xp_earned,
+    and category_seed when the category is a copy of a predefined one.
+    Backdated activity counts towards totals; day, week and break aggregates
+    only move forward.
+    """
+    changed = {"rank", "streak"}
+    day = day_number(logged_at)
+
+    hours = stats.setdefault("hours", [])
+    if logged_at.hour not in hours:
+        hours.append(logged_at.hour)
+        hours.sort()
+        changed.add("hours")
+
+    last_day = stats.get("last_active_day")
+    if last_day is None or day > last_day:
+        if last_day is not None and day - last_day - 1 > stats.get("longest_break", 0):
+            stats["longest_break"] = day - last_day - 1
+            changed.add("break")
+        stats["last_active_day"] = day
+
+    current_day = stats.get("day")
+    if current_day is None or day > current_day["key"]:
+        current_day = stats["day"] = {"key": day, "skill_minutes": {}}
+    track_day = day == current_day["key"]
+
+    key = week_key(logged_at)
+    current_week = stats.get("week")
+    if current_week is None or key > current_week["key"]:
+        current_week = stats["week"] = {"key": key, "difficulties": [], "category_minutes": {}, "weekend_days": []}
+    track_week = key == current_week["key"]
+    if track_week and logged_at.weekday() >= 5 and logged_at.weekday() not in current_week["weekend_days"]:
+        current_week["weekend_days"].append(logged_at.weekday())
+
+    categories = stats.setdefault("categories", {})
+    difficulty_minutes = stats.setdefault("difficulty_minutes", {})
+    skill_type_minutes = stats.setdefault("skill_type_minutes", {})
+    for entry in entries:
+        minutes = entry["minutes"]
+        cat_key = category_key(entry["category_id"], entry.get("category_seed"))
+        category = categories.setdefault(cat_key, {"minutes": 0, "xp": 0, "last_day": None, "streak": 0, "longest_streak": 0})
+        category["minutes"] += minutes
+        category["xp"] += entry["xp_earned"]
+        streak = advance(StreakState(category["last_day"], category["streak"], category["longest_streak"]), day)
+        if streak:
+            category["last_day"], category["streak"], category["longest_streak"] = streak
+        changed.add("categories")
+
+        difficulty_minutes[entry["difficulty"]] = difficulty_minutes.get(entry["difficulty"], 0) + minutes
+        changed.add("difficulty")
+
+        name = entry.get("name", "").lower()
+        for skill_type in SKILL_TYPES:
+            if skill_type in name:
+                skill_type_minutes[skill_type] = skill_type_minutes.get(skill_type, 0) + minutes
+                changed.add("skill_types")
+
+        if track_day:
+            skill_minutes = current_day["skill_minutes"]
+            skill_minutes[entry["skill_id"]] = skill_minutes.get(entry["skill_id"], 0) + minutes
+            changed.add("day")
+        if track_week:
+            if entry["difficulty"] not in current_week["difficulties"]:
+                current_week["difficulties"].append(entry["difficulty"])
+            current_week["category_minutes"][cat_key] = current_week["category_minutes"].get(cat_key, 0) + minutes
+            changed.add("week")
+
+    return changed
+
+def evaluate(stats: Dict, user: Dict, changed: Iterable[str], earned: Set[str]) -> List[Rule]:
+    """Rules reading any of the changed inputs that are not yet earned and now hold."""
+    candidates = {}
+    for input_name in changed:
+        for rule in RULES_BY_INPUT.get(input_name, ()):
+            if rule.achievement_id not in earned:
+                candidates[rule.achievement_id] = rule
+    return [rule for rule in candidates.values() if rule.check(stats, user)]
@@ -0,0 +1,88 @@
+"""
+Write-behind tracking of users' last_active timestamps.
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import asyncio
+import logging
+import os
+
+ACTIVITY_GRANULARITY_SECONDS = int(os.getenv("ACTIVITY_GRANULARITY_SECONDS", "60"))
+ACTIVITY_FLUSH_INTERVAL_SECONDS = int(os.getenv("ACTIVITY_FLUSH_INTERVAL_SECONDS", "30"))
+
+class ActivityTracker:
+    """Records last-seen timestamps in memory and flushes them in batches."""
+
+    def __init__(self, granularity_seconds: int = ACTIVITY_GRANULARITY_SECONDS,
+                 flush_interval_seconds: int = ACTIVITY_FLUSH_INTERVAL_SECONDS):
+        self.granularity = timedelta(seconds=granularity_seconds)
+        self.flush_interval = flush_interval_seconds
+        self._pending: Dict[str, datetime] = {}
+        self._last_recorded: Dict[str, datetime] = {}
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, user_id: str, when: Optional[datetime] = None) -> datetime:
+        """Record activity for a user, at most once per granularity window."""
+        now = when or datetime.utcnow()
+        last = self._last_recorded.get(user_id)
+        if last is None or now - last >= self.granularity:
+            self._last_recorded[user_id] = now
+            self._pending[user_id] = now
+        return now
+
+    async def flush(self) -> int:
+        """Write all pending timestamps with a single unordered bulk_write."""
+        if not self._pending or self._db is None:
+            return 0
+
+        pending, self._pending = self._pending, {}
+        operations = [
+            UpdateOne({"_id": user_id}, {"$max": {"last_active": last_active}})
+            for user_id, last_active in pending.items()
+        ]
+
+        try:
+            await self._db.users.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logging.warning(f"Failed to flush activity for {len(operations)} users: {e}")
+            # Keep the newest timestamp per user for the next attempt
+            for user_id, last_active in pending.items():
+                if self._pending.get(user_id, last_active) <= last_active:
+                    self._pending[user_id] = last_active
+            return 0
+
+        # Forget users whose window has passed so the map stays bounded
+        cutoff = datetime.utcnow() - self.granularity
+        self._last_recorded = {
+            user_id: seen for user_id, seen in self._last_recorded.items() if seen > cutoff
+        }
+        return len(operations)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self, db: AsyncIOMotorDatabase):
+        """Start the periodic flush loop."""
+        self._db = db
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write whatever is still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        flushed = await self.flush()
+        if flushed:
+            logging.info(f"Flushed activity for {flushed} users on shutdown")
+
+activity_tracker = ActivityTracker()
@@ -3,16 +3,39 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import asyncio
+import hashlib
 import os
+import time
 import uuid
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
 from database import get_database
+from init_data import insert_user_default_data
+from activity import activity_tracker
+from user_cache import user_cache
+from leaderboard_index import leaderboard_index
+from ranks import get_rank_by_xp
 
 # Security configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 30
 
+# Password hashing pool configuration
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")  # "thread" or "process"
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+# Verified token cache configuration
+TOKEN_CACHE_MAX_SIZE = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000"))
+
+# How often claims-only routes re-check a user's token version for revocation
+TOKEN_VERSION_CHECK_SECONDS = float(os.getenv("TOKEN_VERSION_CHECK_SECONDS", "60"))
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
@@ -24,6 +47,59 @@ def get_password_hash(password: str) -> str:
     """Hash a password."""
     return pwd_context.hash(password)
 
+class PasswordHasher:
+    """Runs bcrypt off the event loop on a bounded worker pool."""
+
+    def __init__(self, executor_kind: str = PASSWORD_HASH_EXECUTOR,
+                 workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.executor_kind = executor_kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def ensure_capacity(self):
+        """Raise a 503 if the pool is saturated, so callers can shed load before any DB work."""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please try again",
+                headers={"Retry-After": "1"},
+            )
+
+    async def _run(self, func, *args):
+        # Queued plus running jobs are capped; shed load instead of queueing forever
+        self.ensure_capacity()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+password_hasher = PasswordHasher()
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """Create a JWT access token."""
     to_encode = data.copy()
@@ -36,42 +112,162 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Verify and decode JWT token."""
-    token = credentials.credentials
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+class TokenCache:
+    """LRU cache of verified token digests, each entry valid until the token's exp."""
+
+    def __init__(self, max_size: int = TOKEN_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[bytes, Tuple[str, int, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[Tuple[str, int]]:
+        """Return the (user_id, token_version) claims of a previously verified, unexpired token."""
+        key = self.digest(token)
+        entry = self._entries.get(key)
+        if entry is None or entry[2] <= time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0], entry[1]
+
+    def put(self, token: str, user_id: str, version: int, exp: float):
+        key = self.digest(token)
+        self._entries[key] = (user_id, version, exp)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+token_cache = TokenCache()
+
+def decode_token(token: str, use_cache: bool = True) -> Optional[Tuple[str, int]]:
+    """Return the (user_id, token_version) claims of a valid token, or None if it does not verify."""
+    if use_cache:
+        claims = token_cache.get(token)
+        if claims is not None:
+            return claims
     
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
+        return None
+    
+    user_id = payload.get("sub")
+    if user_id is None:
+        return None
     
-    return user_id
+    version = payload.get("ver", 0)
+    if use_cache and "exp" in payload:
+        token_cache.put(token, user_id, version, float(payload["exp"]))
+    return user_id, version
+
+def credentials_exception(detail: str = "Could not validate credentials") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+async def verify_token_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Tuple[str, int]:
+    """Verify a JWT token and return its (user_id, token_version) claims."""
+    claims = decode_token(credentials.credentials)
+    if claims is None:
+        raise credentials_exception()
+    
+    return claims
+
+async def verify_token(claims: Tuple[str, int] = Depends(verify_token_claims)):
+    """Verify and decode JWT token."""
+    return claims[0]
+
+class TokenVersionCache:
+    """Per-user token versions, re-read from Mongo at most every TOKEN_VERSION_CHECK_SECONDS."""
+
+    def __init__(self, check_seconds: float = TOKEN_VERSION_CHECK_SECONDS, max_size: int = TOKEN_CACHE_MAX_SIZE):
+        self.check_seconds = check_seconds
+        self.max_size = max_size
+        self._versions: Dict[str, Tuple[float, int]] = {}
+
+    def set(self, user_id: str, version: int):
+        now = time.monotonic()
+        if len(self._versions) >= self.max_size:
+            self._versions = {uid: entry for uid, entry in self._versions.items() if entry[0] > now}
+        self._versions[user_id] = (now + self.check_seconds, version)
+
+    def invalidate(self, user_id: str):
+        self._versions.pop(user_id, None)
+
+    async def get(self, db: AsyncIOMotorDatabase, user_id: str) -> Optional[int]:
+        """Return the user's current token version, or None if the user no longer exists."""
+        entry = self._versions.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        
+        user = await db.users.find_one({"_id": user_id}, {"token_version": 1})
+        if user is None:
+            self.invalidate(user_id)
+            return None
+        
+        version = user.get("token_version", 0)
+        self.set(user_id, version)
+        return version
+
+token_versions = TokenVersionCache()
+
+async def get_current_user_claims(
+    claims: Tuple[str, int] = Depends(verify_token_claims),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Lightweight auth for routes that only need the user id.
+    
+    Trusts the signed claims and only checks the token version for revocation,
+    so most requests never touch the users collection.
+    """
+    user_id, version = claims
+    current_version = await token_versions.get(db, user_id)
+    if current_version is None or version < current_version:
+        raise credentials_exception()
+    
+    activity_tracker.touch(user_id)
+    
+    return {"_id": user_id, "token_version": version}
 
 async def get_current_user(
-    user_id: str = Depends(verify_token),
+    claims: Tuple[str, int] = Depends(verify_token_claims),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get current authenticated user."""
-    user = await db.users.find_one({"_id": user_id})
+    user_id, version = claims
+    user = user_cache.get(user_id)
     if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found"
-        )
+        user = await db.users.find_one({"_id": user_id})
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found"
+            )
+        user_cache.set(user_id, user)
+        token_versions.set(user_id, user.get("token_version", 0))
     
-    # Update last_active timestamp
-    await db.users.update_one(
-        {"_id": user_id},
-        {"$set": {"last_active": datetime.utcnow()}}
-    )
+    if version < user.get("token_version", 0):
+        raise credentials_exception()
+    
+    # Record activity; the tracker writes last_active back in batches
+    user["last_active"] = activity_tracker.touch(user_id)
     
     return user
 
@@ -81,30 +277,13 @@ class AuthService:
     
     async def register_user(self, username: str, email: str, password: str, avatar: str = "🌟"):
         """Register a new user."""
-        # Check if user already exists
-        existing_user = await self.db.users.find_one({
-            "$or": [{"email": email}, {"username": username}]
-        })
-        
-        if existing_user:
-            if existing_user["email"] == email:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Email already registered"
-                )
-            else:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Username already taken"
-                )
-        
-        # Create new user
+        # Create new user; uniqueness of email and username comes from the unique indexes
         user_id = str(uuid.uuid4())
-        hashed_password = get_password_hash(password)
+        hashed_password = await password_hasher.hash(password)
         now = datetime.utcnow()
         
         # Calculate initial rank (Iron IV)
-        initial_rank = self.get_rank_by_xp(0)
+        initial_rank = get_rank_by_xp(0)
         
         user_doc = {
             "_id": user_id,
@@ -122,20 +301,33 @@ class AuthService:
             "sound_effects": True,
             "daily_goal": 120,
             "streak_reminders": True,
+            "token_version": 0,
             "joined_at": now,
             "last_active": now,
             "created_at": now,
             "updated_at": now
         }
         
-        await self.db.users.insert_one(user_doc)
+        try:
+            await self.db.users.insert_one(user_doc)
+        except DuplicateKeyError as e:
+            key_pattern = (e.details or {}).get("keyPattern") or {}
+            if "email" in key_pattern or ("username" not in key_pattern and "email" in str(e)):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Email already registered"
+                )
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Username already taken"
+            )
+        leaderboard_index.set(user_id, 0)
         
         # Initialize user's default data (predefined categories and initial quests)
-        from init_data import initialize_user_default_data
-        await initialize_user_default_data(self.db, user_id)
+        await insert_user_default_data(self.db, user_id, now)
         
         # Create access token
-        access_token = create_access_token(data={"sub": user_id})
+        access_token = create_access_token(data={"sub": user_id, "ver": 0})
         
         return {
             "id": user_id,
@@ -155,20 +347,17 @@ class AuthService:
         """Authenticate user login."""
         user = await self.db.users.find_one({"email": email})
         
-        if not user or not verify_password(password, user["password_hash"]):
+        if not user or not await password_hasher.verify(password, user["password_hash"]):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect email or password"
             )
         
         # Update last_active
-        await self.db.users.update_one(
-            {"_id": user["_id"]},
-            {"$set": {"last_active": datetime.utcnow()}}
-        )
+        activity_tracker.touch(user["_id"])
         
         # Create access token
-        access_token = create_access_token(data={"sub": user["_id"]})
+        access_token = create_access_token(data={"sub": user["_id"], "ver": user.get("token_version", 0)})
         
         return {
             "id": user["_id"],
@@ -184,57 +373,12 @@ class AuthService:
             "token_type": "bearer"
         }
     
+    async def revoke_tokens(self, user_id: str):
+        """Invalidate every token issued to the user so far."""
+        await self.db.users.update_one({"_id": user_id}, {"$inc": {"token_version": 1}})
+        user_cache.invalidate(user_id)
+        token_versions.invalidate(user_id)
+    
     def get_rank_by_xp(self, total_xp: int) -> dict:
         """Calculate rank based on total XP."""
-        rank_system = [
-            # Iron
-            {"tier": "Iron", "division": "IV", "total_rank": 1, "min_xp": 0, "max_xp": 999, "color": "#8B4513", "bg_color": "#2D1810"},
-            {"tier": "Iron", "division": "III", "total_rank": 2, "min_xp": 1000, "max_xp": 1999, "color": "#8B4513", "bg_color": "#2D1810"},
-            {"tier": "Iron", "division": "II", "total_rank": 3, "min_xp": 2000, "max_xp": 2999, "color": "#8B4513", "bg_color": "#2D1810"},
-            {"tier": "Iron", "division": "I", "total_rank": 4, "min_xp": 3000, "max_xp": 3999, "color": "#8B4513", "bg_color": "#2D1810"},
-            
-            # Bronze
-            {"tier": "Bronze", "division": "IV", "total_rank": 5, "min_xp": 4000, "max_xp": 5999, "color": "#CD7F32", "bg_color": "#3D2F1A"},
-            {"tier": "Bronze", "division": "III", "total_rank": 6, "min_xp": 6000, "max_xp": 7999, "color": "#CD7F32", "bg_color": "#3D2F1A"},
-            {"tier": "Bronze", "division": "II", "total_rank": 7, "min_xp": 8000, "max_xp": 9999, "color": "#CD7F32", "bg_color": "#3D2F1A"},
-            {"tier": "Bronze", "division": "I", "total_rank": 8, "min_xp": 10000, "max_xp": 11999, "color": "#CD7F32", "bg_color": "#3D2F1A"},
-            
-            # Silver
-            {"tier": "Silver", "division": "IV", "total_rank": 9, "min_xp": 12000, "max_xp": 14999, "color": "#C0C0C0", "bg_color": "#2A2A2A"},
-            {"tier": "Silver", "division": "III", "total_rank": 10, "min_xp": 15000, "max_xp": 17999, "color": "#C0C0C0", "bg_color": "#2A2A2A"},
-            {"tier": "Silver", "division": "II", "total_rank": 11, "min_xp": 18000, "max_xp": 20999, "color": "#C0C0C0", "bg_color": "#2A2A2A"},
-            {"tier": "Silver", "division": "I", "total_rank": 12, "min_xp": 21000, "max_xp": 23999, "color": "#C0C0C0", "bg_color": "#2A2A2A"},
-            
-            # Gold
-            {"tier": "Gold", "division": "IV", "total_rank": 13, "min_xp": 24000, "max_xp": 27999, "color": "#FFD700", "bg_color": "#3D3D1A"},
-            {"tier": "Gold", "division": "III", "total_rank": 14, "min_xp": 28000, "max_xp": 31999, "color": "#FFD700", "bg_color": "#3D3D1A"},
-            {"tier": "Gold", "division": "II", "total_rank": 15, "min_xp": 32000, "max_xp": 35999, "color": "#FFD700", "bg_color": "#3D3D1A"},
-            {"tier": "Gold", "division": "I", "total_rank": 16, "min_xp": 36000, "max_xp": 39999, "color": "#FFD700", "bg_color": "#3D3D1A"},
-            
-            # Platinum
-            {"tier": "Platinum", "division": "IV", "total_rank": 17, "min_xp": 40000, "max_xp": 44999, "color": "#00CED1", "bg_color": "#1A3D3D"},
-            {"tier": "Platinum", "division": "III", "total_rank": 18, "min_xp": 45000, "max_xp": 49999, "color": "#00CED1", "bg_color": "#1A3D3D"},
-            {"tier": "Platinum", "division": "II", "total_rank": 19, "min_xp": 50000, "max_xp": 54999, "color": "#00CED1", "bg_color": "#1A3D3D"},
-            {"tier": "Platinum", "division": "I", "total_rank": 20, "min_xp": 55000, "max_xp": 59999, "color": "#00CED1", "bg_color": "#1A3D3D"},
-            
-            # Diamond
-            {"tier": "Diamond", "division": "IV", "total_rank": 21, "min_xp": 60000, "max_xp": 69999, "color": "#1E90FF", "bg_color": "#1A1A3D"},
-            {"tier": "Diamond", "division": "III", "total_rank": 22, "min_xp": 70000, "max_xp": 79999, "color": "#1E90FF", "bg_color": "#1A1A3D"},
-            {"tier": "Diamond", "division": "II", "total_rank": 23, "min_xp": 80000, "max_xp": 89999, "color": "#1E90FF", "bg_color": "#1A1A3D"},
-            {"tier": "Diamond", "division": "I", "total_rank": 24, "min_xp": 90000, "max_xp": 99999, "color": "#1E90FF", "bg_color": "#1A1A3D"},
-            
-            # Master
-            {"tier": "Master", "division": "", "total_rank": 25, "min_xp": 100000, "max_xp": 149999, "color": "#9370DB", "bg_color": "#3D1A3D"},
-            
-            # Grandmaster
-            {"tier": "Grandmaster", "division": "", "total_rank": 26, "min_xp": 150000, "max_xp": 199999, "color": "#FF1493", "bg_color": "#3D1A2A"},
-            
-            # Challenger
-            {"tier": "Challenger", "division": "", "total_rank": 27, "min_xp": 200000, "max_xp": 999999999, "color": "#FF6347", "bg_color": "#3D2A1A"}
-        ]
-        
-        for rank in reversed(rank_system):
-            if total_xp >= rank["min_xp"]:
-                return rank
-        
-        return rank_system[0]  # Default to Iron IV
\ No newline at end of file
+        return get_rank_by_xp(total_xp)
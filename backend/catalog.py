@@ -0,0 +1,168 @@
+"""
+In-process cache of the shared catalogs: achievements, predefined categories
+and quest templates.
+
+Catalogs are loaded at startup (or on first use) together with their public
+JSON body, prebuilt as bytes with a strong ETag. Writers bump a version in
+the catalog_versions collection; a background loop polls the versions and
+reloads only the catalogs that changed.
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from pymongo import ReturnDocument
+from typing import Dict, List, NamedTuple, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+CATALOG_REFRESH_SECONDS = int(os.getenv("CATALOG_REFRESH_SECONDS", "30"))
+CATALOG_MAX_AGE_SECONDS = int(os.getenv("CATALOG_MAX_AGE_SECONDS", "300"))
+
+def _achievement(doc: Dict) -> Dict:
+    return {
+        "id": doc["_id"],
+        "name": doc["name"],
+        "description": doc["description"],
+        "icon": doc["icon"],
+        "xp_reward": doc["xp_reward"],
+        "type": doc["achievement_type"]
+    }
+
+def _predefined_category(doc: Dict) -> Dict:
+    return {
+        "id": doc["_id"],
+        "name": doc["name"],
+        "icon": doc["icon"],
+        "color": doc["color"],
+        "description": doc["description"],
+        "is_predefined": doc.get("is_predefined", True),
+        "created_at": doc["created_at"]
+    }
+
+def _quest_template(doc: Dict) -> Dict:
+    return {
+        "id": doc["_id"],
+        "name": doc["name"],
+        "description": doc["description"],
+        "quest_type": doc["quest_type"],
+        "target_value": doc["target_value"],
+        "xp_reward": doc["xp_reward"]
+    }
+
+# Catalog name -> (sort order, public representation of a document)
+CATALOGS: Dict[str, tuple] = {
+    "achievements": ([("_id", 1)], _achievement),
+    "predefined_categories": ([("created_at", 1)], _predefined_category),
+    "quest_templates": ([("_id", 1)], _quest_template)
+}
+
+class CatalogEntry(NamedTuple):
+    version: int
+    docs: List[Dict]
+    by_id: Dict[str, Dict]
+    body: bytes
+    etag: str
+
+async def bump_catalog_version(db: AsyncIOMotorDatabase, name: str) -> int:
+    """Record a change to a catalog so every process reloads it."""
+    doc = await db.catalog_versions.find_one_and_update(
+        {"_id": name}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return doc["version"]
+
+class CatalogCache:
+    """Catalog documents and their serialized responses, reloaded when their version changes."""
+
+    def __init__(self, refresh_seconds: int = CATALOG_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._entries: Dict[str, CatalogEntry] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.reloads = 0
+
+    async def _versions(self, db: AsyncIOMotorDatabase) -> Dict[str, int]:
+        return {doc["_id"]: doc.get("version", 0) async for doc in db.catalog_versions.find({})}
+
+    async def _load(self, db: AsyncIOMotorDatabase, name: str, version: int) -> CatalogEntry:
+        sort, public = CATALOGS[name]
+        docs = await db[name].find({}).sort(sort).to_list(None)
+        body = json.dumps(jsonable_encoder([public(doc) for doc in docs]), separators=(",", ":")).encode()
+        entry = CatalogEntry(
+            version=version,
+            docs=docs,
+            by_id={doc["_id"]: doc for doc in docs},
+            body=body,
+            etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        )
+        self._entries[name] = entry
+        self.reloads += 1
+        return entry
+
+    async def refresh(self, db: AsyncIOMotorDatabase) -> List[str]:
+        """Reload catalogs whose version changed; returns their names."""
+        versions = await self._versions(db)
+        changed = []
+        for name in CATALOGS:
+            version = versions.get(name, 0)
+            entry = self._entries.get(name)
+            if entry is None or entry.version != version:
+                await self._load(db, name, version)
+                changed.append(name)
+        if changed:
+            logging.info(f"Loaded catalogs {changed}")
+        return changed
+
+    async def get(self, db: AsyncIOMotorDatabase, name: str) -> CatalogEntry:
+        """The cached catalog, loaded on first use in processes that did not start the refresh loop."""
+        entry = self._entries.get(name)
+        if entry is None:
+            versions = await self._versions(db)
+            entry = await self._load(db, name, versions.get(name, 0))
+        return entry
+
+    async def _run(self, db: AsyncIOMotorDatabase):
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.refresh(db)
+            except Exception as e:
+                logging.warning(f"Failed to refresh catalogs: {e}")
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        """Load every catalog and start polling for version changes."""
+        await self.refresh(db)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "versions": {name: entry.version for name, entry in self._entries.items()},
+            "reloads": self.reloads
+        }
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+async def catalog_response(request: Request, db: AsyncIOMotorDatabase, name: str) -> Response:
+    """Serve a catalog's prebuilt body, or 304 if the client already has this version."""
+    entry = await catalog_cache.get(db, name)
+    headers = {"ETag": entry.etag, "Cache-Control": f"public, max-age={CATALOG_MAX_AGE_SECONDS}"}
+    if etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+catalog_cache = CatalogCache()
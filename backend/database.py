@@ -54,7 +54,8 @@ async def create_indexes_safe():
         # Users collection indexes
         await db.database.users.create_index("email", unique=True)
         await db.database.users.create_index("username", unique=True)
-        await db.database.users.create_index("total_xp", background=True)
+        # Leaderboard order; keyset pages seek on (total_xp, _id)
+        await db.database.users.create_index([("total_xp", -1), ("_id", 1)], background=True)
         
         # Skills collection indexes
         await db.database.skills.create_index([("user_id", 1), ("category_id", 1)])
@@ -73,6 +74,30 @@ async def create_indexes_safe():
         await db.database.user_achievements.create_index([("user_id", 1), ("achievement_id", 1)], unique=True)
         await db.database.user_achievements.create_index("user_id")
         
+        # User activity counters expire once their day or week is no longer needed
+        await db.database.user_activity.create_index("expires_at", expireAfterSeconds=0)
+        await db.database.user_activity.create_index("user_id")
+        
+        # Side effect jobs are drained per user, oldest first
+        await db.database.side_effect_jobs.create_index([("status", 1), ("available_at", 1), ("created_at", 1)])
+        await db.database.side_effect_jobs.create_index([("user_id", 1), ("status", 1), ("created_at", 1)])
+        
+        # Windowed XP buckets, ranked within a period and expired after it
+        await db.database.xp_buckets.create_index([("period", 1), ("key", 1), ("xp", -1), ("user_id", 1)])
+        await db.database.xp_buckets.create_index("user_id")
+        await db.database.xp_buckets.create_index("expires_at", expireAfterSeconds=0)
+        
+        # Category and difficulty XP totals, ranked within each board
+        await db.database.xp_totals.create_index([("dimension", 1), ("key", 1), ("xp", -1), ("user_id", 1)])
+        await db.database.xp_totals.create_index("user_id")
+        
+        # Hourly activity of running imports, read back in hour order
+        await db.database.import_activity.create_index([("import_id", 1), ("hour", 1)])
+        await db.database.import_activity.create_index("expires_at", expireAfterSeconds=0)
+        
+        # Stored responses for Idempotency-Key retries
+        await db.database.idempotency_keys.create_index("expires_at", expireAfterSeconds=0)
+        
         # User quests collection indexes
         await db.database.user_quests.create_index([("user_id", 1), ("quest_id", 1)])
         await db.database.user_quests.create_index([("user_id", 1), ("end_date", 1)])
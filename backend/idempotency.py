@@ -0,0 +1,214 @@
+"""
+Idempotency-Key support for mutating routes.
+
+The first successful response for a key is stored in the idempotency_keys
+collection, which expires records through a TTL index, and in a small
+in-process front cache. A retry with the same key gets the stored response
+back without the route running again. Keys are scoped to the user and the
+route, and reusing a key with a different request body is rejected.
+
+While a request runs, its key is held by a pending record. Duplicates that
+arrive in the meantime wait for it: in-process through a shared future,
+across processes by polling the record. A request that failed before its
+first write changed nothing, so its key is released and the retry runs
+normally. Routes call mark_committed once their first write has committed;
+a failure after that keeps the key bound to the error, so a retry cannot
+apply the request twice. A pending record left behind by a crashed process
+is taken over once its lock expires.
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_CACHE_MAX_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_MAX_SIZE", "10000"))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "30"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# Set for the request being run under a key; see mark_committed
+_commit_state: ContextVar[Optional[Dict]] = ContextVar("idempotency_commit_state", default=None)
+
+def mark_committed():
+    """Record that the running request has made a write that a retry must not repeat."""
+    state = _commit_state.get()
+    if state is not None:
+        state["committed"] = True
+
+def request_fingerprint(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(jsonable_encoder(payload), sort_keys=True).encode()).hexdigest()
+
+class IdempotencyStore:
+    """Stored responses keyed by user, route and Idempotency-Key."""
+
+    def __init__(self, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS, max_size: int = IDEMPOTENCY_CACHE_MAX_SIZE,
+                 lock_seconds: int = IDEMPOTENCY_LOCK_SECONDS, wait_seconds: float = IDEMPOTENCY_WAIT_SECONDS):
+        self.ttl = ttl_seconds
+        self.max_size = max_size
+        self.lock = timedelta(seconds=lock_seconds)
+        self.wait_seconds = wait_seconds
+        self._cache: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.executed = 0
+        self.replayed = 0
+
+    def _cache_get(self, record_id: str) -> Optional[Dict]:
+        entry = self._cache.get(record_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._cache[record_id]
+            return None
+        self._cache.move_to_end(record_id)
+        return entry[1]
+
+    def _cache_set(self, record_id: str, record: Dict):
+        self._cache[record_id] = (time.monotonic() + self.ttl, record)
+        self._cache.move_to_end(record_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def _replay(self, record: Dict, fingerprint: str) -> JSONResponse:
+        if record["fingerprint"] != fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request"
+            )
+        self.replayed += 1
+        return JSONResponse(
+            status_code=record["status_code"],
+            content=record["body"],
+            headers={"Idempotent-Replayed": "true"}
+        )
+
+    async def _claim(self, db: AsyncIOMotorDatabase, record_id: str, fingerprint: str) -> Optional[Dict]:
+        """Take the key for this request. Returns None once claimed, or the finished record to replay."""
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            now = datetime.utcnow()
+            try:
+                await db.idempotency_keys.insert_one({
+                    "_id": record_id,
+                    "status": "pending",
+                    "fingerprint": fingerprint,
+                    "locked_until": now + self.lock,
+                    "expires_at": now + timedelta(seconds=self.ttl)
+                })
+                return None
+            except DuplicateKeyError:
+                record = await db.idempotency_keys.find_one({"_id": record_id})
+
+            if record is None:
+                continue
+            if record["status"] == "done" or record["fingerprint"] != fingerprint:
+                return record
+            if record["locked_until"] < now:
+                # The request holding the key died; take it over unless someone else just did
+                result = await db.idempotency_keys.update_one(
+                    {"_id": record_id, "status": "pending", "locked_until": record["locked_until"]},
+                    {"$set": {"locked_until": now + self.lock}}
+                )
+                if result.modified_count:
+                    return None
+                continue
+            if time.monotonic() > deadline:
+                raise HTTPException(
+                    status_code=409,
+                    detail="A request with this Idempotency-Key is still in progress"
+                )
+            await asyncio.sleep(0.1)
+
+    async def run(
+        self,
+        db: AsyncIOMotorDatabase,
+        user_id: str,
+        scope: str,
+        key: Optional[str],
+        payload: Any,
+        execute: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Run execute once per key and replay its response for duplicates."""
+        if key is None:
+            return await execute()
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
+
+        record_id = f"{user_id}:{scope}:{key}"
+        fingerprint = request_fingerprint(payload)
+        while True:
+            record = self._cache_get(record_id)
+            if record is not None:
+                return self._replay(record, fingerprint)
+
+            inflight = self._inflight.get(record_id)
+            if inflight is None:
+                break
+            # A duplicate in this process: wait for the first request, then replay or retry
+            record = await asyncio.shield(inflight)
+            if record is not None:
+                return self._replay(record, fingerprint)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[record_id] = future
+        record = None
+        try:
+            stored = await self._claim(db, record_id, fingerprint)
+            if stored is not None:
+                if stored["status"] == "done":
+                    record = stored
+                    self._cache_set(record_id, record)
+                return self._replay(stored, fingerprint)
+
+            state = {"committed": False}
+            token = _commit_state.set(state)
+            try:
+                result = await execute()
+            except Exception:
+                if not state["committed"]:
+                    await db.idempotency_keys.delete_one({"_id": record_id, "status": "pending"})
+                    raise
+                record = {
+                    "status_code": 500,
+                    "body": {"detail": "The request was partly applied and will not be retried with this Idempotency-Key"},
+                    "fingerprint": fingerprint
+                }
+                await db.idempotency_keys.update_one(
+                    {"_id": record_id},
+                    {"$set": {**record, "status": "done", "completed_at": datetime.utcnow()}}
+                )
+                self._cache_set(record_id, record)
+                raise
+            finally:
+                _commit_state.reset(token)
+            self.executed += 1
+
+            record = {"status_code": 200, "body": jsonable_encoder(result), "fingerprint": fingerprint}
+            await db.idempotency_keys.update_one(
+                {"_id": record_id},
+                {"$set": {**record, "status": "done", "completed_at": datetime.utcnow()}}
+            )
+            self._cache_set(record_id, record)
+            return result
+        finally:
+            del self._inflight[record_id]
+            future.set_result(record)
+
+    def stats(self) -> Dict:
+        return {
+            "cached": len(self._cache),
+            "in_flight": len(self._inflight),
+            "executed": self.executed,
+            "replayed": self.replayed
+        }
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,366 @@
+"""
+Streaming import of historical time logs from CSV or NDJSON.
+
+Each record names a skill (matched by name against the user's skills), the
+minutes spent, and optionally a backdated logged_at and a note:
+
+    skill,minutes,logged_at,note
+    Guitar,45,2023-04-01T18:30:00,scales
+
+    {"skill": "Guitar", "minutes": 45, "logged_at": "2023-04-01T18:30:00"}
+
+Rows are inserted in bounded chunks; the next chunk is not read until the
+previous insert finished, so memory stays flat regardless of file size.
+Skill totals, user totals, rank and streaks are applied once at the end,
+also when the stream breaks off part way, so every inserted row is counted;
+quest progress for the current week is queued as side effect jobs. Every
+row's activity is staged per hour in import_activity as chunks are inserted
+and queued for the achievement aggregates at the end, oldest hour first, in
+jobs of at most IMPORT_EVENTS_PER_JOB hours.
+
+Usage: python importer.py --email user@example.com --file history.csv [--format csv]
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Set
+from dotenv import load_dotenv
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import uuid
+from services import TimeLogService, XPTotalsService, enqueue_achievement_events, enqueue_log_effects
+from achievements import ENTRY_SKILL_FIELDS, log_entry
+from models import TIME_LOG_NOTE_MAX_LENGTH
+from streaks import StreakService, day_number, from_bitmap, skill_streak_fields, user_streak_fields
+from user_cache import user_cache
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+IMPORT_MAX_REPORTED_ERRORS = 100
+IMPORT_FORMATS = ("csv", "ndjson")
+# Hours of history per achievement_events job, which keeps each job document small
+IMPORT_EVENTS_PER_JOB = 500
+
+class ImportRowError(ValueError):
+    pass
+
+def parse_logged_at(value, now: datetime) -> datetime:
+    """Parse an ISO 8601 timestamp into a naive UTC datetime, rejecting future times."""
+    if value in (None, ""):
+        return now
+    try:
+        logged_at = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        raise ImportRowError(f"invalid logged_at {value!r}")
+    if logged_at.tzinfo is not None:
+        logged_at = logged_at.astimezone(timezone.utc).replace(tzinfo=None)
+    if logged_at > now + timedelta(minutes=5):
+        raise ImportRowError("logged_at is in the future")
+    return logged_at
+
+async def iter_lines(byte_chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a stream of byte chunks into decoded lines without buffering the whole body."""
+    buffer = b""
+    async for chunk in byte_chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r").decode("utf-8")
+    if buffer:
+        yield buffer.rstrip(b"\r").decode("utf-8")
+
+async def iter_records(lines: AsyncIterator[str], fmt: str) -> AsyncIterator[dict]:
+    """Turn lines into record dicts. CSV needs a header row; quoted newlines are not supported."""
+    header = None
+    async for line in lines:
+        if not line.strip():
+            continue
+        if fmt == "ndjson":
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                record = {"_error": f"invalid JSON: {e.msg}"}
+            yield record if isinstance(record, dict) else {"_error": "expected a JSON object"}
+        elif header is None:
+            header = [column.strip().lower() for column in next(csv.reader([line]))]
+        else:
+            yield dict(zip(header, next(csv.reader([line]))))
+
+class TimeLogImporter:
+    """Validates records, inserts them in chunks and applies all totals at the end."""
+
+    def __init__(self, db: AsyncIOMotorDatabase, user_id: str, chunk_size: int = IMPORT_CHUNK_SIZE):
+        self.db = db
+        self.user_id = user_id
+        self.chunk_size = chunk_size
+        self.time_log_service = TimeLogService(db)
+        self.now = datetime.utcnow()
+        self.skills_by_name: Dict[str, Dict] = {}
+        self.chunk: List[Dict] = []
+        self.imported = 0
+        self.skipped = 0
+        self.errors: List[str] = []
+        # Aggregates are bounded by the number of skills and distinct days and hours, not rows
+        self.skill_totals: Dict[str, Dict] = {}
+        self.skill_days: Dict[str, Set[int]] = {}
+        self.recent_activity: Dict[date, Dict] = {}
+        # Per hour of the current chunk, so the achievement aggregates see every active hour;
+        # flushed to import_activity, which holds the whole history until it is queued in order
+        self.import_id = str(uuid.uuid4())
+        self.hourly_activity: Dict[datetime, Dict] = {}
+        # XP per day of logged_at, for the windowed leaderboards
+        self.xp_by_day: Dict[datetime, int] = {}
+
+    async def load_skills(self):
+        cursor = self.db.skills.find({"user_id": self.user_id}, ENTRY_SKILL_FIELDS)
+        async for skill in cursor:
+            self.skills_by_name[skill["name"].strip().lower()] = skill
+
+    def _error(self, row_number: int, message: str):
+        self.skipped += 1
+        if len(self.errors) < IMPORT_MAX_REPORTED_ERRORS:
+            self.errors.append(f"row {row_number}: {message}")
+
+    def parse_record(self, record: dict) -> Dict:
+        """Validate one record and build its time log document."""
+        if "_error" in record:
+            raise ImportRowError(record["_error"])
+
+        skill = self.skills_by_name.get(str(record.get("skill") or "").strip().lower())
+        if not skill:
+            raise ImportRowError(f"unknown skill {record.get('skill')!r}")
+
+        try:
+            minutes = int(record.get("minutes"))
+        except (TypeError, ValueError):
+            raise ImportRowError(f"invalid minutes {record.get('minutes')!r}")
+        if not 0 < minutes <= 1440:
+            raise ImportRowError("minutes must be between 1 and 1440")
+
+        # Stored as is and read back through TimeLog, so it must pass the same checks as TimeLogCreate
+        note = record.get("note") or None
+        if note is not None and not isinstance(note, str):
+            raise ImportRowError("note must be a string")
+        if note is not None and len(note) > TIME_LOG_NOTE_MAX_LENGTH:
+            raise ImportRowError(f"note must be at most {TIME_LOG_NOTE_MAX_LENGTH} characters")
+
+        return {
+            "_id": str(uuid.uuid4()),
+            "skill_id": skill["_id"],
+            "minutes": minutes,
+            "xp_earned": self.time_log_service.calculate_xp(minutes, skill["difficulty"]),
+            "note": note,
+            "user_id": self.user_id,
+            "logged_at": parse_logged_at(record.get("logged_at"), self.now)
+        }
+
+    async def add(self, row_number: int, record: dict):
+        try:
+            time_log_doc = self.parse_record(record)
+        except ImportRowError as e:
+            self._error(row_number, str(e))
+            return
+
+        self.chunk.append(time_log_doc)
+        if len(self.chunk) >= self.chunk_size:
+            await self.flush()
+
+    def _accumulate(self, time_log_doc: Dict):
+        skill_id = time_log_doc["skill_id"]
+        logged_at = time_log_doc["logged_at"]
+        totals = self.skill_totals.setdefault(
+            skill_id, {"total_time_minutes": 0, "total_xp": 0, "last_logged_at": logged_at}
+        )
+        totals["total_time_minutes"] += time_log_doc["minutes"]
+        totals["total_xp"] += time_log_doc["xp_earned"]
+        totals["last_logged_at"] = max(totals["last_logged_at"], logged_at)
+        self.skill_days.setdefault(skill_id, set()).add(day_number(logged_at))
+        day_start = datetime.combine(logged_at.date(), datetime.min.time())
+        self.xp_by_day[day_start] = self.xp_by_day.get(day_start, 0) + time_log_doc["xp_earned"]
+
+        hour = logged_at.replace(minute=0, second=0, microsecond=0)
+        hourly = self.hourly_activity.setdefault(hour, {"skills": {}, "logs": 0, "logged_at": logged_at})
+        hourly["logged_at"] = min(hourly["logged_at"], logged_at)
+        self._add_activity(hourly, time_log_doc)
+        # Activity in the current week still counts towards quests
+        week_start = self.now.date() - timedelta(days=self.now.weekday())
+        if logged_at.date() >= week_start:
+            self._add_activity(
+                self.recent_activity.setdefault(logged_at.date(), {"skills": {}, "logs": 0, "logged_at": logged_at}),
+                time_log_doc
+            )
+
+    @staticmethod
+    def _add_activity(activity: Dict, time_log_doc: Dict):
+        skill_activity = activity["skills"].setdefault(time_log_doc["skill_id"], {"minutes": 0, "xp_earned": 0})
+        skill_activity["minutes"] += time_log_doc["minutes"]
+        skill_activity["xp_earned"] += time_log_doc["xp_earned"]
+        activity["logs"] += 1
+
+    async def flush(self):
+        if not self.chunk:
+            return
+        chunk, self.chunk = self.chunk, []
+        await self.db.time_logs.insert_many(chunk, ordered=False)
+        self.imported += len(chunk)
+        for time_log_doc in chunk:
+            self._accumulate(time_log_doc)
+        await self._save_hourly_activity()
+
+    async def _save_hourly_activity(self):
+        hourly, self.hourly_activity = self.hourly_activity, {}
+        if not hourly:
+            return
+        operations = []
+        for hour, activity in hourly.items():
+            increments = {"logs": activity["logs"]}
+            for skill_id, totals in activity["skills"].items():
+                increments[f"skills.{skill_id}.minutes"] = totals["minutes"]
+                increments[f"skills.{skill_id}.xp_earned"] = totals["xp_earned"]
+            operations.append(UpdateOne(
+                {"_id": f"{self.import_id}:{hour:%Y%m%d%H}"},
+                {
+                    "$inc": increments,
+                    "$min": {"logged_at": activity["logged_at"]},
+                    "$setOnInsert": {"import_id": self.import_id, "hour": hour, "expires_at": self.now + timedelta(days=1)}
+                },
+                upsert=True
+            ))
+        await self.db.import_activity.bulk_write(operations, ordered=False)
+
+    async def _queue_achievement_events(self, skills_by_id: Dict[str, Dict]):
+        """Queue the imported history for the achievement aggregates in hour order, in bounded jobs."""
+        events = []
+        position = 0
+        cursor = self.db.import_activity.find({"import_id": self.import_id}).sort("hour", 1)
+        async for activity in cursor:
+            events.append({"logged_at": activity["logged_at"], "entries": self._entries(activity, skills_by_id)})
+            if len(events) >= IMPORT_EVENTS_PER_JOB:
+                await enqueue_achievement_events(self.db, self.user_id, events, self.import_id, position)
+                events = []
+                position += 1
+        if events:
+            await enqueue_achievement_events(self.db, self.user_id, events, self.import_id, position)
+        await self.db.import_activity.delete_many({"import_id": self.import_id})
+
+    async def finish(self) -> Dict:
+        """Flush the last chunk, apply skill totals, user totals, rank and streaks once and queue side effects."""
+        await self.flush()
+        user_data = None
+        if self.skill_totals:
+            # Imports are usually backdated, so streaks are recomputed from the activity bitmap
+            streak_service = StreakService(self.db)
+            for skill_id, days in self.skill_days.items():
+                await streak_service.mark_days(self.user_id, days, [skill_id])
+            bitmap = await streak_service.get_bitmap(self.user_id)
+
+            skill_updates = []
+            for skill_id, totals in self.skill_totals.items():
+                streak = from_bitmap(bitmap.get("skills", {}).get(skill_id, {}))
+                skill_updates.append(UpdateOne({"_id": skill_id}, {
+                    "$inc": {"total_time_minutes": totals["total_time_minutes"], "total_xp": totals["total_xp"]},
+                    "$max": {"last_logged_at": totals["last_logged_at"]},
+                    "$set": {**skill_streak_fields(streak), "updated_at": self.now}
+                }))
+            await self.db.skills.bulk_write(skill_updates, ordered=False)
+
+            user_data = await self.time_log_service.update_user_stats(
+                self.user_id,
+                sum(totals["total_xp"] for totals in self.skill_totals.values()),
+                sum(totals["total_time_minutes"] for totals in self.skill_totals.values()),
+                earned=self.xp_by_day
+            )
+            streak_fields = user_streak_fields(from_bitmap(bitmap.get("days", {})))
+            await self.db.users.update_one({"_id": self.user_id}, {"$set": streak_fields})
+            user_cache.update(self.user_id, streak_fields)
+
+            skills_by_id = {skill["_id"]: skill for skill in self.skills_by_name.values()}
+            await XPTotalsService(self.db).record(self.user_id, [
+                log_entry(skills_by_id[skill_id], totals["total_time_minutes"], totals["total_xp"])
+                for skill_id, totals in self.skill_totals.items()
+            ])
+            for activity in self.recent_activity.values():
+                await enqueue_log_effects(
+                    self.db, self.user_id, self._entries(activity, skills_by_id), activity["logged_at"],
+                    logs=activity["logs"], achievements=False
+                )
+            # Day, week and break aggregates only move forward, so the history goes in date order
+            await self._queue_achievement_events(skills_by_id)
+
+        return {
+            "imported": self.imported,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "user_data": user_data
+        }
+
+    @staticmethod
+    def _entries(activity: Dict, skills_by_id: Dict[str, Dict]) -> List[Dict]:
+        return [
+            log_entry(skills_by_id[skill_id], totals["minutes"], totals["xp_earned"])
+            for skill_id, totals in activity["skills"].items()
+        ]
+
+async def import_time_logs(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    byte_chunks: AsyncIterator[bytes],
+    fmt: str = "csv",
+    chunk_size: int = IMPORT_CHUNK_SIZE
+) -> Dict:
+    """Import a CSV or NDJSON byte stream of time logs for a user."""
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Unsupported import format {fmt!r}")
+
+    importer = TimeLogImporter(db, user_id, chunk_size)
+    await importer.load_skills()
+
+    row_number = 0
+    try:
+        async for record in iter_records(iter_lines(byte_chunks), fmt):
+            row_number += 1
+            await importer.add(row_number, record)
+    finally:
+        # Rows read before a decode error or disconnect are still inserted and counted
+        summary = await importer.finish()
+    logging.info(f"Imported {summary['imported']} time logs for user {user_id} ({summary['skipped']} skipped)")
+    return summary
+
+async def _file_chunks(path: Path, chunk_size: int = 1 << 16) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+async def main(email: str, path: Path, fmt: Optional[str], chunk_size: int):
+    from database import connect_to_mongo, close_mongo_connection, get_database
+    await connect_to_mongo()
+    try:
+        db = await get_database()
+        user = await db.users.find_one({"email": email}, {"_id": 1})
+        if not user:
+            raise SystemExit(f"No user with email {email}")
+        fmt = fmt or ("ndjson" if path.suffix in (".ndjson", ".jsonl") else "csv")
+        summary = await import_time_logs(db, user["_id"], _file_chunks(path), fmt, chunk_size)
+        print(json.dumps({k: v for k, v in summary.items() if k != "user_data"}, indent=2))
+    finally:
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Import historical time logs for a user")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--file", required=True, type=Path)
+    parser.add_argument("--format", choices=IMPORT_FORMATS)
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.email, args.file, args.format, args.chunk_size))
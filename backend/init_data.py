@@ -2,8 +2,9 @@
 Default data initialization for Galactic Quest
 """
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from datetime import datetime
+from datetime import datetime, timedelta
 import uuid
+from catalog import bump_catalog_version
 
 # Default achievements data
 DEFAULT_ACHIEVEMENTS = [
@@ -279,6 +280,7 @@ async def initialize_default_data(db: AsyncIOMotorDatabase):
     existing_achievements = await db.achievements.count_documents({})
     if existing_achievements == 0:
         await db.achievements.insert_many(DEFAULT_ACHIEVEMENTS)
+        await bump_catalog_version(db, "achievements")
         print(f"Inserted {len(DEFAULT_ACHIEVEMENTS)} default achievements")
     
     # Initialize predefined categories (system-wide)
@@ -291,6 +293,7 @@ async def initialize_default_data(db: AsyncIOMotorDatabase):
             predefined_with_timestamps.append(cat_doc)
         
         await db.predefined_categories.insert_many(predefined_with_timestamps)
+        await bump_catalog_version(db, "predefined_categories")
         print(f"Inserted {len(DEFAULT_PREDEFINED_CATEGORIES)} predefined categories")
     
     # Initialize quest templates
@@ -303,89 +306,67 @@ async def initialize_default_data(db: AsyncIOMotorDatabase):
             quest_templates_with_timestamps.append(quest_doc)
         
         await db.quest_templates.insert_many(quest_templates_with_timestamps)
+        await bump_catalog_version(db, "quest_templates")
         print(f"Inserted {len(DEFAULT_QUEST_TEMPLATES)} quest templates")
     
     print("Default data initialization completed")
 
-async def initialize_user_default_data(db: AsyncIOMotorDatabase, user_id: str):
-    """Initialize default user-specific data when a new user registers."""
+# Prebuilt per-user quest documents; only ids, owner and dates are filled in per user
+_USER_QUEST_TEMPLATES = tuple(
+    {
+        "quest_id": template["_id"],
+        "name": template["name"],
+        "description": template["description"],
+        "quest_type": template["quest_type"],
+        "target_value": template["target_value"],
+        "xp_reward": template["xp_reward"],
+        "progress": 0,
+        "completed": False,
+        "claimed": False
+    }
+    for template in DEFAULT_QUEST_TEMPLATES
+    if template["quest_type"] in ("daily", "weekly")
+)
+
+def build_user_quests(user_id: str, now: datetime) -> list:
+    """Build the user's quests for the current day and week."""
+    today = now.date()
+    week_start = today - timedelta(days=today.weekday())
+    periods = {
+        "daily": (datetime.combine(today, datetime.min.time()), datetime.combine(today, datetime.max.time())),
+        "weekly": (
+            datetime.combine(week_start, datetime.min.time()),
+            datetime.combine(week_start + timedelta(days=6), datetime.max.time())
+        )
+    }
     
-    # Create user's predefined categories from templates
-    existing_user_categories = await db.categories.count_documents({"user_id": user_id})
-    if existing_user_categories == 0:
-        user_categories = []
-        for predefined in DEFAULT_PREDEFINED_CATEGORIES:
-            user_cat = {
-                "_id": str(uuid.uuid4()),
-                "name": predefined["name"],
-                "icon": predefined["icon"],
-                "color": predefined["color"],
-                "description": predefined["description"],
-                "user_id": user_id,
-                "is_predefined": True,
-                "created_at": datetime.utcnow()
-            }
-            user_categories.append(user_cat)
-        
-        await db.categories.insert_many(user_categories)
-        print(f"Created {len(user_categories)} predefined categories for user {user_id}")
+    user_quests = []
+    for template in _USER_QUEST_TEMPLATES:
+        start_date, end_date = periods[template["quest_type"]]
+        user_quests.append({
+            **template,
+            "_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "start_date": start_date,
+            "end_date": end_date,
+            "created_at": now
+        })
+    return user_quests
+
+async def insert_user_default_data(db: AsyncIOMotorDatabase, user_id: str, now: datetime = None):
+    """Insert default data for a brand-new user, with no existence checks.
     
-    # Initialize user's daily and weekly quests
-    today = datetime.utcnow().date()
-    existing_user_quests = await db.user_quests.count_documents({
-        "user_id": user_id,
-        "start_date": {"$gte": datetime.combine(today, datetime.min.time())}
-    })
+    Predefined categories are not copied; CategoryService overlays the shared
+    predefined_categories collection at read time.
+    """
+    now = now or datetime.utcnow()
+    await db.user_quests.insert_many(build_user_quests(user_id, now))
+
+async def initialize_user_default_data(db: AsyncIOMotorDatabase, user_id: str):
+    """Initialize default user-specific data, skipping parts the user already has."""
+    now = datetime.utcnow()
+    today_start = datetime.combine(now.date(), datetime.min.time())
     
-    if existing_user_quests == 0:
-        user_quests = []
-        
-        # Create daily quests
-        for template in DEFAULT_QUEST_TEMPLATES:
-            if template["quest_type"] == "daily":
-                user_quest = {
-                    "_id": str(uuid.uuid4()),
-                    "user_id": user_id,
-                    "quest_id": template["_id"],
-                    "name": template["name"],
-                    "description": template["description"],
-                    "quest_type": template["quest_type"],
-                    "target_value": template["target_value"],
-                    "xp_reward": template["xp_reward"],
-                    "progress": 0,
-                    "completed": False,
-                    "claimed": False,
-                    "start_date": datetime.combine(today, datetime.min.time()),
-                    "end_date": datetime.combine(today, datetime.max.time()),
-                    "created_at": datetime.utcnow()
-                }
-                user_quests.append(user_quest)
-            
-            elif template["quest_type"] == "weekly":
-                # Calculate week start (Monday) and end (Sunday)
-                from datetime import timedelta
-                weekday = today.weekday()
-                week_start = today - timedelta(days=weekday)
-                week_end = week_start + timedelta(days=6)
-                
-                user_quest = {
-                    "_id": str(uuid.uuid4()),
-                    "user_id": user_id,
-                    "quest_id": template["_id"],
-                    "name": template["name"],
-                    "description": template["description"],
-                    "quest_type": template["quest_type"],
-                    "target_value": template["target_value"],
-                    "xp_reward": template["xp_reward"],
-                    "progress": 0,
-                    "completed": False,
-                    "claimed": False,
-                    "start_date": datetime.combine(week_start, datetime.min.time()),
-                    "end_date": datetime.combine(week_end, datetime.max.time()),
-                    "created_at": datetime.utcnow()
-                }
-                user_quests.append(user_quest)
-        
-        if user_quests:
-            await db.user_quests.insert_many(user_quests)
-            print(f"Created {len(user_quests)} quests for user {user_id}")
\ No newline at end of file
+    if await db.user_quests.count_documents({"user_id": user_id, "start_date": {"$gte": today_start}}) == 0:
+        await db.user_quests.insert_many(build_user_quests(user_id, now))
+        print(f"Created {len(_USER_QUEST_TEMPLATES)} quests for user {user_id}")
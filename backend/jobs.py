@@ -0,0 +1,244 @@
+"""
+Durable queue for side effects of time logging (quests, achievements, rollups).
+
+Jobs are documents in the side_effect_jobs collection, inserted alongside the
+time log so the request can return once the log and totals are committed. A
+pool of in-process workers applies them in per-user order: a worker first
+takes a lease on the user in side_effect_leases, then drains that user's
+pending jobs oldest first, deleting each one after its handler succeeds.
+
+A lease that is not renewed expires, so jobs held by a crashed process are
+picked up again after a restart. A job can therefore run more than once if
+the process died between its handler and its delete; handlers receive the
+job and use its _id to make their writes idempotent. Since a user's jobs run
+one at a time, only the most recently applied job can be replayed.
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+import asyncio
+import logging
+import os
+import socket
+import statistics
+import time
+import uuid
+
+SIDE_EFFECT_WORKERS = int(os.getenv("SIDE_EFFECT_WORKERS", "4"))
+SIDE_EFFECT_POLL_SECONDS = float(os.getenv("SIDE_EFFECT_POLL_SECONDS", "1"))
+SIDE_EFFECT_LEASE_SECONDS = int(os.getenv("SIDE_EFFECT_LEASE_SECONDS", "30"))
+SIDE_EFFECT_MAX_ATTEMPTS = int(os.getenv("SIDE_EFFECT_MAX_ATTEMPTS", "5"))
+# Jobs drained per lease before the worker lets other users have a turn
+SIDE_EFFECT_DRAIN_LIMIT = 50
+
+JobHandler = Callable[[AsyncIOMotorDatabase, Dict], Awaitable[None]]
+
+class SideEffectQueue:
+    """Mongo-backed job queue with per-user ordering."""
+
+    def __init__(self, workers: int = SIDE_EFFECT_WORKERS, poll_seconds: float = SIDE_EFFECT_POLL_SECONDS,
+                 lease_seconds: int = SIDE_EFFECT_LEASE_SECONDS, max_attempts: int = SIDE_EFFECT_MAX_ATTEMPTS):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.lease = timedelta(seconds=lease_seconds)
+        self.max_attempts = max_attempts
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, JobHandler] = {}
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._active_users: Set[str] = set()
+        # Metrics
+        self.enqueued = 0
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self.backlog_age_seconds = 0.0
+        self._recent: deque = deque(maxlen=1000)  # (completed monotonic time, lag in seconds)
+
+    def register(self, kind: str):
+        """Decorator registering the handler for a job kind."""
+        def decorator(handler: JobHandler) -> JobHandler:
+            self._handlers[kind] = handler
+            return handler
+        return decorator
+
+    async def enqueue(self, db: AsyncIOMotorDatabase, user_id: str, kind: str, payload: Dict,
+                      job_id: Optional[str] = None) -> str:
+        """Persist a job for a user and wake the workers.
+
+        Jobs enqueued within the same millisecond run in _id order, so a caller
+        whose jobs must run in sequence passes ids that sort in that order.
+        """
+        job_id = job_id or str(uuid.uuid4())
+        now = datetime.utcnow()
+        await db.side_effect_jobs.insert_one({
+            "_id": job_id,
+            "user_id": user_id,
+            "kind": kind,
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "available_at": now
+        })
+        self.enqueued += 1
+        self._wakeup.set()
+        return job_id
+
+    async def _acquire(self, user_id: str) -> bool:
+        now = datetime.utcnow()
+        try:
+            # Matches a missing or expired lease; a live lease held elsewhere makes the upsert collide
+            await self._db.side_effect_leases.update_one(
+                {"_id": user_id, "expires_at": {"$lt": now}},
+                {"$set": {"owner": self.owner, "expires_at": now + self.lease}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def _renew(self, user_id: str):
+        await self._db.side_effect_leases.update_one(
+            {"_id": user_id, "owner": self.owner},
+            {"$set": {"expires_at": datetime.utcnow() + self.lease}}
+        )
+
+    async def _release(self, user_id: str):
+        await self._db.side_effect_leases.delete_one({"_id": user_id, "owner": self.owner})
+
+    async def _head_job(self, user_id: str) -> Optional[Dict]:
+        return await self._db.side_effect_jobs.find_one(
+            {"user_id": user_id, "status": "pending"}, sort=[("created_at", 1), ("_id", 1)]
+        )
+
+    async def _head_due(self, user_id: str, now: datetime) -> bool:
+        job = await self._head_job(user_id)
+        return job is not None and job["available_at"] <= now
+
+    async def _claim_user(self) -> Optional[str]:
+        """Lease the user with the oldest due job that no other worker holds."""
+        now = datetime.utcnow()
+        cursor = self._db.side_effect_jobs.find(
+            {"status": "pending", "available_at": {"$lte": now}, "user_id": {"$nin": list(self._active_users)}},
+            {"user_id": 1, "created_at": 1}
+        ).sort([("created_at", 1), ("_id", 1)]).limit(20)
+
+        tried = set()
+        first = True
+        async for job in cursor:
+            if first:
+                self.backlog_age_seconds = (now - job["created_at"]).total_seconds()
+                first = False
+            user_id = job["user_id"]
+            if user_id in tried or user_id in self._active_users:
+                continue
+            tried.add(user_id)
+            # A later job can be due while the user's oldest one waits out a retry backoff
+            if not await self._head_due(user_id, now):
+                continue
+            if await self._acquire(user_id):
+                self._active_users.add(user_id)
+                return user_id
+        if first:
+            self.backlog_age_seconds = 0.0
+        return None
+
+    async def _run_job(self, job: Dict) -> bool:
+        handler = self._handlers.get(job["kind"])
+        try:
+            if handler is None:
+                raise LookupError(f"no handler for job kind {job['kind']!r}")
+            await handler(self._db, job)
+        except Exception as e:
+            attempts = job.get("attempts", 0) + 1
+            update = {"attempts": attempts, "last_error": str(e)}
+            if attempts >= self.max_attempts:
+                # Parked for inspection so the user's later jobs can proceed
+                update["status"] = "failed"
+                self.failed += 1
+                logging.error(f"Side effect job {job['_id']} ({job['kind']}) failed permanently: {e}")
+            else:
+                update["available_at"] = datetime.utcnow() + timedelta(seconds=2 ** attempts)
+                self.retried += 1
+                logging.warning(f"Side effect job {job['_id']} ({job['kind']}) failed, retrying: {e}")
+            await self._db.side_effect_jobs.update_one({"_id": job["_id"]}, {"$set": update})
+            return False
+
+        await self._db.side_effect_jobs.delete_one({"_id": job["_id"]})
+        self.processed += 1
+        self._recent.append((time.monotonic(), (datetime.utcnow() - job["created_at"]).total_seconds()))
+        return True
+
+    async def _drain(self, user_id: str) -> bool:
+        """Run a leased user's due jobs in order, stopping at the first one that is not due or fails.
+
+        Returns whether any job was run.
+        """
+        ran = False
+        try:
+            for _ in range(SIDE_EFFECT_DRAIN_LIMIT):
+                job = await self._head_job(user_id)
+                if job is None or job["available_at"] > datetime.utcnow():
+                    break
+                ran = True
+                if not await self._run_job(job):
+                    break
+                await self._renew(user_id)
+            return ran
+        finally:
+            self._active_users.discard(user_id)
+            await self._release(user_id)
+
+    async def _worker(self):
+        while True:
+            try:
+                user_id = await self._claim_user()
+                # Nothing run means nothing is due yet, so wait rather than claim again
+                if user_id is not None and await self._drain(user_id):
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Side effect worker error: {e}")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, db: AsyncIOMotorDatabase):
+        """Start the worker pool."""
+        self._db = db
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stop the workers; leased users are released and unfinished jobs stay queued."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        window = [(done, lag) for done, lag in self._recent if now - done <= 60]
+        lags = sorted(lag for _, lag in window)
+        return {
+            "workers": len(self._tasks),
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "users_in_flight": len(self._active_users),
+            "backlog_age_seconds": round(self.backlog_age_seconds, 3),
+            "jobs_per_second": round(len(window) / 60, 2),
+            "lag_p50_ms": round(statistics.median(lags) * 1000, 1) if lags else None,
+            "lag_p99_ms": round(lags[int(0.99 * (len(lags) - 1))] * 1000, 1) if lags else None
+        }
+
+side_effects = SideEffectQueue()
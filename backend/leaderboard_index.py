@@ -0,0 +1,202 @@
+"""
+In-process ranked index of users by total XP.
+
+Users are kept in a sorted list keyed by (-total_xp, user_id), which
+supports top-N, a user's position and the player count in O(log n) without
+touching Mongo. The index is loaded at startup and kept current by the
+writes in this process that change XP. A periodic reconcile against the
+users collection repairs drift from writers in other processes (other
+workers, the backfill and rerank jobs).
+
+top_version counts changes that reach the first top_size positions, so
+caches of the top of the board know when they are out of date.
+
+The same index serves other boards by reading scores from another source,
+e.g. the windowed XP buckets.
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from sortedcontainers import SortedList
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+import time
+
+LEADERBOARD_RECONCILE_SECONDS = int(os.getenv("LEADERBOARD_RECONCILE_SECONDS", "600"))
+LEADERBOARD_TOP_SIZE = int(os.getenv("LEADERBOARD_TOP_SIZE", "100"))
+
+class LeaderboardSource(NamedTuple):
+    """Where a board's scores live: one document per player in collection matching query."""
+    collection: str = "users"
+    query: Dict = {}
+    score_field: str = "total_xp"
+    user_field: str = "_id"
+
+class LeaderboardIndex:
+    """Order-statistic index over (total_xp, user_id)."""
+
+    def __init__(
+        self,
+        source: LeaderboardSource = LeaderboardSource(),
+        reconcile_seconds: int = LEADERBOARD_RECONCILE_SECONDS,
+        top_size: int = LEADERBOARD_TOP_SIZE
+    ):
+        self.source = source
+        self.reconcile_seconds = reconcile_seconds
+        self.top_size = top_size
+        self.top_version = 0
+        self._xp: Dict[str, int] = {}
+        self._ranked = SortedList()
+        self.loaded = False
+        self._task: Optional[asyncio.Task] = None
+        self.last_reconcile: Dict = {}
+        # Users written while a reconcile runs; its cursor may have read them before the write
+        self._touched: Optional[Set[str]] = None
+
+    def __len__(self) -> int:
+        return len(self._xp)
+
+    def set(self, user_id: str, total_xp: int):
+        """Place a user at exactly this XP."""
+        if self._touched is not None:
+            self._touched.add(user_id)
+        old = self._xp.get(user_id)
+        if old == total_xp:
+            return
+        if old is not None:
+            self._discard((-old, user_id))
+        self._xp[user_id] = total_xp
+        self._ranked.add((-total_xp, user_id))
+        if self._ranked.bisect_left((-total_xp, user_id)) < self.top_size:
+            self.top_version += 1
+
+    def observe(self, user_id: str, total_xp: int):
+        """Record a total returned by an $inc; results of concurrent increments may arrive out of order."""
+        old = self._xp.get(user_id)
+        if old is None or total_xp > old:
+            self.set(user_id, total_xp)
+
+    def remove(self, user_id: str):
+        if self._touched is not None:
+            self._touched.add(user_id)
+        old = self._xp.pop(user_id, None)
+        if old is not None:
+            self._discard((-old, user_id))
+
+    def _discard(self, key: Tuple[int, str]):
+        if self._ranked.bisect_left(key) < self.top_size:
+            self.top_version += 1
+        self._ranked.remove(key)
+
+    def xp(self, user_id: str) -> Optional[int]:
+        return self._xp.get(user_id)
+
+    def top(self, limit: int) -> List[Tuple[str, int]]:
+        """The highest ranked (user_id, total_xp) pairs; ties are ordered by user id."""
+        return [(user_id, -neg_xp) for neg_xp, user_id in self._ranked.islice(0, limit)]
+
+    def page(self, start: int, limit: int) -> List[Tuple[str, int]]:
+        """(user_id, total_xp) pairs at 0-based positions start..start+limit."""
+        return [(user_id, -neg_xp) for neg_xp, user_id in self._ranked.islice(start, start + limit)]
+
+    def after(self, total_xp: int, user_id: str, limit: int) -> Tuple[int, List[Tuple[str, int]]]:
+        """The 0-based offset and entries ranked just below (total_xp, user_id)."""
+        start = self._ranked.bisect_right((-total_xp, user_id))
+        return start, self.page(start, limit)
+
+    def before(self, total_xp: int, user_id: str, limit: int) -> Tuple[int, List[Tuple[str, int]]]:
+        """The 0-based offset and entries ranked just above (total_xp, user_id)."""
+        end = self._ranked.bisect_left((-total_xp, user_id))
+        start = max(end - limit, 0)
+        return start, self.page(start, end - start)
+
+    def position(self, user_id: str) -> Optional[int]:
+        """1-based position: one more than the number of users with strictly more XP."""
+        total_xp = self._xp.get(user_id)
+        if total_xp is None:
+            return None
+        return self.position_for_xp(total_xp)
+
+    def position_for_xp(self, total_xp: int) -> int:
+        # "" sorts before every user id, so this counts only strictly higher XP
+        return self._ranked.bisect_left((-total_xp, "")) + 1
+
+    async def _scores(self, db: AsyncIOMotorDatabase) -> AsyncIterator[Tuple[str, int]]:
+        source = self.source
+        async for doc in db[source.collection].find(source.query, {source.user_field: 1, source.score_field: 1}):
+            yield doc[source.user_field], doc.get(source.score_field, 0)
+
+    async def load(self, db: AsyncIOMotorDatabase):
+        """Build the index from its source collection."""
+        started = time.perf_counter()
+        xp = {user_id: total_xp async for user_id, total_xp in self._scores(db)}
+        self._xp = xp
+        self._ranked = SortedList((-total_xp, user_id) for user_id, total_xp in xp.items())
+        self.top_version += 1
+        self.loaded = True
+        logging.info(f"Loaded leaderboard index of {self.source.collection} with {len(xp)} users in {time.perf_counter() - started:.2f}s")
+
+    async def reconcile(self, db: AsyncIOMotorDatabase) -> Dict:
+        """Compare the index with Mongo and repair any differences.
+
+        Users written in this process while the reconcile runs are left alone,
+        since the score read for them may be older than the write.
+        """
+        started = time.perf_counter()
+        seen = set()
+        fixed = 0
+        touched = self._touched = set()
+        try:
+            async for user_id, total_xp in self._scores(db):
+                seen.add(user_id)
+                if user_id not in touched and self._xp.get(user_id) != total_xp:
+                    self.set(user_id, total_xp)
+                    fixed += 1
+            extra = [user_id for user_id in self._xp if user_id not in seen and user_id not in touched]
+            for user_id in extra:
+                self.remove(user_id)
+        finally:
+            self._touched = None
+
+        self.last_reconcile = {
+            "checked": len(seen),
+            "fixed": fixed,
+            "removed": len(extra),
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+        if fixed or extra:
+            logging.info(f"Leaderboard index reconciled: {self.last_reconcile}")
+        return self.last_reconcile
+
+    async def _run(self, db: AsyncIOMotorDatabase):
+        while True:
+            await asyncio.sleep(self.reconcile_seconds)
+            try:
+                await self.reconcile(db)
+            except Exception as e:
+                logging.warning(f"Failed to reconcile leaderboard index: {e}")
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        """Load the index and start the periodic reconcile."""
+        await self.load(db)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "loaded": self.loaded,
+            "players": len(self),
+            "top_version": self.top_version,
+            "last_reconcile": self.last_reconcile
+        }
+
+leaderboard_index = LeaderboardIndex()
@@ -0,0 +1,124 @@
+"""
+Pre-serialized snapshots of the top of the leaderboard.
+
+One snapshot holds the first LEADERBOARD_TOP_SIZE entries. The JSON for each
+requested page size is built once per snapshot and hashed into a strong
+ETag. A snapshot is reused until the leaderboard index reports a change in
+the top positions and LEADERBOARD_SNAPSHOT_SECONDS have passed, so bursts of
+XP changes at the top rebuild it at most once per interval. Without a
+loaded index it is simply rebuilt on that interval.
+
+The caller's position and the player count differ per request and are
+spliced in next to the shared entries. The global board and every windowed
+board have their own LeaderboardSnapshots.
+"""
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import os
+import time
+from catalog import etag_matches
+from leaderboard_index import LEADERBOARD_TOP_SIZE, LeaderboardIndex
+from models import LeaderboardEntry
+from services import LeaderboardService
+from windowed_leaderboards import PERIODS
+
+LEADERBOARD_SNAPSHOT_SECONDS = float(os.getenv("LEADERBOARD_SNAPSHOT_SECONDS", "2"))
+
+class LeaderboardPage(NamedTuple):
+    body: bytes
+    etag: str
+
+class LeaderboardSnapshot(NamedTuple):
+    index: LeaderboardIndex
+    top_version: int
+    built_at: float
+    entries: List[LeaderboardEntry]
+    pages: Dict[int, LeaderboardPage]
+
+class LeaderboardSnapshots:
+    """The current top-of-board snapshot and its serialized pages."""
+
+    def __init__(self, size: int = LEADERBOARD_TOP_SIZE, max_age: float = LEADERBOARD_SNAPSHOT_SECONDS):
+        self.size = size
+        self.max_age = max_age
+        self._snapshot: Optional[LeaderboardSnapshot] = None
+        self._lock = asyncio.Lock()
+        self.builds = 0
+        self.hits = 0
+        self.not_modified = 0
+
+    def _fresh(self, snapshot: Optional[LeaderboardSnapshot], index: LeaderboardIndex) -> bool:
+        # Windowed boards swap in a new index when their period rolls over
+        if snapshot is None or snapshot.index is not index:
+            return False
+        if time.monotonic() - snapshot.built_at < self.max_age:
+            return True
+        return index.loaded and snapshot.top_version == index.top_version
+
+    async def get(self, service: LeaderboardService) -> LeaderboardSnapshot:
+        """The snapshot of the service's board, rebuilt if it is out of date."""
+        snapshot = self._snapshot
+        if self._fresh(snapshot, service.index):
+            self.hits += 1
+            return snapshot
+        async with self._lock:
+            # Concurrent requests wait for one rebuild instead of each running their own
+            if not self._fresh(self._snapshot, service.index):
+                top_version = service.index.top_version
+                entries = await service.get_top_entries(self.size)
+                self._snapshot = LeaderboardSnapshot(service.index, top_version, time.monotonic(), entries, {})
+                self.builds += 1
+            return self._snapshot
+
+    def page(self, snapshot: LeaderboardSnapshot, limit: int) -> LeaderboardPage:
+        page = snapshot.pages.get(limit)
+        if page is None:
+            body = json.dumps(jsonable_encoder(snapshot.entries[:limit]), separators=(",", ":")).encode()
+            page = snapshot.pages[limit] = LeaderboardPage(body, hashlib.sha256(body).hexdigest()[:32])
+        return page
+
+    def clear(self):
+        self._snapshot = None
+
+    def stats(self) -> Dict:
+        return {"builds": self.builds, "hits": self.hits, "not_modified": self.not_modified}
+
+async def leaderboard_response(
+    request: Request,
+    user_id: str,
+    limit: int,
+    service: LeaderboardService,
+    snapshots: LeaderboardSnapshots,
+    extra: Optional[Dict[str, Any]] = None
+) -> Response:
+    """Serve a page of the service's board from its snapshot, or 304 if the client already has it.
+    
+    extra holds further top-level fields of the response, e.g. a windowed board's period.
+    """
+    snapshot = await snapshots.get(service)
+    page = snapshots.page(snapshot, limit)
+    user_position = await service.get_user_position(user_id, snapshot.entries[:limit])
+    total_players = await service.get_total_players()
+
+    extra_json = json.dumps(jsonable_encoder(extra), separators=(",", ":")).encode()[1:-1] if extra else b""
+    extra_tag = f".{hashlib.sha256(extra_json).hexdigest()[:8]}" if extra else ""
+    headers = {
+        "ETag": f'"{page.etag}.{user_position}.{total_players}{extra_tag}"',
+        "Cache-Control": "private, no-cache"
+    }
+    if etag_matches(request, headers["ETag"]):
+        snapshots.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    body = b'{"entries":%s,"user_position":%d,"total_players":%d%s}' % (
+        page.body, user_position, total_players, b"," + extra_json if extra else b""
+    )
+    return Response(content=body, media_type="application/json", headers=headers)
+
+leaderboard_snapshots = LeaderboardSnapshots()
+windowed_snapshots = {period: LeaderboardSnapshots() for period in PERIODS}
+# One per category or difficulty board, created with the board
+skill_snapshots: Dict[Tuple[str, str], LeaderboardSnapshots] = {}
@@ -143,16 +143,19 @@ class Skill(BaseModel):
     total_time_minutes: int = 0
     total_xp: int = 0
     streak: int = 0
+    longest_streak: int = 0
     last_logged_at: Optional[datetime] = None
     user_id: str
     created_at: datetime
     updated_at: datetime
 
 # Time Log Models
+TIME_LOG_NOTE_MAX_LENGTH = 1000
+
 class TimeLogCreate(BaseModel):
     skill_id: str
     minutes: int = Field(..., gt=0, le=1440)  # Max 24 hours per log
-    note: Optional[str] = None
+    note: Optional[str] = Field(None, max_length=TIME_LOG_NOTE_MAX_LENGTH)
 
 class TimeLog(BaseModel):
     id: str
@@ -163,6 +166,32 @@ class TimeLog(BaseModel):
     user_id: str
     logged_at: datetime
 
+class TimeLogResult(TimeLog):
+    user_data: Optional[Dict] = None
+
+TIME_LOG_BATCH_MAX_ENTRIES = 500
+
+class TimeLogBatchCreate(BaseModel):
+    entries: List[TimeLogCreate] = Field(..., min_length=1, max_length=TIME_LOG_BATCH_MAX_ENTRIES)
+
+class TimeLogBatchEntryResult(BaseModel):
+    index: int
+    success: bool
+    time_log: Optional[TimeLog] = None
+    error: Optional[str] = None
+
+class TimeLogBatchResult(BaseModel):
+    results: List[TimeLogBatchEntryResult]
+    logged: int
+    failed: int
+    user_data: Optional[Dict] = None
+
+class TimeLogImportResult(BaseModel):
+    imported: int
+    skipped: int
+    errors: List[str] = []
+    user_data: Optional[Dict] = None
+
 # Achievement Models
 class Achievement(BaseModel):
     id: str
@@ -226,6 +255,25 @@ class LeaderboardResponse(BaseModel):
     user_position: Optional[int] = None
     total_players: int
 
+class WindowedLeaderboardResponse(LeaderboardResponse):
+    """A board of XP earned in the current period; entries carry that XP in total_xp."""
+    period: str
+    key: str
+    ends_at: datetime
+
+class SkillLeaderboardResponse(LeaderboardResponse):
+    """A board of XP logged in one predefined category or at one difficulty; entries carry that XP in total_xp."""
+    dimension: str
+    key: str
+
+class LeaderboardWindow(BaseModel):
+    """A slice of the leaderboard; cursors are "<total_xp>:<user_id>" of the edge entries."""
+    entries: List[LeaderboardEntry]
+    user_position: Optional[int] = None
+    total_players: int
+    prev_cursor: Optional[str] = None
+    next_cursor: Optional[str] = None
+
 # Stats Models
 class UserStats(BaseModel):
     user_id: str
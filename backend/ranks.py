@@ -0,0 +1,100 @@
+"""
+Rank ladder for Galactic Quest.
+
+The ladder is built once at import time and never mutated; lookups bisect
+over the sorted min_xp thresholds.
+"""
+from bisect import bisect_right
+from types import MappingProxyType
+from typing import NamedTuple, Optional
+import numpy as np
+
+def _division(tier: str, division: str, total_rank: int, min_xp: int, max_xp: int, color: str, bg_color: str):
+    return MappingProxyType({
+        "tier": tier,
+        "division": division,
+        "total_rank": total_rank,
+        "min_xp": min_xp,
+        "max_xp": max_xp,
+        "color": color,
+        "bg_color": bg_color
+    })
+
+RANK_LADDER = (
+    # Iron
+    _division("Iron", "IV", 1, 0, 999, "#8B4513", "#2D1810"),
+    _division("Iron", "III", 2, 1000, 1999, "#8B4513", "#2D1810"),
+    _division("Iron", "II", 3, 2000, 2999, "#8B4513", "#2D1810"),
+    _division("Iron", "I", 4, 3000, 3999, "#8B4513", "#2D1810"),
+
+    # Bronze
+    _division("Bronze", "IV", 5, 4000, 5999, "#CD7F32", "#3D2F1A"),
+    _division("Bronze", "III", 6, 6000, 7999, "#CD7F32", "#3D2F1A"),
+    _division("Bronze", "II", 7, 8000, 9999, "#CD7F32", "#3D2F1A"),
+    _division("Bronze", "I", 8, 10000, 11999, "#CD7F32", "#3D2F1A"),
+
+    # Silver
+    _division("Silver", "IV", 9, 12000, 14999, "#C0C0C0", "#2A2A2A"),
+    _division("Silver", "III", 10, 15000, 17999, "#C0C0C0", "#2A2A2A"),
+    _division("Silver", "II", 11, 18000, 20999, "#C0C0C0", "#2A2A2A"),
+    _division("Silver", "I", 12, 21000, 23999, "#C0C0C0", "#2A2A2A"),
+
+    # Gold
+    _division("Gold", "IV", 13, 24000, 27999, "#FFD700", "#3D3D1A"),
+    _division("Gold", "III", 14, 28000, 31999, "#FFD700", "#3D3D1A"),
+    _division("Gold", "II", 15, 32000, 35999, "#FFD700", "#3D3D1A"),
+    _division("Gold", "I", 16, 36000, 39999, "#FFD700", "#3D3D1A"),
+
+    # Platinum
+    _division("Platinum", "IV", 17, 40000, 44999, "#00CED1", "#1A3D3D"),
+    _division("Platinum", "III", 18, 45000, 49999, "#00CED1", "#1A3D3D"),
+    _division("Platinum", "II", 19, 50000, 54999, "#00CED1", "#1A3D3D"),
+    _division("Platinum", "I", 20, 55000, 59999, "#00CED1", "#1A3D3D"),
+
+    # Diamond
+    _division("Diamond", "IV", 21, 60000, 69999, "#1E90FF", "#1A1A3D"),
+    _division("Diamond", "III", 22, 70000, 79999, "#1E90FF", "#1A1A3D"),
+    _division("Diamond", "II", 23, 80000, 89999, "#1E90FF", "#1A1A3D"),
+    _division("Diamond", "I", 24, 90000, 99999, "#1E90FF", "#1A1A3D"),
+
+    # Master
+    _division("Master", "", 25, 100000, 149999, "#9370DB", "#3D1A3D"),
+
+    # Grandmaster
+    _division("Grandmaster", "", 26, 150000, 199999, "#FF1493", "#3D1A2A"),
+
+    # Challenger
+    _division("Challenger", "", 27, 200000, 999999999, "#FF6347", "#3D2A1A"),
+)
+
+RANK_THRESHOLDS = tuple(rank["min_xp"] for rank in RANK_LADDER)
+_THRESHOLDS_ARRAY = np.array(RANK_THRESHOLDS, dtype=np.int64)
+
+class RankChange(NamedTuple):
+    old_rank: dict
+    new_rank: dict
+
+def rank_index(total_xp: int) -> int:
+    """Index into RANK_LADDER for the given XP; anything below zero is Iron IV."""
+    return max(bisect_right(RANK_THRESHOLDS, total_xp) - 1, 0)
+
+def rank_at(index: int) -> dict:
+    """A fresh, mutable copy of the ladder entry, safe to embed in documents."""
+    return dict(RANK_LADDER[index])
+
+def get_rank_by_xp(total_xp: int) -> dict:
+    """Calculate rank based on total XP."""
+    return rank_at(rank_index(total_xp))
+
+def bulk_rank_indices(total_xp: np.ndarray) -> np.ndarray:
+    """Vectorized rank_index over an array of XP values."""
+    indices = np.searchsorted(_THRESHOLDS_ARRAY, np.asarray(total_xp), side="right") - 1
+    return np.clip(indices, 0, None)
+
+def detect_rank_change(old_xp: int, new_xp: int) -> Optional[RankChange]:
+    """Return the old and new ranks if moving from old_xp to new_xp crosses a division."""
+    old_index = rank_index(old_xp)
+    new_index = rank_index(new_xp)
+    if old_index == new_index:
+        return None
+    return RankChange(old_rank=rank_at(old_index), new_rank=rank_at(new_index))
@@ -0,0 +1,79 @@
+"""
+In-memory token bucket rate limiting for the authentication endpoints.
+"""
+from fastapi import HTTPException, Request, status
+from collections import OrderedDict
+from typing import Tuple
+import math
+import os
+import time
+
+LOGIN_IP_RATE_PER_MINUTE = float(os.getenv("LOGIN_IP_RATE_PER_MINUTE", "30"))
+LOGIN_IP_BURST = int(os.getenv("LOGIN_IP_BURST", "10"))
+LOGIN_EMAIL_RATE_PER_MINUTE = float(os.getenv("LOGIN_EMAIL_RATE_PER_MINUTE", "10"))
+LOGIN_EMAIL_BURST = int(os.getenv("LOGIN_EMAIL_BURST", "5"))
+REGISTER_IP_RATE_PER_MINUTE = float(os.getenv("REGISTER_IP_RATE_PER_MINUTE", "10"))
+REGISTER_IP_BURST = int(os.getenv("REGISTER_IP_BURST", "5"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# Set to true only behind a proxy such as Render's, where the client address is the
+# last X-Forwarded-For hop; without one, clients could pick their own rate limit key
+TRUST_PROXY_HEADERS = os.getenv("TRUST_PROXY_HEADERS", "false").lower() == "true"
+
+class TokenBucketLimiter:
+    """Token buckets keyed by an arbitrary string, refilled continuously."""
+
+    def __init__(self, rate_per_minute: float, burst: int, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.rejected = 0
+
+    def acquire(self, key: str) -> float:
+        """Take a token for key; return 0 if allowed, else seconds until one is available."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+
+        if tokens >= 1:
+            retry_after = 0.0
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / self.rate
+            self.rejected += 1
+
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        # Least recently seen keys are the ones closest to a full bucket anyway
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+login_ip_limiter = TokenBucketLimiter(LOGIN_IP_RATE_PER_MINUTE, LOGIN_IP_BURST)
+login_email_limiter = TokenBucketLimiter(LOGIN_EMAIL_RATE_PER_MINUTE, LOGIN_EMAIL_BURST)
+register_ip_limiter = TokenBucketLimiter(REGISTER_IP_RATE_PER_MINUTE, REGISTER_IP_BURST)
+
+def get_client_ip(request: Request) -> str:
+    if TRUST_PROXY_HEADERS:
+        forwarded_for = request.headers.get("x-forwarded-for")
+        if forwarded_for:
+            return forwarded_for.split(",")[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+def enforce_rate_limit(limiter: TokenBucketLimiter, key: str):
+    """Raise a 429 with Retry-After if key has exhausted its bucket."""
+    retry_after = limiter.acquire(key)
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, please try again later",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+def rate_limit_stats() -> dict:
+    return {
+        "login_ip_rejected": login_ip_limiter.rejected,
+        "login_email_rejected": login_email_limiter.rejected,
+        "register_ip_rejected": register_ip_limiter.rejected
+    }
@@ -0,0 +1,140 @@
+"""
+Bulk re-rank job for Galactic Quest.
+
+Recomputes every user's current_rank from total_xp after the rank ladder
+changes. Users are streamed in _id order with a narrow projection, ranked in
+vectorized batches, and only stale ranks are written back. Progress is
+checkpointed in the job_checkpoints collection so an interrupted run resumes
+where it stopped.
+
+Usage: python rerank.py [--chunk-size 1000] [--restart]
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from datetime import datetime
+from pathlib import Path
+from dotenv import load_dotenv
+import argparse
+import asyncio
+import hashlib
+import logging
+import time
+import numpy as np
+from ranks import RANK_LADDER, bulk_rank_indices, rank_at
+
+CHECKPOINT_ID = "rerank-users"
+DEFAULT_CHUNK_SIZE = 1000
+
+def ladder_fingerprint() -> str:
+    """Identifies the ladder a checkpoint was made against."""
+    return hashlib.sha1(repr([sorted(rank.items()) for rank in RANK_LADDER]).encode()).hexdigest()
+
+async def _write_chunk(db: AsyncIOMotorDatabase, chunk: list) -> int:
+    """Rank one chunk of users and write back the ones whose rank changed."""
+    xp = np.fromiter((user.get("total_xp", 0) for user in chunk), dtype=np.int64, count=len(chunk))
+    indices = bulk_rank_indices(xp)
+    now = datetime.utcnow()
+
+    operations = []
+    for user, index in zip(chunk, indices.tolist()):
+        new_rank = rank_at(index)
+        if user.get("current_rank") != new_rank:
+            # A concurrent log may have changed total_xp and the rank since the read; leave those to it
+            operations.append(UpdateOne(
+                {"_id": user["_id"], "total_xp": user.get("total_xp")},
+                {"$set": {"current_rank": new_rank, "updated_at": now}}
+            ))
+
+    if operations:
+        await db.users.bulk_write(operations, ordered=False)
+    return len(operations)
+
+async def rerank_users(db: AsyncIOMotorDatabase, chunk_size: int = DEFAULT_CHUNK_SIZE, restart: bool = False) -> dict:
+    """Re-rank all users, resuming from the last checkpoint unless restart is set."""
+    fingerprint = ladder_fingerprint()
+    checkpoint = await db.job_checkpoints.find_one({"_id": CHECKPOINT_ID})
+
+    if restart or checkpoint is None or checkpoint.get("ladder") != fingerprint:
+        checkpoint = {
+            "_id": CHECKPOINT_ID,
+            "ladder": fingerprint,
+            "last_id": None,
+            "processed": 0,
+            "updated": 0,
+            "completed": False,
+            "started_at": datetime.utcnow()
+        }
+        await db.job_checkpoints.replace_one({"_id": CHECKPOINT_ID}, checkpoint, upsert=True)
+    elif checkpoint.get("completed"):
+        logging.info("Re-rank already completed for the current ladder")
+        return checkpoint
+
+    query = {"_id": {"$gt": checkpoint["last_id"]}} if checkpoint["last_id"] is not None else {}
+    cursor = db.users.find(query, {"total_xp": 1, "current_rank": 1}).sort("_id", 1).batch_size(chunk_size)
+
+    started = time.perf_counter()
+    processed = 0
+    chunk = []
+
+    async def commit(chunk):
+        nonlocal processed
+        updated = await _write_chunk(db, chunk)
+        processed += len(chunk)
+        checkpoint["last_id"] = chunk[-1]["_id"]
+        checkpoint["processed"] += len(chunk)
+        checkpoint["updated"] += updated
+        await db.job_checkpoints.update_one(
+            {"_id": CHECKPOINT_ID},
+            {"$set": {
+                "last_id": checkpoint["last_id"],
+                "processed": checkpoint["processed"],
+                "updated": checkpoint["updated"],
+                "checkpointed_at": datetime.utcnow()
+            }}
+        )
+        elapsed = time.perf_counter() - started
+        logging.info(
+            f"Re-ranked {checkpoint['processed']} users ({checkpoint['updated']} changed), "
+            f"{processed / elapsed if elapsed else 0:.0f} users/sec"
+        )
+
+    async for user in cursor:
+        chunk.append(user)
+        if len(chunk) >= chunk_size:
+            await commit(chunk)
+            chunk = []
+    if chunk:
+        await commit(chunk)
+
+    elapsed = time.perf_counter() - started
+    checkpoint["completed"] = True
+    checkpoint["users_per_second"] = processed / elapsed if elapsed else 0.0
+    await db.job_checkpoints.update_one(
+        {"_id": CHECKPOINT_ID},
+        {"$set": {
+            "completed": True,
+            "completed_at": datetime.utcnow(),
+            "users_per_second": checkpoint["users_per_second"]
+        }}
+    )
+    logging.info(f"Re-rank finished: {processed} users in {elapsed:.1f}s ({checkpoint['users_per_second']:.0f} users/sec)")
+    return checkpoint
+
+async def main(chunk_size: int, restart: bool):
+    from database import connect_to_mongo, close_mongo_connection, get_database
+    await connect_to_mongo()
+    try:
+        await rerank_users(await get_database(), chunk_size=chunk_size, restart=restart)
+    finally:
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Recompute every user's rank from total_xp")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--restart", action="store_true", help="ignore any existing checkpoint")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.chunk_size, args.restart))
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Query, Request, status
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from dotenv import load_dotenv
@@ -12,10 +12,29 @@ from typing import List, Optional, Dict
 
 # Import our new modules
 from database import connect_to_mongo, close_mongo_connection, get_database
-from auth import AuthService, get_current_user
+from auth import AuthService, get_current_user, get_current_user_claims, password_hasher, token_cache
+from activity import activity_tracker
+from jobs import side_effects
+from idempotency import idempotency_store
+from catalog import CATALOGS, catalog_cache, catalog_response
+from user_cache import user_cache
+from leaderboard_index import leaderboard_index
+from leaderboard_snapshots import (
+    LeaderboardSnapshots, leaderboard_response, leaderboard_snapshots, skill_snapshots, windowed_snapshots
+)
+from windowed_leaderboards import PERIODS, windowed_boards
+from skill_leaderboards import DIFFICULTIES, skill_boards
+from ranks import get_rank_by_xp
+from streaks import EMPTY_STREAK, effective_current_streak, user_streak_fields, user_streak_state
+from importer import IMPORT_FORMATS, import_time_logs as import_time_log_stream
+from rate_limit import (
+    enforce_rate_limit, get_client_ip, login_email_limiter, login_ip_limiter,
+    rate_limit_stats, register_ip_limiter
+)
 from services import (
     SkillService, CategoryService, TimeLogService, LeaderboardService, 
-    AchievementService, QuestService, UserSettingsService
+    AchievementService, QuestService, UserSettingsService, ScoredLeaderboardService, WindowedXPService,
+    XPTotalsService, parse_leaderboard_cursor
 )
 from models import *
 
@@ -48,6 +67,13 @@ async def startup_db_client():
         db = await get_database()
         await initialize_default_data(db)
         
+        activity_tracker.start(db)
+        side_effects.start(db)
+        await catalog_cache.start(db)
+        await leaderboard_index.start(db)
+        await windowed_boards.start(db)
+        skill_boards.start(db)
+        
         logging.info("Connected to MongoDB and initialized default data")
     except Exception as e:
         logging.error(f"Failed to start application: {e}")
@@ -56,12 +82,22 @@ async def startup_db_client():
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await skill_boards.stop()
+    await windowed_boards.stop()
+    await leaderboard_index.stop()
+    await catalog_cache.stop()
+    await side_effects.stop()
+    await activity_tracker.stop()
+    password_hasher.shutdown()
     await close_mongo_connection()
     logging.info("Disconnected from MongoDB")
 
 # Auth routes
 @api_router.post("/auth/register", response_model=UserResponse)
-async def register(user_data: UserCreate, db=Depends(get_database)):
+async def register(user_data: UserCreate, request: Request, db=Depends(get_database)):
+    enforce_rate_limit(register_ip_limiter, get_client_ip(request))
+    password_hasher.ensure_capacity()
+    
     auth_service = AuthService(db)
     return await auth_service.register_user(
         username=user_data.username,
@@ -71,7 +107,11 @@ async def register(user_data: UserCreate, db=Depends(get_database)):
     )
 
 @api_router.post("/auth/login", response_model=UserResponse)
-async def login(user_data: UserLogin, db=Depends(get_database)):
+async def login(user_data: UserLogin, request: Request, db=Depends(get_database)):
+    enforce_rate_limit(login_ip_limiter, get_client_ip(request))
+    enforce_rate_limit(login_email_limiter, user_data.email.lower())
+    password_hasher.ensure_capacity()
+    
     auth_service = AuthService(db)
     return await auth_service.authenticate_user(user_data.email, user_data.password)
 
@@ -90,6 +130,12 @@ async def get_current_user_profile(current_user=Depends(get_current_user)):
         use_predefined_categories=current_user.get("use_predefined_categories", True)
     )
 
+@api_router.post("/auth/logout-all", response_model=MessageResponse)
+async def logout_all_sessions(current_user=Depends(get_current_user), db=Depends(get_database)):
+    """Revoke every access token issued to the current user."""
+    await AuthService(db).revoke_tokens(current_user["_id"])
+    return MessageResponse(message="All sessions have been logged out")
+
 @api_router.post("/auth/reset-user-data", response_model=MessageResponse)
 async def reset_user_data(
     current_user=Depends(get_current_user),
@@ -105,19 +151,24 @@ async def reset_user_data(
         await db.time_logs.delete_many({"user_id": user_id})
         await db.user_achievements.delete_many({"user_id": user_id})
         await db.user_quests.delete_many({"user_id": user_id})
+        await db.user_activity.delete_many({"user_id": user_id})
+        await db.activity_days.delete_one({"_id": user_id})
+        await db.side_effect_jobs.delete_many({"user_id": user_id})
+        await db.achievement_stats.delete_one({"_id": user_id})
         
         # Reset user stats
-        await db.users.update_one(
-            {"_id": user_id},
-            {
-                "$set": {
-                    "total_xp": 0,
-                    "total_time_minutes": 0,
-                    "current_rank": AuthService(db).get_rank_by_xp(0),
-                    "updated_at": datetime.utcnow()
-                }
-            }
-        )
+        reset_stats = {
+            "total_xp": 0,
+            "total_time_minutes": 0,
+            "current_rank": get_rank_by_xp(0),
+            **user_streak_fields(EMPTY_STREAK),
+            "updated_at": datetime.utcnow()
+        }
+        await db.users.update_one({"_id": user_id}, {"$set": reset_stats})
+        user_cache.update(user_id, reset_stats)
+        await WindowedXPService(db).forget(user_id)
+        await XPTotalsService(db).forget(user_id)
+        leaderboard_index.set(user_id, 0)
         
         # Re-initialize default data for the user
         from init_data import initialize_user_default_data
@@ -156,14 +207,13 @@ async def update_user_settings(
 
 # Category routes
 @api_router.get("/categories", response_model=List[Category])
-async def get_categories(current_user=Depends(get_current_user), db=Depends(get_database)):
+async def get_categories(current_user=Depends(get_current_user_claims), db=Depends(get_database)):
     category_service = CategoryService(db)
     return await category_service.get_user_categories(current_user["_id"])
 
 @api_router.get("/categories/predefined", response_model=List[PredefinedCategory])
-async def get_predefined_categories(db=Depends(get_database)):
-    category_service = CategoryService(db)
-    return await category_service.get_predefined_categories()
+async def get_predefined_categories(request: Request, db=Depends(get_database)):
+    return await catalog_response(request, db, "predefined_categories")
 
 @api_router.post("/categories", response_model=Category)
 async def create_category(
@@ -188,7 +238,7 @@ async def delete_category(
 
 # Skill routes
 @api_router.get("/skills", response_model=List[Skill])
-async def get_skills(current_user=Depends(get_current_user), db=Depends(get_database)):
+async def get_skills(current_user=Depends(get_current_user_claims), db=Depends(get_database)):
     skill_service = SkillService(db)
     return await skill_service.get_user_skills(current_user["_id"])
 
@@ -227,35 +277,56 @@ async def delete_skill(
     return MessageResponse(message="Skill deleted successfully")
 
 # Time logging routes
-@api_router.post("/time-logs", response_model=TimeLog)
+@api_router.post("/time-logs", response_model=TimeLogResult)
 async def log_time(
     time_log_data: TimeLogCreate,
+    idempotency_key: Optional[str] = Header(None),
     current_user=Depends(get_current_user),
     db=Depends(get_database)
 ):
     time_log_service = TimeLogService(db)
     
-    # Log the time and get the updated skill and user data
-    time_log = await time_log_service.log_time(current_user["_id"], time_log_data)
-    
-    # Get updated user data to return current rank and XP
-    updated_user = await db.users.find_one({"_id": current_user["_id"]})
+    async def execute():
+        # Log the time; the service returns the user's updated totals and rank for live updates
+        time_log, user_data = await time_log_service.log_time(current_user["_id"], time_log_data)
+        return TimeLogResult(**time_log.dict(), user_data=user_data)
     
-    # Add user data to the response for live updates
-    time_log_dict = time_log.dict() if hasattr(time_log, 'dict') else time_log
-    time_log_dict["user_data"] = {
-        "total_xp": updated_user["total_xp"],
-        "current_rank": updated_user["current_rank"],
-        "total_time_minutes": updated_user.get("total_time_minutes", 0)
-    }
+    # Retries carrying the same Idempotency-Key replay the first response instead of logging twice
+    return await idempotency_store.run(
+        db, current_user["_id"], "POST /time-logs", idempotency_key, time_log_data, execute
+    )
+
+@api_router.post("/time-logs/batch", response_model=TimeLogBatchResult)
+async def log_time_batch(
+    batch: TimeLogBatchCreate,
+    current_user=Depends(get_current_user),
+    db=Depends(get_database)
+):
+    time_log_service = TimeLogService(db)
+    return await time_log_service.log_time_batch(current_user["_id"], batch.entries)
+
+@api_router.post("/time-logs/import", response_model=TimeLogImportResult)
+async def import_time_logs(
+    request: Request,
+    format: str = "csv",
+    current_user=Depends(get_current_user),
+    db=Depends(get_database)
+):
+    """Stream a CSV or NDJSON body of historical time logs, with optional backdated logged_at."""
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format, expected one of {', '.join(IMPORT_FORMATS)}")
     
-    return time_log_dict
+    try:
+        summary = await import_time_log_stream(db, current_user["_id"], request.stream(), format)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Import file must be UTF-8 encoded; rows before the invalid line were imported")
+    return TimeLogImportResult(**summary)
 
 @api_router.get("/time-logs", response_model=List[TimeLog])
 async def get_time_logs(
     skill_id: Optional[str] = None,
     limit: int = 50,
-    current_user=Depends(get_current_user),
+    current_user=Depends(get_current_user_claims),
     db=Depends(get_database)
 ):
     time_log_service = TimeLogService(db)
@@ -264,17 +335,97 @@ async def get_time_logs(
 # Leaderboard routes
 @api_router.get("/leaderboard", response_model=LeaderboardResponse)
 async def get_leaderboard(
+    request: Request,
     limit: int = 50,
-    current_user=Depends(get_current_user),
+    current_user=Depends(get_current_user_claims),
     db=Depends(get_database)
 ):
     leaderboard_service = LeaderboardService(db)
+    if 0 < limit <= leaderboard_snapshots.size:
+        return await leaderboard_response(request, current_user["_id"], limit, leaderboard_service, leaderboard_snapshots)
     return await leaderboard_service.get_leaderboard(current_user["_id"], limit)
 
+LEADERBOARD_MAX_PAGE = 100
+
+@api_router.get("/leaderboard/around-me", response_model=LeaderboardWindow)
+async def get_leaderboard_around_me(
+    radius: int = Query(5, ge=0, le=LEADERBOARD_MAX_PAGE // 2),
+    current_user=Depends(get_current_user_claims),
+    db=Depends(get_database)
+):
+    leaderboard_service = LeaderboardService(db)
+    return await leaderboard_service.get_around_user(current_user["_id"], radius)
+
+@api_router.get("/leaderboard/page", response_model=LeaderboardWindow)
+async def get_leaderboard_page(
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=LEADERBOARD_MAX_PAGE),
+    current_user=Depends(get_current_user_claims),
+    db=Depends(get_database)
+):
+    """Keyset paging: pass a window's next_cursor as after, or its prev_cursor as before."""
+    if after is not None and before is not None:
+        raise HTTPException(status_code=400, detail="Pass either after or before, not both")
+    try:
+        after_key = parse_leaderboard_cursor(after) if after is not None else None
+        before_key = parse_leaderboard_cursor(before) if before is not None else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid leaderboard cursor")
+    leaderboard_service = LeaderboardService(db)
+    return await leaderboard_service.get_window(current_user["_id"], limit, after_key, before_key)
+
+@api_router.get("/leaderboard/{period}", response_model=WindowedLeaderboardResponse)
+async def get_windowed_leaderboard(
+    period: str,
+    request: Request,
+    limit: int = Query(50, ge=1, le=LEADERBOARD_MAX_PAGE),
+    current_user=Depends(get_current_user_claims),
+    db=Depends(get_database)
+):
+    """XP earned today, this ISO week or this month (period daily, weekly or monthly)."""
+    if period not in PERIODS:
+        raise HTTPException(status_code=404, detail="Leaderboard not found")
+    board = await windowed_boards.board(db, period)
+    leaderboard_service = ScoredLeaderboardService(db, board.index)
+    extra = {"period": period, "key": board.key, "ends_at": board.ends_at}
+    snapshots = windowed_snapshots[period]
+    if limit <= snapshots.size:
+        return await leaderboard_response(request, current_user["_id"], limit, leaderboard_service, snapshots, extra)
+    leaderboard = await leaderboard_service.get_leaderboard(current_user["_id"], limit)
+    return WindowedLeaderboardResponse(**leaderboard.dict(), **extra)
+
+@api_router.get("/leaderboard/{dimension}/{key}", response_model=SkillLeaderboardResponse)
+async def get_skill_leaderboard(
+    dimension: str,
+    key: str,
+    request: Request,
+    limit: int = Query(50, ge=1, le=LEADERBOARD_MAX_PAGE),
+    current_user=Depends(get_current_user_claims),
+    db=Depends(get_database)
+):
+    """XP logged in a predefined category (dimension category, key its id) or at a difficulty."""
+    if dimension == "category":
+        predefined = await catalog_cache.get(db, "predefined_categories")
+        known = key in predefined.by_id
+    else:
+        known = dimension == "difficulty" and key in DIFFICULTIES
+    if not known:
+        raise HTTPException(status_code=404, detail="Leaderboard not found")
+    
+    board = await skill_boards.board(db, dimension, key)
+    leaderboard_service = ScoredLeaderboardService(db, board.index)
+    extra = {"dimension": dimension, "key": key}
+    snapshots = skill_snapshots.setdefault((dimension, key), LeaderboardSnapshots())
+    if limit <= snapshots.size:
+        return await leaderboard_response(request, current_user["_id"], limit, leaderboard_service, snapshots, extra)
+    leaderboard = await leaderboard_service.get_leaderboard(current_user["_id"], limit)
+    return SkillLeaderboardResponse(**leaderboard.dict(), **extra)
+
 # Achievement routes
 @api_router.get("/achievements", response_model=List[Dict])
 async def get_achievements(
-    current_user=Depends(get_current_user),
+    current_user=Depends(get_current_user_claims),
     db=Depends(get_database)
 ):
     achievement_service = AchievementService(db)
@@ -283,7 +434,7 @@ async def get_achievements(
 # Quest routes
 @api_router.get("/quests", response_model=Dict)
 async def get_user_quests(
-    current_user=Depends(get_current_user),
+    current_user=Depends(get_current_user_claims),
     db=Depends(get_database)
 ):
     quest_service = QuestService(db)
@@ -292,28 +443,35 @@ async def get_user_quests(
 @api_router.post("/quests/{quest_id}/claim", response_model=Dict)
 async def claim_quest_reward(
     quest_id: str,
+    idempotency_key: Optional[str] = Header(None),
     current_user=Depends(get_current_user),
     db=Depends(get_database)
 ):
     quest_service = QuestService(db)
-    success = await quest_service.claim_quest_reward(current_user["_id"], quest_id)
-    if not success:
-        raise HTTPException(
-            status_code=400, 
-            detail="Quest not found, not completed, or already claimed"
-        )
     
-    # Get updated user data after claiming reward
-    updated_user = await db.users.find_one({"_id": current_user["_id"]})
-    
-    return {
-        "message": "Quest reward claimed successfully!",
-        "user_data": {
-            "total_xp": updated_user["total_xp"],
-            "current_rank": updated_user["current_rank"],
-            "total_time_minutes": updated_user.get("total_time_minutes", 0)
+    async def execute():
+        success = await quest_service.claim_quest_reward(current_user["_id"], quest_id)
+        if not success:
+            raise HTTPException(
+                status_code=400, 
+                detail="Quest not found, not completed, or already claimed"
+            )
+        
+        # Get updated user data after claiming reward
+        updated_user = await db.users.find_one({"_id": current_user["_id"]})
+        
+        return {
+            "message": "Quest reward claimed successfully!",
+            "user_data": {
+                "total_xp": updated_user["total_xp"],
+                "current_rank": updated_user["current_rank"],
+                "total_time_minutes": updated_user.get("total_time_minutes", 0)
+            }
         }
-    }
+    
+    return await idempotency_store.run(
+        db, current_user["_id"], f"POST /quests/{quest_id}/claim", idempotency_key, None, execute
+    )
 
 # Stats routes
 @api_router.get("/stats/user", response_model=Dict)
@@ -333,19 +491,27 @@ async def get_user_stats(
     total_time = sum(skill.total_time_minutes for skill in skills)
     total_xp = sum(skill.total_xp for skill in skills)
     
-    # Calculate current streak (simplified)
-    current_streak = max([skill.streak for skill in skills], default=0)
+    streak = user_streak_state(current_user)
     
     return {
         "total_skills": total_skills,
         "total_time_minutes": total_time,
         "total_xp": total_xp,
-        "current_streak": current_streak,
+        "current_streak": effective_current_streak(streak),
+        "longest_streak": streak.longest,
         "total_logs": len(time_logs),
         "avg_xp_per_skill": total_xp / total_skills if total_skills > 0 else 0,
         "avg_time_per_skill": total_time / total_skills if total_skills > 0 else 0
     }
 
+# Catalog routes
+@api_router.get("/catalog/{name}")
+async def get_catalog(name: str, request: Request, db=Depends(get_database)):
+    """Shared achievements, predefined categories or quest templates, cacheable by ETag."""
+    if name not in CATALOGS:
+        raise HTTPException(status_code=404, detail="Catalog not found")
+    return await catalog_response(request, db, name)
+
 # Health check route
 @api_router.get("/")
 async def root():
@@ -353,7 +519,27 @@ async def root():
 
 @api_router.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.utcnow()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.utcnow(),
+        "user_cache": user_cache.stats(),
+        "token_cache": token_cache.stats(),
+        "side_effects": side_effects.stats(),
+        "idempotency": idempotency_store.stats(),
+        "catalogs": catalog_cache.stats(),
+        "leaderboard_index": leaderboard_index.stats(),
+        "leaderboard_snapshots": leaderboard_snapshots.stats(),
+        "windowed_leaderboards": {
+            **windowed_boards.stats(),
+            "snapshots": {period: snapshots.stats() for period, snapshots in windowed_snapshots.items()}
+        },
+        "skill_leaderboards": skill_boards.stats(),
+        "auth_admission": {
+            **rate_limit_stats(),
+            "password_checks_in_flight": password_hasher.pending,
+            "password_checks_rejected": password_hasher.rejected
+        }
+    }
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -1,9 +1,25 @@
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+import asyncio
+import logging
 import uuid
 from models import *
-from auth import AuthService
+from ranks import detect_rank_change, get_rank_by_xp
+from streaks import (
+    StreakService, advance, day_number, effective_current_streak,
+    skill_streak_fields, skill_streak_state, user_streak_fields, user_streak_state
+)
+from user_cache import user_cache
+from jobs import side_effects
+from achievements import ALL_INPUTS, ENTRY_SKILL_FIELDS, apply_event, evaluate, log_entry
+from catalog import catalog_cache
+from idempotency import mark_committed
+from leaderboard_index import LeaderboardIndex, leaderboard_index
+from windowed_leaderboards import PERIODS, WINDOWED_XP_GRACE_SECONDS, bucket_id, period_window, windowed_boards
+from skill_leaderboards import predefined_categories_of, skill_boards, totals_id
 
 class SkillService:
     def __init__(self, db: AsyncIOMotorDatabase):
@@ -24,6 +40,8 @@ class SkillService:
             "total_time_minutes": 0,
             "total_xp": 0,
             "streak": 0,
+            "longest_streak": 0,
+            "last_active_day": None,
             "last_logged_at": None,
             "user_id": user_id,
             "created_at": now,
@@ -36,8 +54,10 @@ class SkillService:
     async def get_user_skills(self, user_id: str) -> List[Skill]:
         """Get all skills for a user."""
         cursor = self.db.skills.find({"user_id": user_id}).sort("created_at", 1)
+        today = day_number(datetime.utcnow())
         skills = []
         async for skill_doc in cursor:
+            skill_doc["streak"] = effective_current_streak(skill_streak_state(skill_doc), today)
             skills.append(Skill(**skill_doc, id=skill_doc["_id"]))
         return skills
     
@@ -49,14 +69,25 @@ class SkillService:
         
         update_data["updated_at"] = datetime.utcnow()
         
-        result = await self.db.skills.update_one(
+        old_skill = await self.db.skills.find_one_and_update(
             {"_id": skill_id, "user_id": user_id},
-            {"$set": update_data}
+            {"$set": update_data},
+            projection={**ENTRY_SKILL_FIELDS, "total_xp": 1},
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result.modified_count == 0:
+        if old_skill is None:
             return None
         
+        new_difficulty = skill_data.difficulty.value if skill_data.difficulty else old_skill["difficulty"]
+        if new_difficulty != old_skill["difficulty"] and old_skill.get("total_xp"):
+            # The difficulty boards count a skill's XP under its current difficulty
+            new_skill = {**old_skill, "difficulty": new_difficulty}
+            await XPTotalsService(self.db).record(user_id, [
+                log_entry(old_skill, 0, -old_skill["total_xp"]),
+                log_entry(new_skill, 0, old_skill["total_xp"])
+            ])
+        
         skill_doc = await self.db.skills.find_one({"_id": skill_id})
         return Skill(**skill_doc, id=skill_doc["_id"]) if skill_doc else None
     
@@ -66,8 +97,15 @@ class SkillService:
         await self.db.time_logs.delete_many({"skill_id": skill_id, "user_id": user_id})
         
         # Delete the skill
-        result = await self.db.skills.delete_one({"_id": skill_id, "user_id": user_id})
-        return result.deleted_count > 0
+        skill = await self.db.skills.find_one_and_delete(
+            {"_id": skill_id, "user_id": user_id}, projection={**ENTRY_SKILL_FIELDS, "total_xp": 1}
+        )
+        if skill is not None:
+            await StreakService(self.db).forget_skills(user_id, [skill_id])
+            # The category and difficulty boards only count XP of skills the user still has
+            if skill.get("total_xp"):
+                await XPTotalsService(self.db).record(user_id, [log_entry(skill, 0, -skill["total_xp"])])
+        return skill is not None
 
 class CategoryService:
     def __init__(self, db: AsyncIOMotorDatabase):
@@ -93,20 +131,59 @@ class CategoryService:
         return Category(**category_doc, id=category_id)
     
     async def get_user_categories(self, user_id: str) -> List[Category]:
-        """Get all categories for a user."""
-        cursor = self.db.categories.find({"user_id": user_id}).sort("created_at", 1)
+        """Get all categories for a user.
+        
+        Predefined categories are overlaid from the shared collection unless the
+        user turned them off or has a materialized copy of their own.
+        """
+        use_predefined, own_docs, predefined = await asyncio.gather(
+            self._uses_predefined_categories(user_id),
+            self.db.categories.find({"user_id": user_id}).sort("created_at", 1).to_list(None),
+            catalog_cache.get(self.db, "predefined_categories")
+        )
+        
         categories = []
-        async for category_doc in cursor:
+        if use_predefined:
+            # Materialized copies carry predefined_id; legacy per-user copies only match by name
+            overridden = set()
+            for category_doc in own_docs:
+                if category_doc.get("predefined_id"):
+                    overridden.add(category_doc["predefined_id"])
+                elif category_doc.get("is_predefined"):
+                    overridden.add(category_doc["name"])
+            
+            for predefined_doc in predefined.docs:
+                if predefined_doc["_id"] in overridden or predefined_doc["name"] in overridden:
+                    continue
+                categories.append(Category(
+                    id=predefined_doc["_id"],
+                    name=predefined_doc["name"],
+                    icon=predefined_doc["icon"],
+                    color=predefined_doc["color"],
+                    description=predefined_doc["description"],
+                    user_id=user_id,
+                    is_predefined=True,
+                    created_at=predefined_doc["created_at"]
+                ))
+        
+        for category_doc in own_docs:
+            if category_doc.get("hidden"):
+                continue
+            if not use_predefined and category_doc.get("is_predefined"):
+                continue
             categories.append(Category(**category_doc, id=category_doc["_id"]))
         return categories
     
+    async def _uses_predefined_categories(self, user_id: str) -> bool:
+        user = user_cache.get(user_id)
+        if user is None:
+            user = await self.db.users.find_one({"_id": user_id}, {"use_predefined_categories": 1}) or {}
+        return user.get("use_predefined_categories", True)
+    
     async def get_predefined_categories(self) -> List[PredefinedCategory]:
         """Get all predefined categories."""
-        cursor = self.db.predefined_categories.find({}).sort("created_at", 1)
-        categories = []
-        async for category_doc in cursor:
-            categories.append(PredefinedCategory(**category_doc, id=category_doc["_id"]))
-        return categories
+        catalog = await catalog_cache.get(self.db, "predefined_categories")
+        return [PredefinedCategory(**category_doc, id=category_doc["_id"]) for category_doc in catalog.docs]
     
     async def delete_category(self, user_id: str, category_id: str) -> bool:
         """Delete a category and all its associated skills and time logs."""
@@ -120,15 +197,36 @@ class CategoryService:
         
         # Delete all skills in this category
         await self.db.skills.delete_many({"category_id": category_id, "user_id": user_id})
+        await StreakService(self.db).forget_skills(user_id, skill_ids)
         
         # Delete the category
         result = await self.db.categories.delete_one({"_id": category_id, "user_id": user_id})
-        return result.deleted_count > 0
+        if result.deleted_count > 0:
+            return True
+        
+        # A shared predefined category is hidden by materializing a hidden per-user copy
+        catalog = await catalog_cache.get(self.db, "predefined_categories")
+        if category_id not in catalog.by_id:
+            return False
+        
+        await self.db.categories.update_one(
+            {"user_id": user_id, "predefined_id": category_id},
+            {
+                "$set": {"hidden": True},
+                "$setOnInsert": {
+                    "_id": str(uuid.uuid4()),
+                    "name": catalog.by_id[category_id]["name"],
+                    "is_predefined": True,
+                    "created_at": datetime.utcnow()
+                }
+            },
+            upsert=True
+        )
+        return True
 
 class TimeLogService:
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
-        self.auth_service = AuthService(db)
     
     def calculate_xp(self, minutes: int, difficulty: str) -> int:
         """Calculate XP based on time and difficulty."""
@@ -142,19 +240,35 @@ class TimeLogService:
         }
         return int(minutes * multipliers.get(difficulty, 1.0))
     
-    async def log_time(self, user_id: str, time_log_data: TimeLogCreate) -> TimeLog:
-        """Log time for a skill and update user stats."""
-        # Get the skill
-        skill = await self.db.skills.find_one({"_id": time_log_data.skill_id, "user_id": user_id})
+    async def log_time(self, user_id: str, time_log_data: TimeLogCreate) -> Tuple[TimeLog, Optional[Dict]]:
+        """Log time for a skill and update user stats.
+        
+        Returns the time log and the user's updated totals and rank. All totals
+        are applied with atomic $inc updates, so concurrent logs never lose time.
+        """
+        now = datetime.utcnow()
+        day = day_number(now)
+        
+        # Add the minutes to the skill; the returned document carries its difficulty and streak
+        skill = await self.db.skills.find_one_and_update(
+            {"_id": time_log_data.skill_id, "user_id": user_id},
+            {
+                "$inc": {"total_time_minutes": time_log_data.minutes},
+                "$set": {"last_logged_at": now, "updated_at": now}
+            },
+            projection={**ENTRY_SKILL_FIELDS, "last_active_day": 1, "streak": 1, "longest_streak": 1},
+            return_document=ReturnDocument.AFTER
+        )
         if not skill:
             raise HTTPException(status_code=404, detail="Skill not found")
+        # The minutes are in; from here a retry under the same Idempotency-Key would count them twice
+        mark_committed()
         
         # Calculate XP
         xp_earned = self.calculate_xp(time_log_data.minutes, skill["difficulty"])
         
         # Create time log
         time_log_id = str(uuid.uuid4())
-        now = datetime.utcnow()
         
         time_log_doc = {
             "_id": time_log_id,
@@ -166,59 +280,163 @@ class TimeLogService:
             "logged_at": now
         }
         
-        await self.db.time_logs.insert_one(time_log_doc)
+        # Streak fields are only written here, so concurrent logs compute the same new state
+        skill_update = {"$inc": {"total_xp": xp_earned}}
+        skill_streak = advance(skill_streak_state(skill), day)
+        if skill_streak:
+            skill_update["$set"] = skill_streak_fields(skill_streak)
         
-        # Update skill stats
-        new_total_time = skill["total_time_minutes"] + time_log_data.minutes
-        new_total_xp = skill["total_xp"] + xp_earned
+        # The log insert, skill XP, user totals, activity bitmap and side effect job are independent
+        entries = [log_entry(skill, time_log_data.minutes, xp_earned)]
+        _, _, user_data, _, _, _ = await asyncio.gather(
+            self.db.time_logs.insert_one(time_log_doc),
+            self.db.skills.update_one({"_id": time_log_data.skill_id}, skill_update),
+            self.update_user_stats(user_id, xp_earned, time_log_data.minutes, active_day=day),
+            StreakService(self.db).mark_days(user_id, [day], [time_log_data.skill_id]),
+            XPTotalsService(self.db).record(user_id, entries),
+            enqueue_log_effects(self.db, user_id, entries, now)
+        )
         
-        # Calculate streak (simple implementation - increment if logged today)
-        new_streak = skill["streak"] + 1
+        return TimeLog(**time_log_doc, id=time_log_id), user_data
+    
+    async def log_time_batch(self, user_id: str, entries: List[TimeLogCreate]) -> TimeLogBatchResult:
+        """Log several entries at once.
         
-        await self.db.skills.update_one(
-            {"_id": time_log_data.skill_id},
-            {
-                "$set": {
-                    "total_time_minutes": new_total_time,
-                    "total_xp": new_total_xp,
-                    "streak": new_streak,
-                    "last_logged_at": now,
-                    "updated_at": now
-                }
+        Skills are validated with one $in query and the logs inserted with one
+        insert_many. Skill and user totals are merged into one $inc per skill
+        and one for the user, and quest progress is updated once for the batch.
+        """
+        skill_ids = {entry.skill_id for entry in entries}
+        skills = {
+            skill["_id"]: skill
+            async for skill in self.db.skills.find(
+                {"_id": {"$in": list(skill_ids)}, "user_id": user_id},
+                {**ENTRY_SKILL_FIELDS, "last_active_day": 1, "streak": 1, "longest_streak": 1}
+            )
+        }
+        
+        now = datetime.utcnow()
+        day = day_number(now)
+        results = []
+        time_log_docs = []
+        skill_totals: Dict[str, Dict[str, int]] = {}
+        
+        for index, entry in enumerate(entries):
+            skill = skills.get(entry.skill_id)
+            if not skill:
+                results.append(TimeLogBatchEntryResult(index=index, success=False, error="Skill not found"))
+                continue
+            
+            xp_earned = self.calculate_xp(entry.minutes, skill["difficulty"])
+            time_log_doc = {
+                "_id": str(uuid.uuid4()),
+                "skill_id": entry.skill_id,
+                "minutes": entry.minutes,
+                "xp_earned": xp_earned,
+                "note": entry.note,
+                "user_id": user_id,
+                "logged_at": now
             }
-        )
+            time_log_docs.append(time_log_doc)
+            results.append(TimeLogBatchEntryResult(
+                index=index, success=True, time_log=TimeLog(**time_log_doc, id=time_log_doc["_id"])
+            ))
+            
+            totals = skill_totals.setdefault(entry.skill_id, {"total_time_minutes": 0, "total_xp": 0})
+            totals["total_time_minutes"] += entry.minutes
+            totals["total_xp"] += xp_earned
         
-        # Update user total XP and rank
-        await self.update_user_stats(user_id, xp_earned, time_log_data.minutes)
+        if not time_log_docs:
+            return TimeLogBatchResult(results=results, logged=0, failed=len(results))
         
-        # Update quest progress
-        quest_service = QuestService(self.db)
-        await quest_service.update_quest_progress(user_id, time_log_data.skill_id, time_log_data.minutes)
+        total_minutes = sum(doc["minutes"] for doc in time_log_docs)
+        total_xp = sum(doc["xp_earned"] for doc in time_log_docs)
+        skill_updates = []
+        for skill_id, totals in skill_totals.items():
+            skill_set = {"last_logged_at": now, "updated_at": now}
+            skill_streak = advance(skill_streak_state(skills[skill_id]), day)
+            if skill_streak:
+                skill_set.update(skill_streak_fields(skill_streak))
+            skill_updates.append(UpdateOne({"_id": skill_id}, {"$inc": totals, "$set": skill_set}))
         
-        return TimeLog(**time_log_doc, id=time_log_id)
-    
-    async def update_user_stats(self, user_id: str, xp_earned: int, minutes_logged: int):
-        """Update user's total XP, time, and rank."""
-        user = await self.db.users.find_one({"_id": user_id})
-        if not user:
-            return
+        log_entries = [
+            log_entry(skills[skill_id], totals["total_time_minutes"], totals["total_xp"])
+            for skill_id, totals in skill_totals.items()
+        ]
+        _, _, user_data, _, _, _ = await asyncio.gather(
+            self.db.time_logs.insert_many(time_log_docs, ordered=False),
+            self.db.skills.bulk_write(skill_updates, ordered=False),
+            self.update_user_stats(user_id, total_xp, total_minutes, active_day=day),
+            StreakService(self.db).mark_days(user_id, [day], skill_totals),
+            XPTotalsService(self.db).record(user_id, log_entries),
+            enqueue_log_effects(self.db, user_id, log_entries, now, logs=len(time_log_docs))
+        )
         
-        new_total_xp = user["total_xp"] + xp_earned
-        new_total_time = user.get("total_time_minutes", 0) + minutes_logged
-        new_rank = self.auth_service.get_rank_by_xp(new_total_xp)
+        return TimeLogBatchResult(
+            results=results,
+            logged=len(time_log_docs),
+            failed=len(results) - len(time_log_docs),
+            user_data=user_data
+        )
+    
+    async def update_user_stats(
+        self,
+        user_id: str,
+        xp_earned: int,
+        minutes_logged: int,
+        active_day: Optional[int] = None,
+        earned: Optional[Dict[datetime, int]] = None
+    ) -> Optional[Dict]:
+        """Add to the user's total XP and time, keep the rank and streak in step and return the new user data.
         
-        await self.db.users.update_one(
+        active_day extends the user's streak; backdated days are left to a bitmap recompute.
+        earned splits xp_earned by when it was earned for the windowed boards and defaults to all of it now.
+        """
+        now = datetime.utcnow()
+        user = await self.db.users.find_one_and_update(
             {"_id": user_id},
             {
-                "$set": {
-                    "total_xp": new_total_xp,
-                    "total_time_minutes": new_total_time,
-                    "current_rank": new_rank,
-                    "last_active": datetime.utcnow(),
-                    "updated_at": datetime.utcnow()
-                }
-            }
+                "$inc": {"total_xp": xp_earned, "total_time_minutes": minutes_logged},
+                "$set": {"last_active": now, "updated_at": now}
+            },
+            projection={
+                "total_xp": 1, "total_time_minutes": 1, "current_rank": 1,
+                "streak_last_day": 1, "current_streak": 1, "longest_streak": 1
+            },
+            return_document=ReturnDocument.AFTER
         )
+        if not user:
+            return None
+        leaderboard_index.observe(user_id, user["total_xp"])
+        
+        writes = [WindowedXPService(self.db).record(user_id, earned if earned is not None else {now: xp_earned})]
+        new_rank = get_rank_by_xp(user["total_xp"])
+        if user.get("current_rank") != new_rank:
+            # Conditional on the total we saw: if another log got in first, its writer sets the rank
+            writes.append(self.db.users.update_one(
+                {"_id": user_id, "total_xp": user["total_xp"]},
+                {"$set": {"current_rank": new_rank}}
+            ))
+        
+        streak_fields = {}
+        if active_day is not None:
+            new_streak = advance(user_streak_state(user), active_day)
+            if new_streak:
+                streak_fields = user_streak_fields(new_streak)
+                writes.append(self.db.users.update_one({"_id": user_id}, {"$set": streak_fields}))
+        
+        await asyncio.gather(*writes)
+        
+        user_data = {
+            "total_xp": user["total_xp"],
+            "current_rank": new_rank,
+            "total_time_minutes": user.get("total_time_minutes", 0)
+        }
+        user_cache.update(user_id, {**user_data, **streak_fields, "last_active": now, "updated_at": now})
+        
+        rank_change = detect_rank_change(user["total_xp"] - xp_earned, user["total_xp"])
+        user_data["rank_change"] = rank_change._asdict() if rank_change else None
+        return user_data
     
     async def get_user_time_logs(
         self, 
@@ -237,52 +455,299 @@ class TimeLogService:
             time_logs.append(TimeLog(**log_doc, id=log_doc["_id"]))
         return time_logs
 
+# Leaderboard order, matching the (total_xp, _id) users index and the in-process index
+LEADERBOARD_SORT = [("total_xp", -1), ("_id", 1)]
+
+def leaderboard_cursor(total_xp: int, user_id: str) -> str:
+    return f"{total_xp}:{user_id}"
+
+def parse_leaderboard_cursor(cursor: str) -> Tuple[int, str]:
+    """Split a "<total_xp>:<user_id>" cursor; raises ValueError if it is malformed."""
+    total_xp, separator, user_id = cursor.partition(":")
+    if not separator or not user_id:
+        raise ValueError(f"invalid leaderboard cursor {cursor!r}")
+    return int(total_xp), user_id
+
 class LeaderboardService:
-    def __init__(self, db: AsyncIOMotorDatabase):
+    # Profile fields read for the players listed on a board
+    profile_fields = {"username": 1, "avatar": 1}
+    
+    def __init__(self, db: AsyncIOMotorDatabase, index: LeaderboardIndex = leaderboard_index):
         self.db = db
+        self.index = index
     
     async def get_leaderboard(self, user_id: str, limit: int = 50) -> LeaderboardResponse:
         """Get the global leaderboard with proper rank positions."""
-        # Get top users by XP with proper ranking
-        cursor = self.db.users.find({}).sort("total_xp", -1).limit(limit)
-        entries = []
-        user_position = None
+        entries = await self.get_top_entries(limit)
+        return LeaderboardResponse(
+            entries=entries,
+            user_position=await self.get_user_position(user_id, entries),
+            total_players=await self.get_total_players()
+        )
+    
+    async def get_top_entries(self, limit: int) -> List[LeaderboardEntry]:
+        """The top players, numbered from 1 in order."""
+        if not self.index.loaded:
+            # Processes that did not load the index read the order straight from Mongo
+            cursor = self.db.users.find({}).sort(LEADERBOARD_SORT).limit(limit)
+            return self._entries_from_docs(0, await cursor.to_list(limit))
+        return await self._entries_from_index(0, self.index.top(limit))
+    
+    async def get_window(
+        self,
+        user_id: str,
+        limit: int,
+        after: Optional[Tuple[int, str]] = None,
+        before: Optional[Tuple[int, str]] = None
+    ) -> LeaderboardWindow:
+        """The page ranked just below the after key or just above the before key.
+        
+        Pages seek on (total_xp, user_id), so their cost does not grow with depth.
+        """
+        if after is not None:
+            offset, entries = await self._after(*after, limit)
+        elif before is not None:
+            offset, entries = await self._before(*before, limit)
+        else:
+            offset, entries = 0, await self.get_top_entries(limit)
+        return await self._window(user_id, offset, entries)
+    
+    async def get_around_user(self, user_id: str, radius: int) -> LeaderboardWindow:
+        """The user with up to radius players on either side."""
+        user_doc = await self.db.users.find_one({"_id": user_id}, {"username": 1, "avatar": 1, "total_xp": 1})
+        total_xp = user_doc["total_xp"] if user_doc else 0
+        if self.index.loaded and self.index.xp(user_id) is not None:
+            # Keep the window in the index's order even if Mongo has moved on since
+            total_xp = self.index.xp(user_id)
+        
+        (offset, above), (_, rest) = await asyncio.gather(
+            self._before(total_xp, user_id, radius),
+            self._after(total_xp, user_id, radius)
+        )
+        entries = list(above)
+        if user_doc is not None:
+            entries.append(LeaderboardEntry(
+                user_id=user_id,
+                username=user_doc["username"],
+                avatar=user_doc["avatar"],
+                total_xp=total_xp,
+                current_rank=get_rank_by_xp(total_xp),
+                rank_position=offset + len(above) + 1
+            ))
+        entries.extend(rest)
+        return await self._window(user_id, offset, entries)
+    
+    async def _window(self, user_id: str, offset: int, entries: List[LeaderboardEntry]) -> LeaderboardWindow:
+        total_players = await self.get_total_players()
+        has_next = bool(entries) and entries[-1].rank_position < total_players
+        return LeaderboardWindow(
+            entries=entries,
+            user_position=await self.get_user_position(user_id, entries),
+            total_players=total_players,
+            prev_cursor=leaderboard_cursor(entries[0].total_xp, entries[0].user_id) if entries and offset > 0 else None,
+            next_cursor=leaderboard_cursor(entries[-1].total_xp, entries[-1].user_id) if has_next else None
+        )
+    
+    async def _after(self, total_xp: int, user_id: str, limit: int) -> Tuple[int, List[LeaderboardEntry]]:
+        if self.index.loaded:
+            offset, ranked = self.index.after(total_xp, user_id, limit)
+            return offset, await self._entries_from_index(offset, ranked)
+        
+        ahead = {"$or": [{"total_xp": {"$gt": total_xp}}, {"total_xp": total_xp, "_id": {"$lte": user_id}}]}
+        below = {"$or": [{"total_xp": {"$lt": total_xp}}, {"total_xp": total_xp, "_id": {"$gt": user_id}}]}
+        docs, offset = await asyncio.gather(
+            self.db.users.find(below).sort(LEADERBOARD_SORT).limit(limit).to_list(limit),
+            self.db.users.count_documents(ahead)
+        )
+        return offset, self._entries_from_docs(offset, docs)
+    
+    async def _before(self, total_xp: int, user_id: str, limit: int) -> Tuple[int, List[LeaderboardEntry]]:
+        if self.index.loaded:
+            offset, ranked = self.index.before(total_xp, user_id, limit)
+            return offset, await self._entries_from_index(offset, ranked)
         
-        rank_position = 1
-        async for user_doc in cursor:
-            entry = LeaderboardEntry(
+        ahead = {"$or": [{"total_xp": {"$gt": total_xp}}, {"total_xp": total_xp, "_id": {"$lt": user_id}}]}
+        reverse = [(field, -direction) for field, direction in LEADERBOARD_SORT]
+        docs, ahead_count = await asyncio.gather(
+            self.db.users.find(ahead).sort(reverse).limit(limit).to_list(limit),
+            self.db.users.count_documents(ahead)
+        )
+        docs.reverse()
+        offset = ahead_count - len(docs)
+        return offset, self._entries_from_docs(offset, docs)
+    
+    def _entries_from_docs(self, offset: int, user_docs: List[Dict]) -> List[LeaderboardEntry]:
+        return [
+            LeaderboardEntry(
                 user_id=user_doc["_id"],
                 username=user_doc["username"],
                 avatar=user_doc["avatar"],
                 total_xp=user_doc["total_xp"],
                 current_rank=user_doc["current_rank"],
-                rank_position=rank_position
+                rank_position=offset + index
             )
-            entries.append(entry)
-            
-            if user_doc["_id"] == user_id:
-                user_position = rank_position
-            
-            rank_position += 1
-        
-        # If user not in top entries, find their position
-        if user_position is None:
-            user_xp = await self.get_user_xp(user_id)
-            user_position = await self.db.users.count_documents({"total_xp": {"$gt": user_xp}}) + 1
-        
-        total_players = await self.db.users.count_documents({})
+            for index, user_doc in enumerate(user_docs, start=1)
+        ]
+    
+    async def _entries_from_index(self, offset: int, ranked: List[Tuple[str, int]]) -> List[LeaderboardEntry]:
+        """Entries for (user_id, total_xp) pairs from the index; Mongo only supplies the profiles."""
+        profiles = {
+            user_doc["_id"]: user_doc async for user_doc in self.db.users.find(
+                {"_id": {"$in": [user_id for user_id, _ in ranked]}},
+                self.profile_fields
+            )
+        }
+        entries = []
+        for index, (user_id, total_xp) in enumerate(ranked, start=1):
+            user_doc = profiles.get(user_id)
+            if user_doc is None:
+                # Deleted since the index last saw it
+                continue
+            entries.append(LeaderboardEntry(
+                user_id=user_id,
+                username=user_doc["username"],
+                avatar=user_doc["avatar"],
+                total_xp=total_xp,
+                current_rank=self._rank(user_doc, total_xp),
+                rank_position=offset + index
+            ))
+        return entries
+    
+    def _rank(self, user_doc: Dict, total_xp: int) -> Dict:
+        return get_rank_by_xp(total_xp)
+    
+    async def get_user_position(self, user_id: str, entries: List[LeaderboardEntry] = ()) -> int:
+        """The user's position, taken from entries when they are listed there."""
+        for entry in entries:
+            if entry.user_id == user_id:
+                return entry.rank_position
         
-        return LeaderboardResponse(
-            entries=entries,
-            user_position=user_position,
-            total_players=total_players
-        )
+        position = self.index.position(user_id) if self.index.loaded else None
+        if position is not None:
+            return position
+        user_xp = await self.get_user_xp(user_id)
+        if self.index.loaded:
+            return self.index.position_for_xp(user_xp)
+        return await self.db.users.count_documents({"total_xp": {"$gt": user_xp}}) + 1
+    
+    async def get_total_players(self) -> int:
+        if self.index.loaded:
+            return len(self.index)
+        return await self.db.users.count_documents({})
     
     async def get_user_xp(self, user_id: str) -> int:
         """Get user's total XP."""
         user = await self.db.users.find_one({"_id": user_id}, {"total_xp": 1})
         return user["total_xp"] if user else 0
 
+class ScoredLeaderboardService(LeaderboardService):
+    """A board ranked by XP counted only in part, e.g. within a period or a category.
+    
+    Its index holds the players with a score and is always loaded. Entries
+    carry that score in total_xp and the player's overall rank.
+    """
+    profile_fields = {"username": 1, "avatar": 1, "current_rank": 1}
+    
+    async def get_user_position(self, user_id: str, entries: List[LeaderboardEntry] = ()) -> int:
+        for entry in entries:
+            if entry.user_id == user_id:
+                return entry.rank_position
+        position = self.index.position(user_id)
+        # Without a bucket the user has no XP in this period yet
+        return position if position is not None else self.index.position_for_xp(0)
+    
+    def _rank(self, user_doc: Dict, total_xp: int) -> Dict:
+        return user_doc["current_rank"]
+
+class WindowedXPService:
+    """XP buckets behind the daily, weekly and monthly boards."""
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+    
+    async def record(self, user_id: str, earned: Dict[datetime, int]):
+        """Add XP to the buckets of the periods it was earned in, with one bulk_write."""
+        now = datetime.utcnow()
+        grace = timedelta(seconds=WINDOWED_XP_GRACE_SECONDS)
+        buckets: Dict[Tuple[str, str], List] = {}
+        for earned_at, xp in earned.items():
+            if not xp:
+                continue
+            for period in PERIODS:
+                key, ends_at = period_window(period, earned_at)
+                if ends_at + grace <= now:
+                    # Backdated past the period's retention; the bucket would expire at once
+                    continue
+                bucket = buckets.setdefault((period, key), [0, ends_at + grace])
+                bucket[0] += xp
+        if not buckets:
+            return
+        
+        await self.db.xp_buckets.bulk_write([
+            UpdateOne(
+                {"_id": bucket_id(period, key, user_id)},
+                {
+                    "$inc": {"xp": xp},
+                    "$setOnInsert": {"user_id": user_id, "period": period, "key": key, "expires_at": expires_at}
+                },
+                upsert=True
+            )
+            for (period, key), (xp, expires_at) in buckets.items()
+        ], ordered=False)
+        for (period, key), (xp, _) in buckets.items():
+            windowed_boards.add(period, key, user_id, xp)
+    
+    async def forget(self, user_id: str):
+        await self.db.xp_buckets.delete_many({"user_id": user_id})
+        windowed_boards.remove(user_id)
+
+class XPTotalsService:
+    """Per-user XP totals behind the category and difficulty boards."""
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+    
+    async def record(self, user_id: str, entries: List[Dict]):
+        """Add logged XP to the totals of its skills' predefined categories and difficulties.
+        
+        entries are log_entry dicts, one per skill. Negative XP takes a deleted or
+        re-graded skill's XP back out, so the totals always match the user's skills
+        as rebuild_xp_totals computes them.
+        """
+        seeds = await predefined_categories_of(self.db, [entry["category_id"] for entry in entries])
+        totals: Dict[Tuple[str, str], int] = {}
+        for entry in entries:
+            if not entry["xp_earned"]:
+                continue
+            seed = seeds.get(entry["category_id"])
+            if seed is not None:
+                totals[("category", seed)] = totals.get(("category", seed), 0) + entry["xp_earned"]
+            totals[("difficulty", entry["difficulty"])] = totals.get(("difficulty", entry["difficulty"]), 0) + entry["xp_earned"]
+        totals = {board: xp for board, xp in totals.items() if xp}
+        if not totals:
+            return
+        
+        now = datetime.utcnow()
+        await self.db.xp_totals.bulk_write([
+            UpdateOne(
+                {"_id": totals_id(dimension, key, user_id)},
+                {
+                    "$inc": {"xp": xp},
+                    "$set": {"updated_at": now},
+                    "$setOnInsert": {"user_id": user_id, "dimension": dimension, "key": key}
+                },
+                upsert=True
+            )
+            for (dimension, key), xp in totals.items()
+        ], ordered=False)
+        if any(xp < 0 for xp in totals.values()):
+            # A rebuild produces no empty totals, so they leave the boards here too
+            await self.db.xp_totals.delete_many({"user_id": user_id, "xp": {"$lte": 0}})
+        for (dimension, key), xp in totals.items():
+            skill_boards.add(dimension, key, user_id, xp)
+    
+    async def forget(self, user_id: str):
+        await self.db.xp_totals.delete_many({"user_id": user_id})
+        skill_boards.remove(user_id)
+
 class AchievementService:
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
@@ -290,10 +755,7 @@ class AchievementService:
     async def get_user_achievements(self, user_id: str) -> List[Dict]:
         """Get all achievements with user's progress."""
         # Get all achievements
-        achievements_cursor = self.db.achievements.find({})
-        all_achievements = []
-        async for achievement in achievements_cursor:
-            all_achievements.append(achievement)
+        all_achievements = (await catalog_cache.get(self.db, "achievements")).docs
         
         # Get user's earned achievements
         user_achievements_cursor = self.db.user_achievements.find({"user_id": user_id})
@@ -325,11 +787,203 @@ class AchievementService:
         
         return result
     
-    async def check_and_award_achievements(self, user_id: str):
-        """Check and award new achievements to user."""
-        # This would contain logic to check various achievement criteria
-        # and award new achievements. For now, it's a placeholder.
-        pass
+    async def check_and_award_achievements(
+        self,
+        user_id: str,
+        logged_at: Optional[datetime] = None,
+        entries: Optional[List[Dict]] = None,
+        op_id: Optional[str] = None,
+        queued_at: Optional[datetime] = None
+    ) -> List[str]:
+        """Fold logged time into the user's achievement aggregates and award what it unlocks.
+        
+        Only rules reading a changed aggregate are evaluated; without entries every
+        rule is checked against the stored aggregates.
+        """
+        events = [(logged_at, entries)] if entries else []
+        return await self.award_for_events(user_id, events, op_id, queued_at)
+    
+    async def award_for_events(
+        self,
+        user_id: str,
+        events: List[Tuple[datetime, List[Dict]]],
+        op_id: Optional[str] = None,
+        queued_at: Optional[datetime] = None
+    ) -> List[str]:
+        """Fold (logged_at, entries) events, oldest first, into the aggregates in one write and award what they unlock.
+        
+        Callers must not run this concurrently for one user (the side effect queue
+        runs a user's jobs in order), and a replay of the last op_id is not folded in
+        twice. Time queued before the user's history was backfilled is already part
+        of the aggregates.
+        """
+        if events:
+            seeds = await predefined_categories_of(
+                self.db, [entry["category_id"] for _, entries in events for entry in entries]
+            )
+            events = [
+                (logged_at, [{**entry, "category_seed": seeds.get(entry["category_id"])} for entry in entries])
+                for logged_at, entries in events
+            ]
+        while True:
+            loaded = await self.db.achievement_stats.find_one({"_id": user_id})
+            stats = loaded or {"_id": user_id}
+            backfilled_at = stats.get("backfilled_at")
+            if (
+                not events
+                or (op_id is not None and stats.get("last_op_id") == op_id)
+                or (queued_at is not None and backfilled_at is not None and queued_at <= backfilled_at)
+            ):
+                changed = ALL_INPUTS
+                break
+            
+            changed = set()
+            for logged_at, entries in events:
+                changed |= apply_event(stats, logged_at, entries)
+            stats["last_op_id"] = op_id
+            if await self._save_stats(stats, loaded):
+                break
+            # A backfill replaced the aggregates meanwhile; fold the event into its version
+        
+        user = await self.db.users.find_one({"_id": user_id}, {"total_xp": 1, "longest_streak": 1}) or {}
+        due = evaluate(stats, user, changed, set(stats.get("earned", [])))
+        if not due:
+            return []
+        
+        # The unique (user_id, achievement_id) index makes each award happen once
+        now = datetime.utcnow()
+        awarded = []
+        for rule in due:
+            try:
+                await self.db.user_achievements.insert_one({
+                    "_id": str(uuid.uuid4()),
+                    "user_id": user_id,
+                    "achievement_id": rule.achievement_id,
+                    "earned_at": now
+                })
+            except DuplicateKeyError:
+                continue
+            awarded.append(rule)
+        
+        await self.db.achievement_stats.update_one(
+            {"_id": user_id},
+            {"$addToSet": {"earned": {"$each": [rule.achievement_id for rule in due]}}},
+            upsert=True
+        )
+        xp_reward = sum(rule.xp_reward for rule in awarded)
+        if xp_reward:
+            await TimeLogService(self.db).update_user_stats(user_id, xp_reward, 0)
+        if awarded:
+            logging.info(f"Awarded {[rule.achievement_id for rule in awarded]} to user {user_id}")
+        return [rule.achievement_id for rule in awarded]
+    
+    async def _save_stats(self, stats: Dict, loaded: Optional[Dict]) -> bool:
+        """Write the aggregates unless someone else wrote them since they were loaded."""
+        version = (loaded or {}).get("version")
+        stats["version"] = (version or 0) + 1
+        if loaded is None:
+            try:
+                await self.db.achievement_stats.insert_one(stats)
+            except DuplicateKeyError:
+                return False
+            return True
+        result = await self.db.achievement_stats.replace_one({"_id": stats["_id"], "version": version}, stats)
+        return result.matched_count == 1
+
+class ActivityCounterService:
+    """Per-user activity counters keyed by day and ISO week.
+    
+    Day documents hold the minutes logged and the distinct skills logged that
+    day; week documents hold the distinct days with activity. Both are kept
+    current with $inc/$addToSet when time is logged and expire via TTL.
+    """
+    DAY_RETENTION = timedelta(days=8)
+    WEEK_RETENTION = timedelta(weeks=5)
+    # Ids of the latest operations applied to a counter; replays of these are ignored
+    RECENT_OPS = 16
+    
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+    
+    @staticmethod
+    def day_key(when: datetime) -> str:
+        return when.strftime("%Y-%m-%d")
+    
+    @staticmethod
+    def week_key(when: datetime) -> str:
+        iso_year, iso_week, _ = when.isocalendar()
+        return f"{iso_year}-W{iso_week:02d}"
+    
+    async def record(
+        self,
+        user_id: str,
+        skill_ids: List[str],
+        minutes: int,
+        logged_at: datetime,
+        logs: int = 1,
+        op_id: Optional[str] = None
+    ) -> Tuple[Dict, Dict]:
+        """Add logs for the given skills to the counters and return the updated day and week documents.
+        
+        With an op_id the update is applied at most once, so a replayed job does not count twice.
+        """
+        day = self.day_key(logged_at)
+        week = self.week_key(logged_at)
+        day_start = datetime.combine(logged_at.date(), datetime.min.time())
+        week_start = day_start - timedelta(days=logged_at.weekday())
+        
+        return await asyncio.gather(
+            self._apply(
+                f"{user_id}:{day}",
+                {
+                    "$inc": {"minutes": minutes, "logs": logs},
+                    "$addToSet": {"skill_ids": {"$each": list(skill_ids)}},
+                    "$setOnInsert": {
+                        "user_id": user_id,
+                        "period": "day",
+                        "key": day,
+                        "expires_at": day_start + self.DAY_RETENTION
+                    }
+                },
+                op_id
+            ),
+            self._apply(
+                f"{user_id}:{week}",
+                {
+                    "$inc": {"minutes": minutes},
+                    "$addToSet": {"days": day},
+                    "$setOnInsert": {
+                        "user_id": user_id,
+                        "period": "week",
+                        "key": week,
+                        "expires_at": week_start + self.WEEK_RETENTION
+                    }
+                },
+                op_id
+            )
+        )
+    
+    async def _apply(self, counter_id: str, update: Dict, op_id: Optional[str]) -> Dict:
+        query = {"_id": counter_id}
+        if op_id is not None:
+            query["op_ids"] = {"$ne": op_id}
+            update["$push"] = {"op_ids": {"$each": [op_id], "$slice": -self.RECENT_OPS}}
+        try:
+            return await self.db.user_activity.find_one_and_update(
+                query, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # The counter exists and already contains this operation
+            return await self.db.user_activity.find_one({"_id": counter_id})
+    
+    async def get_counters(self, user_id: str, when: Optional[datetime] = None) -> Tuple[Dict, Dict]:
+        """Return the day and week counters containing the given time (default now)."""
+        when = when or datetime.utcnow()
+        day_doc, week_doc = await asyncio.gather(
+            self.db.user_activity.find_one({"_id": f"{user_id}:{self.day_key(when)}"}),
+            self.db.user_activity.find_one({"_id": f"{user_id}:{self.week_key(when)}"})
+        )
+        return day_doc or {}, week_doc or {}
 
 class QuestService:
     def __init__(self, db: AsyncIOMotorDatabase):
@@ -372,141 +1026,176 @@ class QuestService:
             "weekly": weekly_quests
         }
     
-    async def update_quest_progress(self, user_id: str, skill_id: str, minutes_logged: int):
-        """Update quest progress based on activity."""
+    async def update_quest_progress(
+        self,
+        user_id: str,
+        skill_ids: List[str],
+        minutes_logged: int,
+        logged_at: Optional[datetime] = None,
+        logs: int = 1,
+        op_id: Optional[str] = None
+    ):
+        """Update quest progress based on activity.
+        
+        Progress comes straight from the per-user activity counters, so no
+        time_logs aggregation runs on the write path.
+        """
+        logged_at = logged_at or datetime.utcnow()
+        day_counters, week_counters = await ActivityCounterService(self.db).record(
+            user_id, skill_ids, minutes_logged, logged_at, logs, op_id
+        )
+        
         today = datetime.utcnow().date()
+        if logged_at.date() != today:
+            # Backdated activity only counts towards the periods it happened in
+            week_start = today - timedelta(days=today.weekday())
+            if logged_at.date() < week_start:
+                return
+            progress = {"consistency-master": len(week_counters.get("days", []))}
+        else:
+            progress = {
+                "daily-grind": len(day_counters.get("skill_ids", [])),
+                "time-investor": day_counters.get("minutes", 0),
+                "consistency-master": len(week_counters.get("days", []))
+            }
         
-        # Update daily quests
-        daily_quests = await self.db.user_quests.find({
-            "user_id": user_id,
-            "quest_type": "daily",
-            "start_date": {"$gte": datetime.combine(today, datetime.min.time())},
-            "completed": False
-        }).to_list(None)
+        await self.apply_quest_progress(user_id, progress)
+    
+    async def apply_quest_progress(self, user_id: str, progress: Dict[str, int]):
+        """Raise the progress of the user's current, uncompleted quests in one bulk write."""
+        today = datetime.utcnow().date()
+        period_starts = {
+            "daily": datetime.combine(today, datetime.min.time()),
+            "weekly": datetime.combine(today - timedelta(days=today.weekday()), datetime.min.time())
+        }
+        now = datetime.utcnow()
         
-        for quest in daily_quests:
-            progress_updated = False
-            
-            # Update based on quest type
-            if quest["quest_id"] == "daily-grind":
-                # Count unique skills logged today
-                skills_today = await self.db.time_logs.distinct("skill_id", {
+        templates = (await catalog_cache.get(self.db, "quest_templates")).by_id
+        operations = []
+        for quest_id, value in progress.items():
+            template = templates.get(quest_id)
+            if template is None:
+                continue
+            # Progress only moves forward, so out-of-order writes cannot regress it
+            operations.append(UpdateOne(
+                {
                     "user_id": user_id,
-                    "logged_at": {"$gte": datetime.combine(today, datetime.min.time())}
-                })
-                new_progress = len(skills_today)
-                if new_progress != quest["progress"]:
-                    progress_updated = True
-                    quest["progress"] = new_progress
-            
-            elif quest["quest_id"] == "time-investor":
-                # Count total minutes logged today
-                total_minutes_today = await self.db.time_logs.aggregate([
-                    {
-                        "$match": {
-                            "user_id": user_id,
-                            "logged_at": {"$gte": datetime.combine(today, datetime.min.time())}
-                        }
-                    },
-                    {"$group": {"_id": None, "total": {"$sum": "$minutes"}}}
-                ]).to_list(None)
-                
-                new_progress = total_minutes_today[0]["total"] if total_minutes_today else 0
-                if new_progress != quest["progress"]:
-                    progress_updated = True
-                    quest["progress"] = new_progress
-            
-            # Update quest if progress changed
-            if progress_updated:
-                completed = quest["progress"] >= quest["target_value"]
-                await self.db.user_quests.update_one(
-                    {"_id": quest["_id"]},
-                    {
-                        "$set": {
-                            "progress": quest["progress"],
-                            "completed": completed,
-                            "updated_at": datetime.utcnow()
-                        }
+                    "quest_id": quest_id,
+                    "start_date": {"$gte": period_starts[template["quest_type"]]},
+                    "completed": False,
+                    "progress": {"$lt": value}
+                },
+                {
+                    "$set": {
+                        "progress": value,
+                        "completed": value >= template["target_value"],
+                        "updated_at": now
                     }
-                )
-        
-        # Update weekly quests
-        weekday = today.weekday()
-        week_start = today - timedelta(days=weekday)
+                }
+            ))
         
-        weekly_quests = await self.db.user_quests.find({
-            "user_id": user_id,
-            "quest_type": "weekly",
-            "start_date": {"$gte": datetime.combine(week_start, datetime.min.time())},
-            "completed": False
-        }).to_list(None)
-        
-        for quest in weekly_quests:
-            if quest["quest_id"] == "consistency-master":
-                # Count days with activity this week
-                days_with_activity = await self.db.time_logs.aggregate([
-                    {
-                        "$match": {
-                            "user_id": user_id,
-                            "logged_at": {"$gte": datetime.combine(week_start, datetime.min.time())}
-                        }
-                    },
-                    {
-                        "$group": {
-                            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$logged_at"}}
-                        }
-                    },
-                    {"$count": "days"}
-                ]).to_list(None)
-                
-                new_progress = days_with_activity[0]["days"] if days_with_activity else 0
-                if new_progress != quest["progress"]:
-                    completed = new_progress >= quest["target_value"]
-                    await self.db.user_quests.update_one(
-                        {"_id": quest["_id"]},
-                        {
-                            "$set": {
-                                "progress": new_progress,
-                                "completed": completed,
-                                "updated_at": datetime.utcnow()
-                            }
-                        }
-                    )
+        if operations:
+            await self.db.user_quests.bulk_write(operations, ordered=False)
     
     async def claim_quest_reward(self, user_id: str, quest_id: str) -> bool:
         """Claim quest reward and award XP."""
-        quest = await self.db.user_quests.find_one({
-            "_id": quest_id,
-            "user_id": user_id,
-            "completed": True,
-            "claimed": False
-        })
-        
-        if not quest:
-            return False
-        
-        # Mark quest as claimed
-        await self.db.user_quests.update_one(
-            {"_id": quest_id},
+        # Marking the quest claimed in the same step as the check means only one claim can win
+        quest = await self.db.user_quests.find_one_and_update(
+            {
+                "_id": quest_id,
+                "user_id": user_id,
+                "completed": True,
+                "claimed": False
+            },
             {
                 "$set": {
                     "claimed": True,
                     "claimed_at": datetime.utcnow()
                 }
-            }
+            },
+            projection={"xp_reward": 1}
         )
         
+        if not quest:
+            return False
+        
         # Award XP to user
-        await self.db.users.update_one(
+        user = await self.db.users.find_one_and_update(
             {"_id": user_id},
             {
                 "$inc": {"total_xp": quest["xp_reward"]},
                 "$set": {"last_active": datetime.utcnow()}
-            }
+            },
+            projection={"total_xp": 1},
+            return_document=ReturnDocument.AFTER
         )
+        user_cache.invalidate(user_id)
+        if user:
+            leaderboard_index.observe(user_id, user["total_xp"])
+            await WindowedXPService(self.db).record(user_id, {datetime.utcnow(): quest["xp_reward"]})
         
         return True
 
+async def enqueue_log_effects(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    entries: List[Dict],
+    logged_at: datetime,
+    logs: int = 1,
+    achievements: bool = True
+) -> str:
+    """Queue the bookkeeping that follows logged time instead of running it in the request.
+    
+    entries holds one log_entry per skill with the minutes and XP logged for it.
+    Without achievements only quest progress is updated, for callers that queue
+    the achievement events themselves.
+    """
+    return await side_effects.enqueue(db, user_id, "log_effects", {
+        "entries": entries,
+        "logged_at": logged_at,
+        "logs": logs,
+        "achievements": achievements
+    })
+
+@side_effects.register("log_effects")
+async def apply_log_effects(db: AsyncIOMotorDatabase, job: Dict):
+    payload = job["payload"]
+    entries = payload["entries"]
+    await QuestService(db).update_quest_progress(
+        job["user_id"], [entry["skill_id"] for entry in entries], sum(entry["minutes"] for entry in entries),
+        payload["logged_at"], logs=payload["logs"], op_id=job["_id"]
+    )
+    if payload.get("achievements", True):
+        await AchievementService(db).check_and_award_achievements(
+            job["user_id"], payload["logged_at"], entries, op_id=job["_id"], queued_at=job["created_at"]
+        )
+
+async def enqueue_achievement_events(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    events: List[Dict],
+    sequence: str,
+    position: int
+) -> str:
+    """Queue part of a history of logged time for the achievement aggregates.
+    
+    events are {"logged_at", "entries"} dicts in logged_at order, folded in with
+    a single write. A history is queued as several jobs of one sequence, which
+    run in position order.
+    """
+    return await side_effects.enqueue(
+        db, user_id, "achievement_events", {"events": events}, job_id=f"{sequence}:{position:08d}"
+    )
+
+@side_effects.register("achievement_events")
+async def apply_achievement_events(db: AsyncIOMotorDatabase, job: Dict):
+    await AchievementService(db).award_for_events(
+        job["user_id"],
+        [(event["logged_at"], event["entries"]) for event in job["payload"]["events"]],
+        op_id=job["_id"],
+        queued_at=job["created_at"]
+    )
+
 class UserSettingsService:
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
@@ -539,6 +1228,7 @@ class UserSettingsService:
             {"_id": user_id},
             {"$set": update_data}
         )
+        user_cache.update(user_id, update_data)
         
         return result.modified_count > 0
 
@@ -0,0 +1,211 @@
+"""
+Per-category and per-difficulty leaderboards for Galactic Quest.
+
+XP from logged time is added per user to one document per predefined
+category and per difficulty in the xp_totals collection (see
+XPTotalsService), so a board never has to group skills by category.
+Categories a user owns count towards the predefined category they were
+seeded from: materialized copies carry predefined_id, legacy copies match
+by name. Categories created from scratch only count on difficulty boards.
+
+Each board is ranked by its own LeaderboardIndex over its totals, loaded on
+first use and reconciled periodically like the global index.
+
+Skills are the source of truth: a total is the XP of the user's current
+skills in that category or difficulty, and deleting or re-grading a skill
+takes its XP back out. Totals for XP logged before these boards existed are
+built from the skills collection by running this module, which also deletes
+totals it no longer produces. A rerun is safe and repairs anything logged
+while an earlier run was writing.
+
+Usage: python skill_leaderboards.py
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+from dotenv import load_dotenv
+import asyncio
+import logging
+import os
+import time
+from catalog import catalog_cache
+from leaderboard_index import LEADERBOARD_RECONCILE_SECONDS, LeaderboardIndex, LeaderboardSource
+from models import DifficultyLevel
+
+SKILL_BOARD_RECONCILE_SECONDS = int(os.getenv("SKILL_BOARD_RECONCILE_SECONDS", str(LEADERBOARD_RECONCILE_SECONDS)))
+CATEGORY_SEED_CACHE_SIZE = 10000
+
+DIFFICULTIES = tuple(level.value for level in DifficultyLevel)
+
+def totals_id(dimension: str, key: str, user_id: str) -> str:
+    return f"{dimension}:{key}:{user_id}"
+
+# A category's seed never changes, so resolved ids are kept for the life of the process
+_category_seeds: "OrderedDict[str, Optional[str]]" = OrderedDict()
+
+async def predefined_categories_of(db: AsyncIOMotorDatabase, category_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Map category ids to the predefined category each was seeded from, or None."""
+    predefined = await catalog_cache.get(db, "predefined_categories")
+    seeds = {}
+    unknown = []
+    for category_id in set(category_ids):
+        if category_id in predefined.by_id:
+            seeds[category_id] = category_id
+        elif category_id in _category_seeds:
+            seeds[category_id] = _category_seeds[category_id]
+        else:
+            unknown.append(category_id)
+    if not unknown:
+        return seeds
+
+    by_name = {doc["name"]: doc["_id"] for doc in predefined.docs}
+    async for category in db.categories.find(
+        {"_id": {"$in": unknown}}, {"predefined_id": 1, "is_predefined": 1, "name": 1}
+    ):
+        seed = category.get("predefined_id")
+        if seed is None and category.get("is_predefined"):
+            seed = by_name.get(category.get("name"))
+        seeds[category["_id"]] = _category_seeds[category["_id"]] = seed
+    while len(_category_seeds) > CATEGORY_SEED_CACHE_SIZE:
+        _category_seeds.popitem(last=False)
+    for category_id in unknown:
+        seeds.setdefault(category_id, None)
+    return seeds
+
+class SkillBoard(NamedTuple):
+    dimension: str
+    key: str
+    index: LeaderboardIndex
+
+class SkillBoards:
+    """Ranked indexes for the category and difficulty boards."""
+
+    def __init__(self, reconcile_seconds: int = SKILL_BOARD_RECONCILE_SECONDS):
+        self.reconcile_seconds = reconcile_seconds
+        self._boards: Dict[Tuple[str, str], SkillBoard] = {}
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def board(self, db: AsyncIOMotorDatabase, dimension: str, key: str) -> SkillBoard:
+        """The board for one category or difficulty, loaded on first use."""
+        board = self._boards.get((dimension, key))
+        if board is not None:
+            return board
+        async with self._locks.setdefault((dimension, key), asyncio.Lock()):
+            board = self._boards.get((dimension, key))
+            if board is None:
+                index = LeaderboardIndex(LeaderboardSource("xp_totals", {"dimension": dimension, "key": key}, "xp", "user_id"))
+                await index.load(db)
+                board = self._boards[(dimension, key)] = SkillBoard(dimension, key, index)
+            return board
+
+    def add(self, dimension: str, key: str, user_id: str, xp: int):
+        """Apply XP just written to a total, if that board is loaded; emptied totals leave the board."""
+        board = self._boards.get((dimension, key))
+        if board is not None:
+            total = (board.index.xp(user_id) or 0) + xp
+            if total > 0:
+                board.index.set(user_id, total)
+            else:
+                board.index.remove(user_id)
+
+    def remove(self, user_id: str):
+        for board in self._boards.values():
+            board.index.remove(user_id)
+
+    async def reconcile(self, db: AsyncIOMotorDatabase):
+        for board in list(self._boards.values()):
+            await board.index.reconcile(db)
+
+    async def _run(self, db: AsyncIOMotorDatabase):
+        while True:
+            await asyncio.sleep(self.reconcile_seconds)
+            try:
+                await self.reconcile(db)
+            except Exception as e:
+                logging.warning(f"Failed to reconcile skill leaderboards: {e}")
+
+    def start(self, db: AsyncIOMotorDatabase):
+        """Start the periodic reconcile; boards load when first requested."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {f"{dimension}:{key}": len(board.index) for (dimension, key), board in self._boards.items()}
+
+skill_boards = SkillBoards()
+
+async def _write_totals(db: AsyncIOMotorDatabase, groups: list, now: datetime) -> int:
+    seeds = await predefined_categories_of(db, [group["_id"]["category_id"] for group in groups])
+    totals: Dict[Tuple[str, str, str], int] = {}
+    for group in groups:
+        user_id = group["_id"]["user_id"]
+        seed = seeds.get(group["_id"]["category_id"])
+        if seed is not None:
+            totals[("category", seed, user_id)] = totals.get(("category", seed, user_id), 0) + group["xp"]
+        difficulty_key = ("difficulty", group["_id"]["difficulty"], user_id)
+        totals[difficulty_key] = totals.get(difficulty_key, 0) + group["xp"]
+
+    await db.xp_totals.bulk_write([
+        ReplaceOne(
+            {"_id": totals_id(dimension, key, user_id)},
+            {"dimension": dimension, "key": key, "user_id": user_id, "xp": xp, "updated_at": now},
+            upsert=True
+        )
+        for (dimension, key, user_id), xp in totals.items()
+    ], ordered=False)
+    return len(totals)
+
+async def rebuild_xp_totals(db: AsyncIOMotorDatabase, batch_size: int = 1000) -> int:
+    """Recompute every user's category and difficulty totals from their skills."""
+    started = time.perf_counter()
+    # Mongo keeps milliseconds, so every total written from here on compares as not older
+    now = datetime.utcnow()
+    started_at = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    written = 0
+    groups = []
+    # Sorted by user so a batch never splits one user's totals
+    cursor = db.skills.aggregate([
+        {"$match": {"total_xp": {"$gt": 0}}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "category_id": "$category_id", "difficulty": "$difficulty"},
+            "xp": {"$sum": "$total_xp"}
+        }},
+        {"$sort": {"_id.user_id": 1}}
+    ], allowDiskUse=True)
+    async for group in cursor:
+        if len(groups) >= batch_size and group["_id"]["user_id"] != groups[-1]["_id"]["user_id"]:
+            written += await _write_totals(db, groups, datetime.utcnow())
+            groups = []
+        groups.append(group)
+    if groups:
+        written += await _write_totals(db, groups, datetime.utcnow())
+    # Neither rewritten nor logged to since the start: the skills behind these are gone
+    stale = await db.xp_totals.delete_many({"updated_at": {"$not": {"$gte": started_at}}})
+    logging.info(f"Rebuilt {written} XP totals and removed {stale.deleted_count} stale ones in {time.perf_counter() - started:.1f}s")
+    return written
+
+async def main():
+    from database import connect_to_mongo, close_mongo_connection, get_database
+    await connect_to_mongo()
+    try:
+        await rebuild_xp_totals(await get_database())
+    finally:
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""
+Consecutive-day streak engine.
+
+Days are numbered from the Unix epoch. Each skill and user stores its last
+active day and its current and longest streak; a log on the next day extends
+the streak in O(1) without looking at history.
+
+Backdated activity is resolved by recomputing from a compact per-user bitmap
+of active days in the activity_days collection: one document per user, with 32 days
+per integer word for the user ("days") and for each skill ("skills.<id>").
+Bits are set with $bit, so recording a day never needs a read.
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from bson import Int64
+from datetime import date, datetime
+from typing import Dict, Iterable, NamedTuple, Optional, Union
+
+EPOCH = date(1970, 1, 1)
+DAYS_PER_WORD = 32
+
+class StreakState(NamedTuple):
+    last_day: Optional[int]
+    current: int
+    longest: int
+
+EMPTY_STREAK = StreakState(last_day=None, current=0, longest=0)
+
+def day_number(when: Union[date, datetime]) -> int:
+    if isinstance(when, datetime):
+        when = when.date()
+    return (when - EPOCH).days
+
+def skill_streak_state(skill: Dict) -> StreakState:
+    return StreakState(skill.get("last_active_day"), skill.get("streak", 0), skill.get("longest_streak", 0))
+
+def user_streak_state(user: Dict) -> StreakState:
+    return StreakState(user.get("streak_last_day"), user.get("current_streak", 0), user.get("longest_streak", 0))
+
+def skill_streak_fields(state: StreakState) -> Dict:
+    return {"last_active_day": state.last_day, "streak": state.current, "longest_streak": state.longest}
+
+def user_streak_fields(state: StreakState) -> Dict:
+    return {"streak_last_day": state.last_day, "current_streak": state.current, "longest_streak": state.longest}
+
+def effective_current_streak(state: StreakState, today: Optional[int] = None) -> int:
+    """The current streak as seen today: broken once a full day passes without activity."""
+    today = day_number(datetime.utcnow()) if today is None else today
+    if state.last_day is None or state.last_day < today - 1:
+        return 0
+    return state.current
+
+def advance(state: StreakState, day: int) -> Optional[StreakState]:
+    """O(1) update for activity on day; None if nothing changes.
+
+    Backdated days are also left alone here; they need a recompute with from_bitmap.
+    """
+    if state.last_day is not None and day <= state.last_day:
+        return None
+    current = state.current + 1 if state.last_day == day - 1 else 1
+    return StreakState(day, current, max(state.longest, current))
+
+def from_bitmap(words: Dict[str, int]) -> StreakState:
+    """Recompute a streak from scratch; linear in the number of active days."""
+    days = sorted(
+        int(word) * DAYS_PER_WORD + bit
+        for word, value in words.items()
+        for bit in range(DAYS_PER_WORD)
+        if value >> bit & 1
+    )
+    if not days:
+        return EMPTY_STREAK
+
+    longest = run = 1
+    for previous, day in zip(days, days[1:]):
+        run = run + 1 if day == previous + 1 else 1
+        longest = max(longest, run)
+    return StreakState(days[-1], run, longest)
+
+def bitmap_update(days: Iterable[int], skill_ids: Iterable[str] = ()) -> Dict:
+    """$bit update setting the given days for the user and the given skills.
+
+    Masks are sent as Int64 so bit 31 never overflows a 32-bit BSON int.
+    """
+    masks: Dict[str, int] = {}
+    for day in days:
+        word = str(day // DAYS_PER_WORD)
+        masks[word] = masks.get(word, 0) | 1 << (day % DAYS_PER_WORD)
+
+    skill_ids = list(skill_ids)
+    update = {}
+    for word, mask in masks.items():
+        update[f"days.{word}"] = {"or": Int64(mask)}
+        for skill_id in skill_ids:
+            update[f"skills.{skill_id}.{word}"] = {"or": Int64(mask)}
+    return {"$bit": update}
+
+class StreakService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    async def mark_days(self, user_id: str, days: Iterable[int], skill_ids: Iterable[str] = ()):
+        await self.db.activity_days.update_one({"_id": user_id}, bitmap_update(days, skill_ids), upsert=True)
+
+    async def forget_skills(self, user_id: str, skill_ids: Iterable[str]):
+        unset = {f"skills.{skill_id}": "" for skill_id in skill_ids}
+        if unset:
+            await self.db.activity_days.update_one({"_id": user_id}, {"$unset": unset})
+
+    async def get_bitmap(self, user_id: str) -> Dict:
+        return await self.db.activity_days.find_one({"_id": user_id}) or {}
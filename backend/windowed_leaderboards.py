@@ -0,0 +1,119 @@
+"""
+Daily, weekly and monthly leaderboards of the XP earned within the period.
+
+XP is added when it is earned to one bucket document per user and period in
+the xp_buckets collection (see WindowedXPService), so a board never has to
+aggregate time logs. Buckets expire through a TTL index once their period
+has ended and WINDOWED_XP_GRACE_SECONDS have passed.
+
+The current period of each board is ranked by its own LeaderboardIndex over
+that period's buckets, so windowed boards cost the same as the global one.
+A new period starts from an empty index, and a periodic reconcile picks up
+XP recorded by other processes.
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime, timedelta
+from typing import Dict, NamedTuple, Optional, Tuple
+import asyncio
+import logging
+import os
+from achievements import week_key
+from leaderboard_index import LEADERBOARD_RECONCILE_SECONDS, LeaderboardIndex, LeaderboardSource
+
+WINDOWED_XP_GRACE_SECONDS = int(os.getenv("WINDOWED_XP_GRACE_SECONDS", str(24 * 3600)))
+WINDOWED_RECONCILE_SECONDS = int(os.getenv("WINDOWED_RECONCILE_SECONDS", str(LEADERBOARD_RECONCILE_SECONDS)))
+
+PERIODS = ("daily", "weekly", "monthly")
+
+def period_window(period: str, when: datetime) -> Tuple[str, datetime]:
+    """The key of the period containing when, and the moment it ends."""
+    day_start = datetime(when.year, when.month, when.day)
+    if period == "daily":
+        return day_start.strftime("%Y-%m-%d"), day_start + timedelta(days=1)
+    if period == "weekly":
+        return week_key(when), day_start + timedelta(days=7 - when.weekday())
+    if period == "monthly":
+        next_month = datetime(when.year + when.month // 12, when.month % 12 + 1, 1)
+        return day_start.strftime("%Y-%m"), next_month
+    raise ValueError(f"unknown leaderboard period {period!r}")
+
+def bucket_id(period: str, key: str, user_id: str) -> str:
+    return f"{period}:{key}:{user_id}"
+
+class WindowedBoard(NamedTuple):
+    period: str
+    key: str
+    ends_at: datetime
+    index: LeaderboardIndex
+
+class WindowedBoards:
+    """Ranked indexes for the current period of each windowed board."""
+
+    def __init__(self, reconcile_seconds: int = WINDOWED_RECONCILE_SECONDS):
+        self.reconcile_seconds = reconcile_seconds
+        self._boards: Dict[str, WindowedBoard] = {}
+        self._locks = {period: asyncio.Lock() for period in PERIODS}
+        self._task: Optional[asyncio.Task] = None
+        self.rollovers = 0
+
+    async def board(self, db: AsyncIOMotorDatabase, period: str, now: Optional[datetime] = None) -> WindowedBoard:
+        """The current period's board, loading it when the period has rolled over."""
+        key, ends_at = period_window(period, now or datetime.utcnow())
+        board = self._boards.get(period)
+        if board is not None and board.key == key:
+            return board
+        async with self._locks[period]:
+            board = self._boards.get(period)
+            if board is None or board.key != key:
+                index = LeaderboardIndex(LeaderboardSource("xp_buckets", {"period": period, "key": key}, "xp", "user_id"))
+                await index.load(db)
+                board = self._boards[period] = WindowedBoard(period, key, ends_at, index)
+                self.rollovers += 1
+            return board
+
+    def add(self, period: str, key: str, user_id: str, xp: int):
+        """Apply XP just written to a bucket, if that bucket's board is loaded."""
+        board = self._boards.get(period)
+        if board is not None and board.key == key:
+            board.index.set(user_id, (board.index.xp(user_id) or 0) + xp)
+
+    def remove(self, user_id: str):
+        for board in self._boards.values():
+            board.index.remove(user_id)
+
+    async def reconcile(self, db: AsyncIOMotorDatabase):
+        for period in PERIODS:
+            board = await self.board(db, period)
+            await board.index.reconcile(db)
+
+    async def _run(self, db: AsyncIOMotorDatabase):
+        while True:
+            await asyncio.sleep(self.reconcile_seconds)
+            try:
+                await self.reconcile(db)
+            except Exception as e:
+                logging.warning(f"Failed to reconcile windowed leaderboards: {e}")
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        """Load the current boards and start the periodic reconcile."""
+        for period in PERIODS:
+            await self.board(db, period)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "boards": {period: {"key": board.key, "players": len(board.index)} for period, board in self._boards.items()},
+            "rollovers": self.rollovers
+        }
+
+windowed_boards = WindowedBoards()
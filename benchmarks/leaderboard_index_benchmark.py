@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Leaderboard index operations at 1M users.
+
+Builds the in-process index from synthetic users and times XP updates,
+top-N, a user's position and the player count. With MONGO_URL set, the same
+users are also written to a scratch database to time the count_documents
+queries the index replaces and the startup load and reconcile.
+
+Usage: python benchmarks/leaderboard_index_benchmark.py
+       MONGO_URL=mongodb://localhost:27017 python benchmarks/leaderboard_index_benchmark.py
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from leaderboard_index import LeaderboardIndex  # noqa: E402
+
+USERS = int(os.getenv("USERS", "1000000"))
+OPERATIONS = 100000
+MONGO_QUERIES = 200
+
+def synthetic_users():
+    rng = random.Random(42)
+    # Heavy-tailed XP like a real player base: most players have little, a few have a lot
+    return {f"user-{i:07d}": int(rng.paretovariate(1.2) * 100) for i in range(USERS)}
+
+def per_op(seconds: float, count: int) -> str:
+    return f"{seconds / count * 1e6:.2f} µs/op"
+
+def bench_index(users):
+    index = LeaderboardIndex()
+    started = time.perf_counter()
+    for user_id, total_xp in users.items():
+        index.set(user_id, total_xp)
+    print(f"build, one set per user:  {time.perf_counter() - started:.2f}s")
+
+    rng = random.Random(7)
+    user_ids = list(users)
+    sample = [rng.choice(user_ids) for _ in range(OPERATIONS)]
+
+    started = time.perf_counter()
+    for user_id in sample:
+        index.observe(user_id, index.xp(user_id) + rng.randint(1, 500))
+    print(f"XP update:                {per_op(time.perf_counter() - started, OPERATIONS)}")
+
+    started = time.perf_counter()
+    for _ in range(OPERATIONS // 10):
+        index.top(50)
+    print(f"top 50:                   {per_op(time.perf_counter() - started, OPERATIONS // 10)}")
+
+    started = time.perf_counter()
+    for user_id in sample:
+        index.position(user_id)
+    print(f"user position:            {per_op(time.perf_counter() - started, OPERATIONS)}")
+
+    started = time.perf_counter()
+    for _ in range(OPERATIONS):
+        len(index)
+    print(f"total players:            {per_op(time.perf_counter() - started, OPERATIONS)}")
+    return index
+
+async def bench_mongo(users, mongo_url: str):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo import InsertOne
+
+    client = AsyncIOMotorClient(mongo_url)
+    db = client["leaderboard_index_benchmark"]
+    await db.users.drop()
+    await db.users.create_index("total_xp")
+    docs = [InsertOne({"_id": user_id, "total_xp": total_xp}) for user_id, total_xp in users.items()]
+    for start in range(0, len(docs), 10000):
+        await db.users.bulk_write(docs[start:start + 10000], ordered=False)
+
+    rng = random.Random(7)
+    sample = rng.sample(list(users.items()), MONGO_QUERIES)
+    started = time.perf_counter()
+    for _, total_xp in sample:
+        await db.users.count_documents({"total_xp": {"$gt": total_xp}})
+    print(f"Mongo position count:     {per_op(time.perf_counter() - started, MONGO_QUERIES)}")
+
+    started = time.perf_counter()
+    for _ in range(MONGO_QUERIES // 10):
+        await db.users.count_documents({})
+    print(f"Mongo player count:       {per_op(time.perf_counter() - started, MONGO_QUERIES // 10)}")
+
+    index = LeaderboardIndex()
+    started = time.perf_counter()
+    await index.load(db)
+    print(f"index load from Mongo:    {time.perf_counter() - started:.2f}s")
+
+    drifted = rng.sample(list(users), 1000)
+    for user_id in drifted:
+        index.set(user_id, users[user_id] + 1)
+    report = await index.reconcile(db)
+    print(f"reconcile:                {report}")
+    assert report["fixed"] == len(drifted)
+
+    await db.users.drop()
+    client.close()
+
+def main():
+    users = synthetic_users()
+    print(f"{USERS} users")
+    bench_index(users)
+    mongo_url = os.getenv("MONGO_URL")
+    if mongo_url:
+        asyncio.run(bench_mongo(users, mongo_url))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Mongo round trips and latency of TimeLogService.log_time.
+
+Runs against a scratch database (MONGO_URL, BENCH_DB_NAME), counts the
+commands each log issues through a pymongo CommandListener, and reports
+p50/p99 latency. It then fires concurrent logs at a single skill and checks
+that the skill and user totals add up, and finally compares the throughput of
+per-entry logging with TimeLogService.log_time_batch. Quest bookkeeping runs
+on the side effect queue, so the last step drains it and reports job lag.
+
+Usage: MONGO_URL=mongodb://localhost:27017 python benchmarks/log_time_benchmark.py
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from models import SkillCreate, TimeLogCreate  # noqa: E402
+from services import SkillService, TimeLogService  # noqa: E402
+from init_data import insert_user_default_data  # noqa: E402
+from ranks import get_rank_by_xp  # noqa: E402
+from jobs import side_effects  # noqa: E402
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+BENCH_DB_NAME = os.environ.get("BENCH_DB_NAME", "galactic_quest_bench")
+LOGS = int(os.environ.get("LOGS", "500"))
+CONCURRENT_LOGS = int(os.environ.get("CONCURRENT_LOGS", "200"))
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", "200"))
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+async def create_user(db):
+    user_id = str(uuid.uuid4())
+    await db.users.insert_one({
+        "_id": user_id,
+        "username": f"bench_{user_id[:8]}",
+        "email": f"bench_{user_id[:8]}@example.com",
+        "avatar": "🌟",
+        "total_xp": 0,
+        "total_time_minutes": 0,
+        "current_rank": get_rank_by_xp(0),
+    })
+    await insert_user_default_data(db, user_id)
+    return user_id
+
+async def main():
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(MONGO_URL, event_listeners=[counter])
+    await client.drop_database(BENCH_DB_NAME)
+    db = client[BENCH_DB_NAME]
+
+    user_id = await create_user(db)
+    skill = await SkillService(db).create_skill(
+        user_id, SkillCreate(name="Benchmark", category_id="predefined-mind", difficulty="medium")
+    )
+    service = TimeLogService(db)
+
+    latencies = []
+    commands = []
+    for _ in range(LOGS):
+        before = counter.count
+        start = time.perf_counter()
+        await service.log_time(user_id, TimeLogCreate(skill_id=skill.id, minutes=10))
+        latencies.append((time.perf_counter() - start) * 1000)
+        commands.append(counter.count - before)
+
+    print(f"sequential: {LOGS} logs, {statistics.mean(commands):.1f} Mongo commands/log "
+          f"p50={statistics.median(latencies):.2f}ms p99={percentile(latencies, 99):.2f}ms")
+
+    # Concurrent logs for the same skill must not lose updates
+    before_skill = await db.skills.find_one({"_id": skill.id})
+    await asyncio.gather(*(
+        service.log_time(user_id, TimeLogCreate(skill_id=skill.id, minutes=1))
+        for _ in range(CONCURRENT_LOGS)
+    ))
+    after_skill = await db.skills.find_one({"_id": skill.id})
+    user = await db.users.find_one({"_id": user_id})
+
+    expected_minutes = before_skill["total_time_minutes"] + CONCURRENT_LOGS
+    logged_xp = sum([log["xp_earned"] async for log in db.time_logs.find({"user_id": user_id})])
+    print(f"concurrent: skill minutes {after_skill['total_time_minutes']} (expected {expected_minutes}), "
+          f"user xp {user['total_xp']} (sum of logs {logged_xp}), "
+          f"rank {user['current_rank']['tier']} {user['current_rank']['division']} "
+          f"(expected {get_rank_by_xp(logged_xp)['tier']} {get_rank_by_xp(logged_xp)['division']})")
+
+    # Batch ingestion versus one log_time call per entry
+    entries = [TimeLogCreate(skill_id=skill.id, minutes=5) for _ in range(BATCH_SIZE)]
+
+    before = counter.count
+    start = time.perf_counter()
+    for entry in entries:
+        await service.log_time(user_id, entry)
+    per_entry_seconds = time.perf_counter() - start
+    per_entry_commands = counter.count - before
+
+    before = counter.count
+    start = time.perf_counter()
+    await service.log_time_batch(user_id, entries)
+    batch_seconds = time.perf_counter() - start
+    batch_commands = counter.count - before
+
+    print(f"per-entry: {BATCH_SIZE / per_entry_seconds:.0f} logs/sec, {per_entry_commands} Mongo commands")
+    print(f"batch:     {BATCH_SIZE / batch_seconds:.0f} logs/sec, {batch_commands} Mongo commands")
+
+    # Drain the side effects queued by everything above
+    pending = await db.side_effect_jobs.count_documents({})
+    start = time.perf_counter()
+    side_effects.start(db)
+    while await db.side_effect_jobs.count_documents({"status": "pending"}):
+        await asyncio.sleep(0.05)
+    drain_seconds = time.perf_counter() - start
+    stats = side_effects.stats()
+    await side_effects.stop()
+    print(f"side effects: {pending} jobs drained in {drain_seconds:.2f}s "
+          f"({pending / drain_seconds:.0f} jobs/sec), lag p50={stats['lag_p50_ms']}ms p99={stats['lag_p99_ms']}ms")
+
+    await client.drop_database(BENCH_DB_NAME)
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
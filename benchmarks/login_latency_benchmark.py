@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Latency of unrelated endpoints during a login burst.
+
+Registers a user, then runs a steady stream of authenticated GET /api/skills
+requests while a configurable number of concurrent clients hammer
+/api/auth/login. Prints p50/p99 latency of the probe endpoint with and
+without the login load, and the latency of the logins themselves.
+
+Logins rejected by the rate limiter return 429 without hashing, so start the
+server with the login limits raised, e.g. LOGIN_IP_RATE_PER_MINUTE=1000000
+LOGIN_IP_BURST=100000 LOGIN_EMAIL_RATE_PER_MINUTE=1000000
+LOGIN_EMAIL_BURST=100000, or most of the storm never reaches bcrypt.
+Admitted and rejected logins are reported separately either way.
+
+Usage: BACKEND_URL=http://localhost:8001 python benchmarks/login_latency_benchmark.py
+"""
+
+import asyncio
+import aiohttp
+import os
+import statistics
+import time
+import uuid
+
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8001")
+API_BASE_URL = f"{BACKEND_URL}/api"
+
+LOGIN_CLIENTS = int(os.environ.get("LOGIN_CLIENTS", "20"))
+PROBE_SECONDS = float(os.environ.get("PROBE_SECONDS", "10"))
+PROBE_INTERVAL = float(os.environ.get("PROBE_INTERVAL", "0.02"))
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def register(session):
+    suffix = uuid.uuid4().hex[:8]
+    credentials = {
+        "username": f"bench_{suffix}",
+        "email": f"bench_{suffix}@example.com",
+        "password": "benchmark-password",
+    }
+    async with session.post(f"{API_BASE_URL}/auth/register", json=credentials) as response:
+        response.raise_for_status()
+        data = await response.json()
+    return credentials, data["access_token"]
+
+async def probe(session, token, duration):
+    """Measure GET /api/skills latency for the given duration."""
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        async with session.get(f"{API_BASE_URL}/skills", headers=headers) as response:
+            await response.read()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(PROBE_INTERVAL)
+    return latencies
+
+async def login_storm(session, credentials, stop_event, counters, admitted, rejected):
+    payload = {"email": credentials["email"], "password": credentials["password"]}
+    while not stop_event.is_set():
+        start = time.perf_counter()
+        async with session.post(f"{API_BASE_URL}/auth/login", json=payload) as response:
+            await response.read()
+            counters[response.status] = counters.get(response.status, 0) + 1
+        # A 429 is answered by the rate limiter before any hashing
+        (rejected if response.status == 429 else admitted).append((time.perf_counter() - start) * 1000)
+
+def report(label, latencies):
+    if not latencies:
+        print(f"{label}: n=0")
+        return
+    print(f"{label}: n={len(latencies)} "
+          f"p50={statistics.median(latencies):.1f}ms "
+          f"p99={percentile(latencies, 99):.1f}ms "
+          f"max={max(latencies):.1f}ms")
+
+async def main():
+    print(f"📡 Benchmarking API at: {API_BASE_URL}")
+    async with aiohttp.ClientSession() as session:
+        credentials, token = await register(session)
+
+        baseline = await probe(session, token, PROBE_SECONDS)
+        report("idle", baseline)
+
+        stop_event = asyncio.Event()
+        counters = {}
+        admitted = []
+        rejected = []
+        storm = [
+            asyncio.create_task(login_storm(session, credentials, stop_event, counters, admitted, rejected))
+            for _ in range(LOGIN_CLIENTS)
+        ]
+        under_load = await probe(session, token, PROBE_SECONDS)
+        stop_event.set()
+        await asyncio.gather(*storm)
+
+        report(f"{LOGIN_CLIENTS} login clients", under_load)
+        report("admitted logins", admitted)
+        report("rate-limited logins", rejected)
+        print(f"login responses by status: {counters}")
+        if len(rejected) > len(admitted):
+            print("⚠️  Most logins were rate limited; raise the login limits to measure hashing load")
+
+if __name__ == "__main__":
+    asyncio.run(main())
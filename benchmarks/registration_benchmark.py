@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Registration storm: concurrent POST /api/auth/register, reported as registrations/sec.
+
+Start the server with the registration rate limit raised, e.g.
+REGISTER_IP_RATE_PER_MINUTE=1000000 REGISTER_IP_BURST=100000, or most
+requests will be rejected with 429.
+
+Usage: BACKEND_URL=http://localhost:8001 python benchmarks/registration_benchmark.py
+"""
+
+import asyncio
+import aiohttp
+import os
+import statistics
+import time
+import uuid
+
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8001")
+API_BASE_URL = f"{BACKEND_URL}/api"
+
+REGISTRATIONS = int(os.environ.get("REGISTRATIONS", "500"))
+CONCURRENCY = int(os.environ.get("CONCURRENCY", "32"))
+
+async def register_worker(session, queue, latencies, counters):
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        suffix = uuid.uuid4().hex[:12]
+        payload = {
+            "username": f"rb_{suffix}",
+            "email": f"rb_{suffix}@example.com",
+            "password": "benchmark-password",
+        }
+        start = time.perf_counter()
+        async with session.post(f"{API_BASE_URL}/auth/register", json=payload) as response:
+            await response.read()
+            counters[response.status] = counters.get(response.status, 0) + 1
+        latencies.append((time.perf_counter() - start) * 1000)
+
+async def main():
+    print(f"📡 Benchmarking API at: {API_BASE_URL}")
+    queue = asyncio.Queue()
+    for i in range(REGISTRATIONS):
+        queue.put_nowait(i)
+
+    latencies = []
+    counters = {}
+    async with aiohttp.ClientSession() as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            register_worker(session, queue, latencies, counters) for _ in range(CONCURRENCY)
+        ))
+        elapsed = time.perf_counter() - start
+
+    ordered = sorted(latencies)
+    print(f"{REGISTRATIONS} registrations at concurrency {CONCURRENCY} in {elapsed:.2f}s")
+    print(f"throughput: {counters.get(200, 0) / elapsed:.1f} registrations/sec")
+    print(f"latency p50={statistics.median(ordered):.1f}ms p99={ordered[int(0.99 * (len(ordered) - 1))]:.1f}ms")
+    print(f"responses by status: {counters}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Per-request token verification overhead with and without the token cache.
+
+Usage: python benchmarks/token_cache_benchmark.py
+"""
+
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from auth import create_access_token, decode_token, token_cache  # noqa: E402
+
+ITERATIONS = 50000
+
+def main():
+    token = create_access_token(data={"sub": "benchmark-user"})
+    token_cache.clear()
+
+    uncached = timeit.timeit(lambda: decode_token(token, use_cache=False), number=ITERATIONS)
+    cached = timeit.timeit(lambda: decode_token(token), number=ITERATIONS)
+
+    print(f"jwt.decode per request:   {uncached / ITERATIONS * 1e6:.2f} µs")
+    print(f"token cache per request:  {cached / ITERATIONS * 1e6:.2f} µs")
+    print(f"speedup: {uncached / cached:.1f}x ({token_cache.stats()})")
+
+if __name__ == "__main__":
+    main()
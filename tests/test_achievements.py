@@ -0,0 +1,115 @@
+from datetime import datetime
+
+from achievements import apply_event, category_key, compile_rule, evaluate, week_key
+from init_data import DEFAULT_ACHIEVEMENTS
+
+ACHIEVEMENTS = {achievement["_id"]: achievement for achievement in DEFAULT_ACHIEVEMENTS}
+
+
+def entry(skill_id="s1", category_id="predefined-mind", difficulty="medium", minutes=30, xp_earned=60, name="Guitar", **extra):
+    return {
+        "skill_id": skill_id,
+        "name": name,
+        "category_id": category_id,
+        "difficulty": difficulty,
+        "minutes": minutes,
+        "xp_earned": xp_earned,
+        **extra
+    }
+
+
+def rule(achievement_id):
+    return compile_rule(ACHIEVEMENTS[achievement_id])
+
+
+def test_category_key_strips_the_predefined_prefix():
+    assert category_key("predefined-social") == "social"
+    assert category_key("custom-uuid") == "custom-uuid"
+
+
+def test_category_key_uses_the_seed_of_a_copy():
+    assert category_key("legacy-uuid", "predefined-social") == "social"
+    assert category_key("custom-uuid", None) == "custom-uuid"
+
+
+def test_compile_rule_reads_the_inputs_of_its_criteria():
+    assert rule("night-owl").inputs == {"hours"}
+    assert rule("marathon-session").inputs == {"day"}
+    assert rule("social-butterfly").inputs == {"week"}
+    assert rule("mind-over-matter").inputs == {"categories"}
+    assert rule("comeback-kid").inputs == {"break"}
+    assert rule("ultimate-champion").inputs == {"rank"}
+
+
+def test_compile_rule_skips_untrackable_criteria():
+    assert compile_rule(ACHIEVEMENTS["holiday-hero"]) is None
+    assert compile_rule(ACHIEVEMENTS["triple-threat"]) is None
+
+
+def test_compile_rule_checks():
+    assert rule("night-owl").check({"hours": [3]}, {})
+    assert not rule("night-owl").check({"hours": [5]}, {})
+    assert rule("early-bird").check({"hours": [5]}, {})
+    assert rule("perfectionist").check({}, {"longest_streak": 7})
+    assert not rule("perfectionist").check({}, {"longest_streak": 6})
+    assert rule("ultimate-champion").check({}, {"total_xp": 200000})
+    assert not rule("ultimate-champion").check({}, {"total_xp": 199999})
+    stats = {"categories": {"mind": {"minutes": 3000}, "body": {"minutes": 2999}}}
+    assert not rule("mind-over-matter").check(stats, {})
+    stats["categories"]["body"]["minutes"] = 3000
+    assert rule("mind-over-matter").check(stats, {})
+
+
+def test_apply_event_accumulates_totals():
+    stats = {}
+    changed = apply_event(stats, datetime(2024, 1, 1, 3, 15), [entry(minutes=30), entry("s2", "predefined-body", "hard", 45, 135)])
+    assert {"hours", "categories", "difficulty", "day", "week"} <= changed
+    assert stats["hours"] == [3]
+    assert stats["categories"]["mind"]["minutes"] == 30
+    assert stats["categories"]["body"]["xp"] == 135
+    assert stats["difficulty_minutes"] == {"medium": 30, "hard": 45}
+    assert stats["day"]["skill_minutes"] == {"s1": 30, "s2": 45}
+
+
+def test_apply_event_keys_copies_of_predefined_categories_by_their_seed():
+    stats = {}
+    apply_event(stats, datetime(2024, 1, 1, 12), [entry(category_id="legacy-uuid", category_seed="predefined-social")])
+    assert list(stats["categories"]) == ["social"]
+    assert stats["week"]["category_minutes"] == {"social": 30}
+
+
+def test_apply_event_tracks_category_streaks_and_breaks():
+    stats = {}
+    for day in (1, 2, 3, 12):
+        apply_event(stats, datetime(2024, 1, day, 12), [entry()])
+    mind = stats["categories"]["mind"]
+    assert (mind["streak"], mind["longest_streak"]) == (1, 3)
+    assert stats["longest_break"] == 8
+
+
+def test_apply_event_day_and_week_only_move_forward():
+    stats = {}
+    apply_event(stats, datetime(2024, 1, 10, 12), [entry(minutes=10)])
+    apply_event(stats, datetime(2024, 1, 2, 12), [entry(minutes=20, difficulty="easy")])
+    assert stats["day"]["skill_minutes"] == {"s1": 10}
+    assert stats["week"]["key"] == week_key(datetime(2024, 1, 10))
+    assert stats["week"]["difficulties"] == ["medium"]
+    # Backdated time still counts towards the totals
+    assert stats["categories"]["mind"]["minutes"] == 30
+    assert stats["difficulty_minutes"] == {"medium": 10, "easy": 20}
+
+
+def test_apply_event_tracks_weekend_days_and_skill_types():
+    stats = {}
+    apply_event(stats, datetime(2024, 1, 6, 12), [entry(name="Morning Meditation")])
+    apply_event(stats, datetime(2024, 1, 7, 12), [entry(name="Guitar")])
+    assert sorted(stats["week"]["weekend_days"]) == [5, 6]
+    assert stats["skill_type_minutes"] == {"meditation": 30}
+
+
+def test_evaluate_returns_newly_held_rules_once():
+    stats = {}
+    changed = apply_event(stats, datetime(2024, 1, 1, 3), [entry(minutes=300)])
+    due = {rule.achievement_id for rule in evaluate(stats, {}, changed, set())}
+    assert {"night-owl", "early-bird", "marathon-session"} <= due
+    assert "night-owl" not in {rule.achievement_id for rule in evaluate(stats, {}, changed, {"night-owl"})}
@@ -0,0 +1,117 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from importer import ImportRowError, TimeLogImporter, iter_lines, iter_records, parse_logged_at
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+
+async def stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def collect(async_iterator):
+    async def run():
+        return [item async for item in async_iterator]
+    return asyncio.run(run())
+
+
+def make_importer():
+    importer = TimeLogImporter(None, "u1")
+    importer.now = NOW
+    importer.skills_by_name = {"guitar": {"_id": "s1", "name": "Guitar", "category_id": "predefined-creativity", "difficulty": "medium"}}
+    return importer
+
+
+def test_parse_logged_at_defaults_to_now():
+    assert parse_logged_at(None, NOW) == NOW
+    assert parse_logged_at("", NOW) == NOW
+
+
+def test_parse_logged_at_converts_to_naive_utc():
+    assert parse_logged_at("2024-05-01T18:30:00", NOW) == datetime(2024, 5, 1, 18, 30)
+    assert parse_logged_at("2024-05-01T18:30:00Z", NOW) == datetime(2024, 5, 1, 18, 30)
+    assert parse_logged_at("2024-05-01T20:30:00+02:00", NOW) == datetime(2024, 5, 1, 18, 30)
+
+
+def test_parse_logged_at_rejects_invalid_and_future_times():
+    with pytest.raises(ImportRowError):
+        parse_logged_at("yesterday", NOW)
+    with pytest.raises(ImportRowError):
+        parse_logged_at((NOW + timedelta(hours=1)).isoformat(), NOW)
+    assert parse_logged_at((NOW + timedelta(minutes=1)).isoformat(), NOW) == NOW + timedelta(minutes=1)
+
+
+def test_iter_lines_splits_across_chunks():
+    lines = collect(iter_lines(stream(b"skill,min", b"utes\r\nGuitar,", b"30\n\nGuitar,45")))
+    assert lines == ["skill,minutes", "Guitar,30", "", "Guitar,45"]
+
+
+def test_iter_lines_rejects_invalid_utf8():
+    with pytest.raises(UnicodeDecodeError):
+        collect(iter_lines(stream(b"Guitar,30\n\xff\n")))
+
+
+def test_iter_records_reads_csv_with_a_header():
+    lines = stream(" Skill , Minutes ,note", "Guitar,30,\"scales, arpeggios\"", "", "Piano,15,")
+    assert collect(iter_records(lines, "csv")) == [
+        {"skill": "Guitar", "minutes": "30", "note": "scales, arpeggios"},
+        {"skill": "Piano", "minutes": "15", "note": ""}
+    ]
+
+
+def test_iter_records_flags_invalid_ndjson_lines():
+    lines = stream('{"skill": "Guitar", "minutes": 30}', "[1, 2]", "{bad")
+    records = collect(iter_records(lines, "ndjson"))
+    assert records[0] == {"skill": "Guitar", "minutes": 30}
+    assert records[1] == {"_error": "expected a JSON object"}
+    assert records[2]["_error"].startswith("invalid JSON")
+
+
+def test_parse_record_builds_the_time_log():
+    doc = make_importer().parse_record({"skill": " GUITAR ", "minutes": "45", "logged_at": "2024-05-01T18:30:00Z", "note": "scales"})
+    assert doc["skill_id"] == "s1"
+    assert doc["user_id"] == "u1"
+    assert doc["minutes"] == 45
+    assert doc["xp_earned"] == 90
+    assert doc["note"] == "scales"
+    assert doc["logged_at"] == datetime(2024, 5, 1, 18, 30)
+
+
+def test_parse_record_defaults_note_and_logged_at():
+    doc = make_importer().parse_record({"skill": "Guitar", "minutes": 10, "note": ""})
+    assert doc["note"] is None
+    assert doc["logged_at"] == NOW
+
+
+@pytest.mark.parametrize("record, message", [
+    ({"_error": "expected a JSON object"}, "expected a JSON object"),
+    ({"skill": "Drums", "minutes": "10"}, "unknown skill"),
+    ({"skill": "", "minutes": "10"}, "unknown skill"),
+    ({"skill": "Guitar", "minutes": "ten"}, "invalid minutes"),
+    ({"skill": "Guitar"}, "invalid minutes"),
+    ({"skill": "Guitar", "minutes": "0"}, "between 1 and 1440"),
+    ({"skill": "Guitar", "minutes": "1441"}, "between 1 and 1440"),
+    ({"skill": "Guitar", "minutes": 10, "note": 5}, "note must be a string"),
+    ({"skill": "Guitar", "minutes": 10, "note": ["a"]}, "note must be a string"),
+    ({"skill": "Guitar", "minutes": 10, "note": "x" * 1001}, "at most 1000 characters"),
+])
+def test_parse_record_rejects_invalid_rows(record, message):
+    with pytest.raises(ImportRowError, match=message):
+        make_importer().parse_record(record)
+
+
+def test_accumulate_groups_rows_by_skill_day_and_hour():
+    importer = make_importer()
+    for logged_at in ("2024-05-01T18:10:00", "2024-05-01T18:50:00", "2024-05-31T09:00:00"):
+        importer._accumulate(importer.parse_record({"skill": "Guitar", "minutes": "30", "logged_at": logged_at}))
+    assert importer.skill_totals["s1"]["total_time_minutes"] == 90
+    assert importer.skill_totals["s1"]["last_logged_at"] == datetime(2024, 5, 31, 9)
+    assert importer.xp_by_day == {datetime(2024, 5, 1): 120, datetime(2024, 5, 31): 60}
+    assert sorted(importer.hourly_activity) == [datetime(2024, 5, 1, 18), datetime(2024, 5, 31, 9)]
+    assert importer.hourly_activity[datetime(2024, 5, 1, 18)]["logs"] == 2
+    # Only the week of NOW counts towards quests
+    assert list(importer.recent_activity) == [datetime(2024, 5, 31).date()]
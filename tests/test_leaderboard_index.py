@@ -0,0 +1,119 @@
+import asyncio
+
+from leaderboard_index import LeaderboardIndex
+
+
+def make_index(scores, top_size=100):
+    index = LeaderboardIndex(top_size=top_size)
+    for user_id, total_xp in scores.items():
+        index.set(user_id, total_xp)
+    return index
+
+
+SCORES = {"a": 500, "b": 300, "c": 300, "d": 100, "e": 0}
+
+
+def test_top_orders_by_xp_then_user_id():
+    assert make_index(SCORES).top(3) == [("a", 500), ("b", 300), ("c", 300)]
+
+
+def test_position_counts_only_strictly_higher_xp():
+    index = make_index(SCORES)
+    assert [index.position(user_id) for user_id in "abcde"] == [1, 2, 2, 4, 5]
+    assert index.position("missing") is None
+
+
+def test_position_for_xp_of_a_score_nobody_has():
+    index = make_index(SCORES)
+    assert index.position_for_xp(1000) == 1
+    assert index.position_for_xp(200) == 4
+    assert index.position_for_xp(0) == 5
+
+
+def test_after_returns_the_entries_ranked_below():
+    index = make_index(SCORES)
+    assert index.after(500, "a", 2) == (1, [("b", 300), ("c", 300)])
+    assert index.after(300, "b", 10) == (2, [("c", 300), ("d", 100), ("e", 0)])
+    assert index.after(0, "e", 10) == (5, [])
+
+
+def test_before_returns_the_entries_ranked_above():
+    index = make_index(SCORES)
+    assert index.before(100, "d", 2) == (1, [("b", 300), ("c", 300)])
+    assert index.before(300, "c", 10) == (0, [("a", 500), ("b", 300)])
+    assert index.before(500, "a", 10) == (0, [])
+
+
+def test_after_and_before_accept_a_cursor_of_a_user_who_moved():
+    index = make_index(SCORES)
+    # A cursor from a page read before "b" gained XP still splits the board at its old place
+    index.set("b", 1000)
+    assert index.after(300, "b", 2) == (2, [("c", 300), ("d", 100)])
+    assert index.before(300, "b", 2) == (0, [("b", 1000), ("a", 500)])
+
+
+def test_observe_never_lowers_a_score():
+    index = make_index({"a": 100})
+    index.observe("a", 50)
+    assert index.xp("a") == 100
+    index.observe("a", 150)
+    assert index.xp("a") == 150
+
+
+def test_remove_drops_the_user():
+    index = make_index(SCORES)
+    index.remove("a")
+    assert len(index) == 4
+    assert index.position("b") == 1
+    assert index.position("a") is None
+
+
+def test_top_version_only_moves_for_changes_within_the_top():
+    index = make_index(SCORES, top_size=2)
+    version = index.top_version
+    index.set("e", 50)
+    assert index.top_version == version
+    index.set("e", 400)
+    assert index.top_version > version
+
+
+class FakeCursor:
+    def __init__(self, docs, during=None):
+        self.docs = docs
+        self.during = during
+
+    async def __aiter__(self):
+        for number, doc in enumerate(self.docs):
+            if number == 0 and self.during:
+                self.during()
+            yield doc
+
+
+class FakeDb(dict):
+    def __init__(self, docs, during=None):
+        super().__init__(users=self)
+        self.cursor = FakeCursor(docs, during)
+
+    def find(self, query, projection):
+        return self.cursor
+
+
+def test_reconcile_repairs_drift():
+    index = make_index({"a": 100, "b": 200, "gone": 50})
+    report = asyncio.run(index.reconcile(FakeDb([{"_id": "a", "total_xp": 150}, {"_id": "b", "total_xp": 200}])))
+    assert (report["checked"], report["fixed"], report["removed"]) == (2, 1, 1)
+    assert index.xp("a") == 150
+    assert index.xp("gone") is None
+
+
+def test_reconcile_leaves_users_written_while_it_runs():
+    index = make_index({"a": 100, "b": 200})
+
+    def concurrent_writes():
+        # Logged after the cursor batch with "a" was read, and a registration the cursor never sees
+        index.observe("a", 300)
+        index.set("new", 0)
+
+    asyncio.run(index.reconcile(FakeDb([{"_id": "a", "total_xp": 100}, {"_id": "b", "total_xp": 200}], concurrent_writes)))
+    assert index.xp("a") == 300
+    assert index.xp("new") == 0
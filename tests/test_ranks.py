@@ -0,0 +1,22 @@
+import numpy as np
+
+from ranks import RANK_LADDER, RANK_THRESHOLDS, bulk_rank_indices, rank_index
+
+
+def test_bulk_rank_indices_matches_rank_index():
+    xp = [0, 1, 999, 1000, 1999, 2000, 59999, 60000, 199999, 200000, 10 ** 9]
+    assert bulk_rank_indices(np.array(xp)).tolist() == [rank_index(value) for value in xp]
+
+
+def test_bulk_rank_indices_at_every_threshold():
+    thresholds = np.array(RANK_THRESHOLDS)
+    assert bulk_rank_indices(thresholds).tolist() == list(range(len(RANK_LADDER)))
+    assert bulk_rank_indices(thresholds[1:] - 1).tolist() == list(range(len(RANK_LADDER) - 1))
+
+
+def test_bulk_rank_indices_clips_negative_xp_to_the_first_rank():
+    assert bulk_rank_indices(np.array([-1, -5000])).tolist() == [0, 0]
+
+
+def test_bulk_rank_indices_of_nothing():
+    assert bulk_rank_indices(np.array([], dtype=np.int64)).tolist() == []
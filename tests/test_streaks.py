@@ -0,0 +1,74 @@
+from datetime import date, datetime
+
+from bson import Int64
+
+from streaks import DAYS_PER_WORD, EMPTY_STREAK, StreakState, advance, bitmap_update, day_number, from_bitmap
+
+
+def bitmap_of(days):
+    words = {}
+    for day in days:
+        word = str(day // DAYS_PER_WORD)
+        words[word] = words.get(word, 0) | 1 << (day % DAYS_PER_WORD)
+    return words
+
+
+def test_day_number_counts_from_the_epoch():
+    assert day_number(date(1970, 1, 1)) == 0
+    assert day_number(datetime(1970, 1, 2, 23, 59)) == 1
+
+
+def test_advance_starts_a_streak():
+    assert advance(EMPTY_STREAK, 100) == StreakState(100, 1, 1)
+
+
+def test_advance_extends_on_the_next_day():
+    assert advance(StreakState(100, 3, 5), 101) == StreakState(101, 4, 5)
+    assert advance(StreakState(100, 5, 5), 101) == StreakState(101, 6, 6)
+
+
+def test_advance_resets_after_a_gap_but_keeps_the_longest():
+    assert advance(StreakState(100, 4, 4), 102) == StreakState(102, 1, 4)
+
+
+def test_advance_ignores_the_same_or_an_earlier_day():
+    assert advance(StreakState(100, 2, 2), 100) is None
+    assert advance(StreakState(100, 2, 2), 90) is None
+
+
+def test_from_bitmap_of_nothing_is_empty():
+    assert from_bitmap({}) == EMPTY_STREAK
+    assert from_bitmap({"3": 0}) == EMPTY_STREAK
+
+
+def test_from_bitmap_finds_current_and_longest_runs():
+    days = [10, 11, 12, 13, 20, 21]
+    assert from_bitmap(bitmap_of(days)) == StreakState(21, 2, 4)
+
+
+def test_from_bitmap_runs_across_word_boundaries():
+    days = list(range(DAYS_PER_WORD - 2, DAYS_PER_WORD + 3))
+    assert from_bitmap(bitmap_of(days)) == StreakState(DAYS_PER_WORD + 2, 5, 5)
+
+
+def test_from_bitmap_matches_advance_for_in_order_days():
+    days = [5, 6, 8, 9, 10, 40, 41]
+    state = EMPTY_STREAK
+    for day in days:
+        state = advance(state, day) or state
+    assert from_bitmap(bitmap_of(days)) == state
+
+
+def test_bitmap_update_sets_user_and_skill_bits():
+    update = bitmap_update([0, 1, DAYS_PER_WORD + 31], ["s1", "s2"])["$bit"]
+    assert update["days.0"] == {"or": Int64(0b11)}
+    assert update["days.1"] == {"or": Int64(1 << 31)}
+    assert update["skills.s1.0"] == update["skills.s2.0"] == {"or": Int64(0b11)}
+    assert update["skills.s2.1"] == {"or": Int64(1 << 31)}
+    assert all(isinstance(value["or"], Int64) for value in update.values())
+
+
+def test_bitmap_update_round_trips_through_from_bitmap():
+    days = [700, 701, 702, 731, 732]
+    words = {key[len("days."):]: value["or"] for key, value in bitmap_update(days)["$bit"].items()}
+    assert from_bitmap(words) == StreakState(732, 2, 3)